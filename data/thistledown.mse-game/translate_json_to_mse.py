@@ -1,18 +1,11 @@
-print("Script for converting json files of card data into MSE script, which allows you")
-print("to maintain card data in a collaborative area (like Google Sheets) but still")
-print("quickly use MSE for formatting and printing the cards.")
-print()
-print("Inputs:")
-print("  - one or more files with the .json extension in this folder")
-print("Outputs:")
-print("  - file named 'cards_to_import' to this folder, which can be used natively")
-print("    in MSE from Cards > Add Multiple Cards > Update cards from autogen")
-print()
-
+import argparse
+import hashlib
 import json
+import os
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 from pathlib import Path
-from typing import Any, Dict, List, Optional, TextIO
+from typing import Any, Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
 
 
 def _parse_datetime_if_str(o: Any) -> datetime:
@@ -133,6 +126,28 @@ class Set:
 
 _legal_tagnames = ["name", "sciencename", "animal_type", "mass_g"]
 
+_banner = """Script for converting json files of card data into MSE script, which allows you
+to maintain card data in a collaborative area (like Google Sheets) but still
+quickly use MSE for formatting and printing the cards.
+
+Inputs:
+  - one or more files with the .json extension in this folder
+Outputs:
+  - file named 'cards_to_import' to this folder, which can be used natively
+    in MSE from Cards > Add Multiple Cards > Update cards from autogen
+  - file named 'cards_to_import.manifest' remembering what was exported, so that
+    the next run only exports cards that were added or changed since (use --full
+    to export everything again). Cards removed from the json stay in it until a
+    --deletions run has exported their removal. If nothing changed, an existing
+    cards_to_import is left as it is rather than emptied, in case it hasn't been
+    imported yet. The manifest is updated as soon as cards_to_import is written;
+    with --no-update it isn't, so the same cards are exported again next time:
+    run once more without it after the import into MSE has worked.
+
+Can also be imported, see ingest() (or ingest_file() and merge_ingested()),
+export() and write_import_list().
+"""
+
 
 def _mseify_values(o: Any) -> str:
     """Given value, escapes it appropriately for an MSE script."""
@@ -148,35 +163,277 @@ def _extract_legal_tags(d: Dict[str, Any]) -> str:
     return ", ".join([f"{k}: {v}" for k, v in legal_data.items()])
 
 
-# Main script:
+_JSON_CHUNK_SIZE = 1 << 16  # characters read at a time when streaming json exports
+_BATCH_SIZE = 1000  # records validated and filtered together
+_BAD_JSON_MSG = "Expects a non-empty list of dicts of {tag_name : value}, e.g. {'name', 'Carolina Wren'}"
+
+_whitespace = " \t\n\r"
+
+
+def _iter_json_records(fp: TextIO, chunk_size: int = _JSON_CHUNK_SIZE) -> Iterator[Any]:
+    """Streams the elements of a top-level json array one at a time, holding only about
+    one chunk plus one record in memory instead of the whole export. Raises
+    json.JSONDecodeError for what json.load would reject, such as missing or extra
+    commas between elements or anything after the closing bracket (error positions
+    count from the start of the chunk being read)."""
+    decoder = json.JSONDecoder()
+    buf = ""
+    pos = 0
+    eof = False
+    opened = False
+    expecting = "first"  # "first" element or "]", a "separator", or a "value"
+
+    def more() -> bool:
+        nonlocal buf, pos, eof
+        chunk = fp.read(chunk_size)
+        if chunk == "":
+            eof = True
+            return False
+        buf = buf[pos:] + chunk
+        pos = 0
+        return True
+
+    def skip_whitespace() -> None:
+        nonlocal pos
+        while True:
+            while pos < len(buf) and buf[pos] in _whitespace:
+                pos += 1
+            if pos < len(buf) or not more():
+                return
+
+    while True:
+        skip_whitespace()
+        if pos >= len(buf):
+            if opened:
+                raise json.JSONDecodeError("Expecting ']'", buf, pos)
+            raise ValueError(_BAD_JSON_MSG)
+        c = buf[pos]
+        if not opened:
+            if c != "[":
+                raise ValueError(_BAD_JSON_MSG)
+            opened = True
+            pos += 1
+            continue
+        if expecting == "separator":
+            if c == ",":
+                expecting = "value"
+                pos += 1
+                continue
+            if c != "]":
+                raise json.JSONDecodeError("Expecting ',' delimiter", buf, pos)
+        if c == "]":
+            if expecting == "value":
+                raise json.JSONDecodeError("Expecting value", buf, pos)
+            pos += 1
+            skip_whitespace()
+            if pos < len(buf):
+                raise json.JSONDecodeError("Extra data", buf, pos)
+            return
+        if c == ",":
+            raise json.JSONDecodeError("Expecting value", buf, pos)
+        while True:
+            try:
+                record, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                # Most likely the record runs past the end of what we've read so far
+                if eof or not more():
+                    raise
+                continue
+            if end == len(buf) and not eof and more():
+                continue  # a number could still be going, e.g. "12" of "1234"
+            break
+        pos = end
+        expecting = "separator"
+        yield record
 
-cards = []  # type: List[Dict[str, Any]]
-cardcards = [] # type: List[Card]
-jsons = Path.cwd().glob("*.json")
 
-for json_path in jsons:
+def _legal_tags(d: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: v for k, v in d.items() if k in _legal_tagnames}
+
+
+def _filter_batch(batch: List[Any]) -> List[Tuple[Optional[str], Dict[str, Any]]]:
+    """Validates a batch of records and keeps only their legal tags. Returns
+    (card name, legal tags) pairs, dropping records with no legal tags at all."""
+    filtered = []
+    for carddata in batch:
+        if not isinstance(carddata, dict):
+            raise ValueError(_BAD_JSON_MSG)
+        legal = _legal_tags(carddata)
+        if len(legal) > 0:
+            filtered.append((legal.get("name"), legal))
+    return filtered
+
+
+def ingest_file(
+    json_path: Path, batch_size: int = _BATCH_SIZE
+) -> List[Tuple[Optional[str], Dict[str, Any]]]:
+    """Streams one json export and returns its cards' legal tags, in file order, as
+    (name, tags) pairs; merge_ingested combines several files' worth. Reading files
+    one at a time like this lets a caller re-read only the file that changed."""
+    filtered = []  # type: List[Tuple[Optional[str], Dict[str, Any]]]
+    batch = []  # type: List[Any]
+    n_records = 0
     with open(json_path, "rt") as fp:
-        data = json.load(fp)
-        if (
-            not isinstance(data, list)
-            or len(data) == 0
-            or not isinstance(data[0], dict)
-        ):
-            raise ValueError(
-                "Expects a non-empty list of dicts of {tag_name : value}, e.g. {'name', 'Carolina Wren'}"
-            )
-        for carddata in data:
-            cards.append(carddata)
-            cardcards.append(Card(**carddata))
-
-with open("cards_to_import", "wt") as out:
-    # First line is different, opens brackets
-    out.write(f"import_list := [ new_card([{_extract_legal_tags(cards[0])}])\n")
-    if len(cards) > 1:
-        for card in cards[1:]:
-            tag_str = _extract_legal_tags(card)
-            if len(tag_str) == 0:
-                continue  # don't write blank cards
-            out.write(f", new_card([{tag_str}])\n")
-    # Close brackets
-    out.write("]")
+        for record in _iter_json_records(fp):
+            batch.append(record)
+            n_records += 1
+            if len(batch) >= batch_size:
+                filtered.extend(_filter_batch(batch))
+                batch = []
+    filtered.extend(_filter_batch(batch))
+    if n_records == 0:
+        raise ValueError(f"{_BAD_JSON_MSG} ({json_path})")
+    return filtered
+
+
+def ingest(
+    json_paths: Iterable[Path], workers: Optional[int] = None, batch_size: int = _BATCH_SIZE
+) -> List[Dict[str, Any]]:
+    """Reads json exports in parallel (one process per file, up to workers) and merges
+    their cards by name: a name seen again in a later file (files are taken in sorted
+    order) or later in the same file updates the tags of the first one in place.
+    Cards without a name are kept as they are. Returns each card's legal tags."""
+    paths = sorted(Path(p) for p in json_paths)
+    if workers is None:
+        workers = min(len(paths), os.cpu_count() or 1)
+    if workers <= 1 or len(paths) <= 1:
+        results = [ingest_file(p, batch_size) for p in paths]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(ingest_file, paths, [batch_size] * len(paths)))
+
+    return merge_ingested(results)
+
+
+def merge_ingested(results: Iterable[List[Tuple[Optional[str], Dict[str, Any]]]]) -> List[Dict[str, Any]]:
+    """Merges what ingest_file returned for each file, in order, the way ingest does."""
+    merged = {}  # type: Dict[Any, Dict[str, Any]]
+    for filtered in results:
+        for name, legal in filtered:
+            key = name if name is not None else object()  # nameless cards never merge
+            if key in merged:
+                merged[key].update(legal)
+            else:
+                merged[key] = dict(legal)
+    return list(merged.values())
+
+
+_MANIFEST_NAME = "cards_to_import.manifest"
+
+
+def _content_hash(card: Dict[str, Any]) -> str:
+    """Stable hash of a card's legal tags, independent of tag order."""
+    canonical = json.dumps(card, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+
+
+def load_manifest(path: Path) -> Dict[str, str]:
+    """Reads a manifest of {card name: content hash}; a missing file is empty."""
+    try:
+        with open(path, "rt") as fp:
+            return json.load(fp)
+    except FileNotFoundError:
+        return {}
+
+
+def save_manifest(path: Path, manifest: Dict[str, str]) -> None:
+    temp = Path(f"{path}.tmp")
+    with open(temp, "wt") as fp:
+        json.dump(manifest, fp, indent=0, sort_keys=True)
+    os.replace(temp, path)
+
+
+def changes_since(
+    cards: Iterable[Dict[str, Any]], manifest: Dict[str, str]
+) -> Tuple[List[Dict[str, Any]], List[str], Dict[str, str]]:
+    """Compares cards against a manifest from an earlier run. Returns the cards that
+    are new or whose tags changed (cards without a name always count as changed), the
+    names in the manifest that no longer have a card, and the manifest for cards
+    (which doesn't have those names)."""
+    changed = []
+    new_manifest = {}  # type: Dict[str, str]
+    for card in cards:
+        name = card.get("name")
+        if name is None:
+            changed.append(card)
+            continue
+        h = _content_hash(card)
+        new_manifest[str(name)] = h
+        if manifest.get(str(name)) != h:
+            changed.append(card)
+    removed = [name for name in manifest if name not in new_manifest]
+    return (changed, removed, new_manifest)
+
+
+def write_import_list(
+    cards: Iterable[Dict[str, Any]], out: TextIO, removed: Optional[List[str]] = None
+) -> None:
+    """Writes cards (dicts of legal tags) as the MSE script cards_to_import, which
+    defines import_list. If removed is given, the script also defines removed_cards,
+    a list of the names of cards that were deleted from the spreadsheets. The whole
+    script is built up and written in one go."""
+    entries = [f"new_card([{_extract_legal_tags(card)}])\n" for card in cards]
+    # First entry is different, follows the opening bracket
+    script = "import_list := [ " + ", ".join(entries) + "]"
+    if removed is not None:
+        script += "\nremoved_cards := [" + ", ".join(_mseify_values(n) for n in removed) + "]"
+    out.write(script)
+
+
+def export(
+    cards: List[Dict[str, Any]],
+    directory: Path = Path("."),
+    full: bool = False,
+    deletions: bool = False,
+    manifest: Optional[Dict[str, str]] = None,
+    update: bool = True,
+) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """Writes the cards that changed since the manifest in directory (all of them if
+    full) to directory/cards_to_import and, if update, updates the manifest. Removed
+    cards are found against the manifest even if full, and stay in it until they are
+    exported with deletions. A manifest
+    passed in is compared against instead of the saved one, and cards_to_import is
+    then always written; against the saved one, an existing cards_to_import is kept
+    when there is nothing to export, since it may not have been imported yet.
+    Returns (changed, removed)."""
+    directory = Path(directory)
+    out_path = directory / "cards_to_import"
+    saved = manifest is None
+    if manifest is None:
+        manifest = load_manifest(directory / _MANIFEST_NAME)
+    changed, removed, new_manifest = changes_since(cards, manifest)
+    if full:
+        changed = list(cards)
+    if not deletions:
+        # Not exported yet, so the next --deletions run should still find them
+        new_manifest.update((name, manifest[name]) for name in removed)
+    if changed or (deletions and removed) or not (saved and out_path.exists()):
+        with open(out_path, "wt") as out:
+            write_import_list(changed, out, removed if deletions else None)
+    if update:
+        save_manifest(directory / _MANIFEST_NAME, new_manifest)
+    return (changed, removed)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Converts *.json card data in this folder to cards_to_import.")
+    parser.add_argument("--full", action="store_true", help="export every card, not just changed ones")
+    parser.add_argument("--deletions", action="store_true", help="also list cards removed since the last run")
+    parser.add_argument(
+        "--no-update", action="store_true", help="leave the manifest alone, to update it after importing"
+    )
+    args = parser.parse_args(argv)
+
+    print(_banner.rstrip())
+    print()
+    cards = ingest(Path.cwd().glob("*.json"))
+    existed = Path("cards_to_import").exists()
+    changed, removed = export(cards, full=args.full, deletions=args.deletions, update=not args.no_update)
+    print(f"Exported {len(changed)} new or changed of {len(cards)} cards", end="")
+    print(f", {len(removed)} removed" if args.deletions else "")
+    if existed and not changed and not (args.deletions and removed):
+        print("Nothing new, so cards_to_import was left as it was")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""Compares the memory taken by a set loaded with plain Cards against the same set
+loaded with CompactCards (Set.from_setfile(..., compact=True)).
+
+Usage: python benchmarks/bench_card_memory.py [number of cards]
+"""
+from pathlib import Path
+import gc
+import io
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from mseutils import Set  # noqa: E402
+from synthetic import synthetic_setfile  # noqa: E402
+
+
+def measure(text: str, compact: bool):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    s = Set.from_setfile(io.StringIO(text), compact=compact, cache=False)
+    elapsed = time.perf_counter() - start
+    # The retained source text is the same either way; count only the parsed data
+    s._source = None
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return s, current, elapsed
+
+
+def main() -> None:
+    n_cards = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    text = synthetic_setfile(n_cards)
+    results = {}
+    for compact in (False, True):
+        s, mem, elapsed = measure(text, compact)
+        results[compact] = mem
+        label = "CompactCard" if compact else "Card"
+        print(
+            f"{label:>11}: {len(s.cards)} cards, {mem / 2**20:8.1f} MiB"
+            f" ({mem / len(s.cards):6.0f} B/card), loaded in {elapsed:.2f} s"
+        )
+        del s
+    print(f"CompactCard uses {results[True] / results[False]:.0%} of the memory of Card")
+
+
+if __name__ == "__main__":
+    main()
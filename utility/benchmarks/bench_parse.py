@@ -0,0 +1,235 @@
+"""Throughput and peak memory of loading and saving sets of 1k to 100k cards.
+
+Each benchmark is timed (best of --repeat runs) and then run once more under
+tracemalloc for its peak memory. Results go to a JSON file, and --compare prints
+how they changed against an earlier one, e.g.:
+
+    python benchmarks/bench_parse.py -o before.json
+    (change things)
+    python benchmarks/bench_parse.py -o after.json --compare before.json
+
+Usage: python benchmarks/bench_parse.py [--sizes 1000 10000 100000] [--repeat 3]
+    [--only from_setfile ...] [-o results.json] [--compare old.json]
+
+Without -o, results go to benchmarks/bench_parse.json, which git ignores.
+"""
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+from zipfile import ZipFile, ZIP_DEFLATED
+import argparse
+import datetime
+import gc
+import io
+import json
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from mseutils import Card, Set  # noqa: E402
+from synthetic import synthetic_cardfile, synthetic_setfile  # noqa: E402
+
+
+_DEFAULT_SIZES = [1000, 10000, 100000]
+# Kept out of git (see .gitignore) wherever the benchmark is run from
+_DEFAULT_OUTPUT = Path(__file__).parent / "bench_parse.json"
+_STYLES = 30
+_STYLED_EVERY = 10
+
+
+class _Case:
+    """Input for one size: the setfile text, and the same set zipped up."""
+
+    def __init__(self, n_cards: int, workdir: Path) -> None:
+        self.n_cards = n_cards
+        self.text = synthetic_setfile(n_cards, styles=_STYLES, styled_every=_STYLED_EVERY)
+        self.nbytes = len(self.text.encode("utf-8"))
+        self.cardfile = synthetic_cardfile(n_cards)
+        self.package = workdir / f"synthetic-{n_cards}.mse-set"
+        with ZipFile(self.package, "w", compression=ZIP_DEFLATED) as zip_ref:
+            zip_ref.writestr("set", self.text)
+            zip_ref.writestr("art1", b"\x89PNG" + bytes(4096))
+        self.loaded = Set.from_setfile(io.StringIO(self.text), cache=False)
+
+
+def _from_setfile(case: _Case) -> Callable[[], Any]:
+    return lambda: Set.from_setfile(io.StringIO(case.text), cache=False)
+
+
+def _to_setfile(case: _Case) -> Callable[[], Any]:
+    # Nothing changed, so this is the verbatim-copy path
+    return lambda: case.loaded.to_setfile(io.StringIO())
+
+
+def _to_setfile_rendered(case: _Case) -> Callable[[], Any]:
+    # A Set without source text has to render every block. Saving makes what was
+    # written the new source, so forget it again before each run.
+    fresh = Set(all_data=dict(case.loaded.all_data))
+
+    def run() -> None:
+        fresh._source = ""
+        fresh._spans = {}
+        fresh.to_setfile(io.StringIO())
+
+    return run
+
+
+def _round_trip(case: _Case) -> Callable[[], Any]:
+    def run() -> None:
+        s = Set.from_setfile(io.StringIO(case.text), cache=False)
+        s.cards[f"Animal {case.n_cards // 2}"].notes = "Edited"
+        s.to_setfile(io.StringIO())
+
+    return run
+
+
+def _card_from_setfile(case: _Case) -> Callable[[], Any]:
+    def run() -> None:
+        ifile = io.StringIO(case.cardfile)
+        end = len(case.cardfile)
+        while ifile.tell() < end:
+            Card.from_setfile(ifile)
+
+    return run
+
+
+def _from_packagefile(case: _Case) -> Callable[[], Any]:
+    return lambda: Set.from_packagefile(case.package, cache=False)
+
+
+BENCHMARKS = {
+    "from_setfile": _from_setfile,
+    "to_setfile": _to_setfile,
+    "to_setfile_rendered": _to_setfile_rendered,
+    "round_trip": _round_trip,
+    "card_from_setfile": _card_from_setfile,
+    "from_packagefile": _from_packagefile,
+}  # type: Dict[str, Callable[[_Case], Callable[[], Any]]]
+
+
+def _time(run: Callable[[], Any], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def _peak_memory(run: Callable[[], Any]) -> int:
+    gc.collect()
+    tracemalloc.start()
+    try:
+        run()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def _check_round_trip(case: _Case) -> None:
+    """A benchmark of wrong output is no use, so make sure it is still right: both
+    the verbatim copy and the rendered output (as to_setfile_rendered writes it)
+    must read back as the same set."""
+    out = io.StringIO()
+    Set.from_setfile(io.StringIO(case.text), cache=False).to_setfile(out)
+    if out.getvalue() != case.text:
+        raise SystemExit(f"Round trip of {case.n_cards} cards doesn't reproduce the input")
+    out = io.StringIO()
+    Set(all_data=dict(case.loaded.all_data)).to_setfile(out)
+    reread = Set.from_setfile(io.StringIO(out.getvalue()), cache=False)
+    if list(reread.all_data) != list(case.loaded.all_data):
+        raise SystemExit(f"Rendering {case.n_cards} cards doesn't keep the blocks")
+    for key, value in case.loaded.all_data.items():
+        again = reread.all_data[key]
+        if not (value.is_identical_to(again) if isinstance(value, Card) else value == again):
+            raise SystemExit(f"Rendering {case.n_cards} cards changes {key!r}")
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=Path(__file__).parent,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(sizes: List[int], names: List[str], repeat: int) -> Dict[str, Any]:
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for n_cards in sizes:
+            case = _Case(n_cards, Path(workdir))
+            _check_round_trip(case)
+            for name in names:
+                run = BENCHMARKS[name](case)
+                seconds = _time(run, repeat)
+                peak = _peak_memory(run)
+                nbytes = len(case.cardfile.encode("utf-8")) if name == "card_from_setfile" else case.nbytes
+                result = {
+                    "benchmark": name,
+                    "n_cards": n_cards,
+                    "bytes": nbytes,
+                    "seconds": seconds,
+                    "cards_per_s": n_cards / seconds,
+                    "mb_per_s": nbytes / 2**20 / seconds,
+                    "peak_mib": peak / 2**20,
+                }
+                results.append(result)
+                print(
+                    f"{name:>20} {n_cards:>7} cards: {seconds:8.3f} s {result['cards_per_s']:>10.0f} cards/s"
+                    f" {result['mb_per_s']:7.1f} MB/s  peak {result['peak_mib']:7.1f} MiB",
+                    flush=True,
+                )
+            del case
+    return {
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "repeat": repeat,
+        "results": results,
+    }
+
+
+def compare(old: Dict[str, Any], new: Dict[str, Any]) -> None:
+    """Prints time and peak memory of new relative to old, for the benchmarks in both."""
+    before = {(r["benchmark"], r["n_cards"]): r for r in old["results"]}
+    print(f"\nCompared to {old.get('commit') or 'previous run'} ({old.get('date')}):")
+    for r in new["results"]:
+        o = before.get((r["benchmark"], r["n_cards"]))
+        if o is None:
+            continue
+        print(
+            f"{r['benchmark']:>20} {r['n_cards']:>7} cards: time x{r['seconds'] / o['seconds']:5.2f},"
+            f" peak memory x{r['peak_mib'] / o['peak_mib']:5.2f}"
+        )
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=_DEFAULT_SIZES, help="numbers of cards")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per benchmark (best is kept)")
+    parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS), default=list(BENCHMARKS))
+    parser.add_argument(
+        "-o", "--output", type=Path, default=_DEFAULT_OUTPUT, help="JSON results file (default: next to this script)"
+    )
+    parser.add_argument("--compare", type=Path, help="earlier JSON results to compare against")
+    args = parser.parse_args(argv)
+
+    report = run_benchmarks(args.sizes, args.only, args.repeat)
+    args.output.write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+    print(f"Results written to {args.output}")
+    if args.compare is not None:
+        compare(json.loads(args.compare.read_text(encoding="utf-8")), report)
+
+
+if __name__ == "__main__":
+    main()
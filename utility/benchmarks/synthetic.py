@@ -0,0 +1,81 @@
+"""Generators for synthetic setfiles of any size, for the benchmarks."""
+from typing import List
+
+
+_ANIMAL_TYPES = ["Bird", "Mammal", "Reptile", "Amphibian", "Insect"]
+
+_STYLE_OPTIONS = [
+    "\t\ttext box mana symbols: magic-mana-small.mse-symbol-font",
+    "\t\toverlay: ",
+]
+
+
+def _header(styles: int) -> List[str]:
+    lines = [
+        "mse_version: 2.0.2",
+        "game: Thistledown",
+        "game_version: 2024-02-07",
+        "stylesheet: animal",
+        "stylesheet_version: 2024-02-07",
+        "set_info:",
+        "\tsymbol: symbol1.mse-symbol",
+        "\tmasterpiece_symbol: ",
+    ]
+    if styles:
+        lines.append("styling:")
+        for j in range(styles):
+            lines.append(f"\tanimal-style-{j}:")
+            lines += _STYLE_OPTIONS
+    return lines
+
+
+def synthetic_setfile(n_cards: int, styles: int = 0, styled_every: int = 0) -> str:
+    """A setfile shaped like a Thistledown set with n_cards cards, each with a
+    multi-line rule text. styles adds a top-level styling block with that many
+    nested stylesheet sections (like complicatedsetfile has), and every
+    styled_every-th card then gets its own nested styling_data block."""
+    lines = _header(styles)
+    for i in range(n_cards):
+        styled = styled_every > 0 and i % styled_every == 0
+        lines += [
+            "card:",
+            f"\thas_styling: {'true' if styled else 'false'}",
+            "\tnotes: ",
+            "\ttime_created: 2025-03-19 17:00:13",
+            "\ttime_modified: 2025-03-19 17:01:47",
+            f"\tname: Animal {i}",
+            f"\tsciencename: Genus species{i}",
+            f"\tanimal_type: {_ANIMAL_TYPES[i % len(_ANIMAL_TYPES)]}",
+            f"\tmass_g: {(i * 37) % 5000}",
+            f"\ttrophic_tier: {i % 4}",
+            "\tart: art1",
+            "\trule text:",
+            "\t\tWhen this animal enters, draw a card.",
+            f"\t\tIt eats {i % 7} kinds of berries.",
+        ]
+        if styled:
+            lines += [
+                "\tstyling_data:",
+                f"\t\tanimal-style-{i % max(styles, 1)}:",
+                "\t\t\tframe: <b>green</b>",
+                f"\t\t\tborder: {i % 3}",
+            ]
+    return "\n".join(lines) + "\n"
+
+
+def synthetic_cardfile(n_cards: int) -> str:
+    """n_cards flat cards (one 'key: value' line per field, as Card.from_setfile
+    reads them) back to back, with nothing else in the file."""
+    lines = []
+    for i in range(n_cards):
+        lines += [
+            "card:",
+            "\thas_styling: false",
+            "\tnotes: ",
+            "\ttime_created: 2025-03-19 17:00:13",
+            "\ttime_modified: 2025-03-19 17:01:47",
+            f"\tname: Animal {i}",
+            f"\tanimal_type: {_ANIMAL_TYPES[i % len(_ANIMAL_TYPES)]}",
+            f"\tmass_g: {(i * 37) % 5000}",
+        ]
+    return "\n".join(lines) + "\n"
@@ -1,2 +1,17 @@
-from .card import Card
+from .card import Card, SetfileWriter
 from .set import Set
+from .compact import CardSchema, CompactCard
+from .package import PackageMember
+from .index import And, Eq, Range
+from .diff import card_fingerprint, diff_sets, merge_sets
+from .cache import ParseCache, default_cache, set_default_cache
+from .stats import ParseStats, add_stats_hook, instrument, remove_stats_hook
+from .offsets import BlockIndex, IndexedSetfile
+from .batch import LoadResult, SetCollection, iter_load, load_many
+from .watch import ImportListWatcher, SetChange, SetWatcher, Watcher
+from .columns import CardTable
+from .history import Revision, SetHistory
+from .assets import AssetStore
+from .spelling import Dictionary, Misspelling, check_records, check_set
+from .fonts import FontFace, FontIndex, style_fonts
+from .packages import Block, Field, Package, PackageFileCache, load_package, load_packages
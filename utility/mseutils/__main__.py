@@ -0,0 +1,35 @@
+"""Command line tools: python -m mseutils COMMAND [ARGS]
+
+Commands:
+    assets  store artwork once across sets and styles (see mseutils.assets)
+    fonts   find the font files that styles need (see mseutils.fonts)
+    history record, list and restore revisions of a .mse-set (see mseutils.history)
+    load    load many .mse-set files in parallel (see mseutils.batch)
+    spellcheck  spellcheck card text with MSE's dictionaries (see mseutils.spelling)
+    watch   keep sets and cards_to_import current as files are saved (see mseutils.watch)
+"""
+from typing import Callable, Dict, List, Optional
+import sys
+from . import assets, batch, fonts, history, spelling, watch
+
+
+COMMANDS = {
+    "assets": assets.main,
+    "fonts": fonts.main,
+    "history": history.main,
+    "load": batch.main,
+    "spellcheck": spelling.main,
+    "watch": watch.main,
+}  # type: Dict[str, Callable[[Optional[List[str]]], int]]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) == 0 or argv[0] not in COMMANDS:
+        print(__doc__, file=sys.stderr)
+        return 2
+    return COMMANDS[argv[0]](argv[1:])
+
+
+if __name__ == "__main__":
+    sys.exit(main())
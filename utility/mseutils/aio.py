@@ -0,0 +1,87 @@
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+import asyncio
+import os
+import threading
+
+
+# Parsing holds the GIL, so more threads than this only add contention; they are
+# there to keep the event loop free, not to load faster.
+_DEFAULT_WORKERS = min(4, os.cpu_count() or 1)
+
+_executor = None  # type: Optional[Executor]
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> Executor:
+    """The executor Set.aload, asave and ato_setfile run on: whatever set_executor
+    was given, else a ThreadPoolExecutor created on first use."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=_DEFAULT_WORKERS, thread_name_prefix="mseutils")
+        return _executor
+
+
+def set_executor(executor: Optional[Executor]) -> None:
+    """Replaces the executor (None goes back to the default one). The old executor
+    isn't shut down. A ProcessPoolExecutor keeps parsing from competing with the
+    event loop for the GIL, but only suits aload: a set saved in another process
+    wouldn't see its saved state afterwards."""
+    global _executor
+    with _executor_lock:
+        _executor = executor
+
+
+def shutdown_executor(wait: bool = True) -> None:
+    """Shuts down the current executor, e.g. when the service stops."""
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=wait)
+
+
+async def _run(func: Callable[[], Any]) -> Any:
+    """Runs func on the executor. Cancelling the caller only stops func if it
+    hasn't started yet; once running it finishes, and its result is dropped."""
+    return await asyncio.get_running_loop().run_in_executor(get_executor(), func)
+
+
+class _InFlight:
+    __slots__ = ("future", "waiters")
+
+    def __init__(self, future: "asyncio.Future[Any]") -> None:
+        self.future = future
+        self.waiters = 0
+
+
+# Keyed by event loop and call, since futures belong to one loop
+_in_flight = {}  # type: Dict[Tuple[asyncio.AbstractEventLoop, Hashable], _InFlight]
+
+
+async def _shared(key: Hashable, func: Callable[[], Any]) -> Any:
+    """Runs func on the executor, unless a call under the same key is already
+    running, in which case this waits for that one's result instead; everyone
+    waiting gets the same object back (or the same exception). Cancelling one
+    waiter leaves the call running for the others; it is only cancelled once
+    nobody is waiting for it anymore."""
+    loop = asyncio.get_running_loop()
+    k = (loop, key)
+    entry = _in_flight.get(k)
+    if entry is None:
+        entry = _InFlight(loop.run_in_executor(get_executor(), func))
+        _in_flight[k] = entry
+
+        def forget(_: Any, entry: _InFlight = entry) -> None:
+            if _in_flight.get(k) is entry:
+                del _in_flight[k]
+
+        entry.future.add_done_callback(forget)
+    entry.waiters += 1
+    try:
+        return await asyncio.shield(entry.future)
+    finally:
+        entry.waiters -= 1
+        if entry.waiters == 0 and not entry.future.done():
+            entry.future.cancel()
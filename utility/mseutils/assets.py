@@ -0,0 +1,247 @@
+"""Content-addressed storage of package members (artwork etc.), shared by sets,
+their histories and styles, so that each distinct image is stored once.
+
+Usage: python -m mseutils assets add STORE PATH [PATH ...]
+       python -m mseutils assets dehydrate STORE SET -o OUT
+       python -m mseutils assets hydrate STORE SLIM -o OUT
+
+add puts the members of .mse-set files (or zipped styles) and the files of style
+folders into STORE. dehydrate writes a slim copy of SET that has its 'set' text
+and an assets.json naming each member's blob instead of the members themselves;
+hydrate turns one back into a real .mse-set, as does loading it with
+AssetStore.load and saving with Set.to_packagefile.
+"""
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+from zipfile import ZipFile, is_zipfile
+import argparse
+import hashlib
+import io
+import json
+import os
+import sys
+import tempfile
+from .package import (
+    SETFILE_MEMBER,
+    PackageMember,
+    _copy_member_raw,
+    _new_member_info,
+    _open_setfile_member,
+    _write_package,
+)
+from .set import Set
+
+
+ASSET_MANIFEST = "assets.json"  # in a dehydrated .mse-set: {member name: digest}
+_BLOB = "blob"  # each object is a zip holding one member, compressed as it was
+
+
+def _digest(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, temp_name = tempfile.mkstemp(prefix=f".{path.name}.", suffix=".tmp", dir=path.parent)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(temp_name, path)
+    except BaseException:
+        if os.path.exists(temp_name):
+            os.unlink(temp_name)
+        raise
+
+
+class AssetStore:
+    """Blobs by the hash of their content, in directory/ab/ab12...: each one a small
+    zip holding the member still compressed as it came, so that exporting copies it
+    into a package without recompressing. Two members are the same asset exactly
+    when their digests match, which answers "did the art change?" without reading
+    either.
+
+        store = AssetStore("/srv/mse-assets")
+        s = store.load("builds/thistle-again.slim.mse-set")
+        s.to_packagefile("export/thistle-again.mse-set")
+    """
+
+    def __init__(self, directory: Union[str, Path]) -> None:
+        self.directory = Path(directory)
+        # Digests of members of packages already hashed, by what identifies them cheaply
+        self._known = {}  # type: Dict[Tuple[str, str, int, int, int], str]
+
+    def path(self, digest: str) -> Path:
+        return self.directory / digest[:2] / digest
+
+    def __contains__(self, digest: str) -> bool:
+        return self.path(digest).exists()
+
+    def __iter__(self) -> Iterator[str]:
+        for sub in sorted(self.directory.glob("??")):
+            for p in sorted(sub.iterdir()):
+                if not p.name.startswith("."):
+                    yield p.name
+
+    def disk_usage(self) -> int:
+        return sum(p.stat().st_size for p in self.directory.rglob("*") if p.is_file())
+
+    def _store(self, digest: str, write: Any) -> None:
+        if digest in self:
+            return
+        buffer = io.BytesIO()
+        with ZipFile(buffer, "w") as zout:
+            write(zout)
+        _write_atomic(self.path(digest), buffer.getvalue())
+
+    def add_member(self, member: PackageMember) -> str:
+        """Stores a member of a package (unless it is there already) and returns its
+        digest. The member is read once to hash it; its compressed bytes are copied."""
+        digest = self.digest(member)
+        if digest not in self:
+
+            def write(zout: ZipFile) -> None:
+                with open(member.filepath, "rb") as raw:
+                    _copy_member_raw(raw, member.info, zout, _BLOB)
+
+            self._store(digest, write)
+        return digest
+
+    def add_bytes(self, data: bytes) -> str:
+        """Stores data (deflated) and returns its digest."""
+        digest = _digest(data)
+        self._store(digest, lambda zout: zout.writestr(_new_member_info(_BLOB), data))
+        return digest
+
+    def add_file(self, path: Union[str, Path]) -> str:
+        with open(path, "rb") as f:
+            return self.add_bytes(f.read())
+
+    def digest(self, member: PackageMember) -> str:
+        """The digest member would be stored under. Handles on the store's own blobs
+        know theirs; other members are hashed once per version of their file."""
+        if member.filepath.parent.parent == self.directory and member.info.filename == _BLOB:
+            return member.filepath.name
+        st = member.filepath.stat()
+        key = (str(member.filepath), member.name, member.crc, member.size, st.st_mtime_ns)
+        digest = self._known.get(key)
+        if digest is None:
+            digest = self._known[key] = _digest(member.read())
+        return digest
+
+    def member(self, digest: str) -> PackageMember:
+        """A lazy handle on the blob; ValueError if the store doesn't have it."""
+        path = self.path(digest)
+        try:
+            with ZipFile(path) as zip_ref:
+                return PackageMember(path, zip_ref.getinfo(_BLOB))
+        except (FileNotFoundError, KeyError):
+            raise ValueError(f"Asset {digest} is missing from {self.directory}")
+
+    def add_members(self, members: Dict[str, Union[PackageMember, bytes]]) -> Dict[str, str]:
+        """Stores every member (as in Set.members); returns {name: digest}."""
+        return {
+            name: self.add_bytes(m) if isinstance(m, bytes) else self.add_member(m)
+            for name, m in members.items()
+        }
+
+    def add_tree(self, directory: Union[str, Path]) -> Dict[str, str]:
+        """Stores every file under directory (a style folder, say), returning
+        {relative path: digest}."""
+        directory = Path(directory)
+        return {
+            p.relative_to(directory).as_posix(): self.add_file(p)
+            for p in sorted(directory.rglob("*"))
+            if p.is_file()
+        }
+
+    def manifest(self, path: Union[str, Path]) -> Dict[str, str]:
+        """{member name: digest} of a package: read from a dehydrated one, or worked
+        out by hashing the members of a real one (nothing is stored)."""
+        path = Path(path)
+        with ZipFile(path) as zip_ref:
+            if ASSET_MANIFEST in zip_ref.NameToInfo:
+                return json.loads(zip_ref.read(ASSET_MANIFEST))
+            return {
+                info.filename: self.digest(PackageMember(path, info))
+                for info in zip_ref.infolist()
+                if info.filename != SETFILE_MEMBER and not info.is_dir()
+            }
+
+    def load(self, path: Union[str, Path], **kwargs: Any) -> Set:
+        """Set.from_packagefile for a dehydrated package, with members that are
+        handles on the store's blobs (a real package loads as usual). Saving the Set
+        with to_packagefile writes a real package."""
+        s = Set.from_packagefile(Path(path), **kwargs)
+        manifest = s.members.pop(ASSET_MANIFEST, None)
+        if manifest is not None:
+            members = {name: self.member(digest) for name, digest in json.loads(manifest.read()).items()}
+            members.update(s.members)
+            s.members = members
+        return s
+
+    def dehydrate(self, path: Union[str, Path], out: Union[str, Path]) -> Dict[str, str]:
+        """Stores the members of the package at path and writes out, a copy with just
+        its 'set' member and an assets.json naming the blobs. Returns that manifest."""
+        path = Path(path)
+        with ZipFile(path) as zip_ref:
+            with _open_setfile_member(zip_ref, path) as ifile:
+                text = ifile.read()
+            members = {
+                info.filename: PackageMember(path, info)
+                for info in zip_ref.infolist()
+                if info.filename != SETFILE_MEMBER and not info.is_dir()
+            }
+        manifest = self.add_members(members)
+        _write_package(Path(out), text, {ASSET_MANIFEST: json.dumps(manifest, indent=0).encode("utf-8")})
+        return manifest
+
+    def hydrate(self, path: Union[str, Path], out: Union[str, Path]) -> None:
+        """Writes out a real package from a dehydrated one at path."""
+        path = Path(path)
+        with ZipFile(path) as zip_ref:
+            with _open_setfile_member(zip_ref, path) as ifile:
+                text = ifile.read()
+            manifest = json.loads(zip_ref.read(ASSET_MANIFEST))
+        _write_package(Path(out), text, {name: self.member(digest) for name, digest in manifest.items()})
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="mseutils assets", description="Content-addressed artwork store.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    add = commands.add_parser("add", help="store the members of packages and the files of folders")
+    add.add_argument("store", type=Path)
+    add.add_argument("paths", type=Path, nargs="+")
+    for name, help in (("dehydrate", "write a copy of a set without its members"), ("hydrate", "write a real set")):
+        command = commands.add_parser(name, help=help)
+        command.add_argument("store", type=Path)
+        command.add_argument("path", type=Path)
+        command.add_argument("-o", "--output", type=Path, required=True)
+    args = parser.parse_args(argv)
+
+    store = AssetStore(args.store)
+    try:
+        if args.command == "add":
+            before = store.disk_usage()
+            seen = 0
+            for path in args.paths:
+                if path.is_dir():
+                    store.add_tree(path)
+                    seen += sum(p.stat().st_size for p in path.rglob("*") if p.is_file())
+                elif is_zipfile(path):
+                    with ZipFile(path) as zip_ref:
+                        infos = [i for i in zip_ref.infolist() if i.filename != SETFILE_MEMBER and not i.is_dir()]
+                    for info in infos:
+                        store.add_member(PackageMember(path, info))
+                    seen += sum(i.compress_size for i in infos)
+                else:
+                    store.add_file(path)
+                    seen += path.stat().st_size
+            print(f"{seen} bytes of assets added, store grew by {store.disk_usage() - before} bytes")
+        elif args.command == "dehydrate":
+            print(f"{len(store.dehydrate(args.path, args.output))} members stored")
+        else:
+            store.hydrate(args.path, args.output)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+    return 0
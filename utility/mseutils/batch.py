@@ -0,0 +1,205 @@
+"""Loading many sets at once, in parallel.
+
+Usage: python -m mseutils load [-j WORKERS] [--compact] [--no-cache]
+    [--find NAME] [--where FIELD=VALUE ...] PATH [PATH ...]
+
+PATHs are .mse-set files or directories searched for them.
+"""
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+import argparse
+import os
+import sys
+import time
+from .cache import ParseCache
+from .card import Card
+from .history import HISTORY_DIR
+from .set import Set
+
+
+class LoadResult:
+    """Outcome of loading one set: either set or error is None."""
+
+    def __init__(
+        self, path: Path, set: Optional[Set] = None, error: Optional[BaseException] = None, seconds: float = 0.0
+    ) -> None:
+        self.path = path
+        self.set = set
+        self.error = error
+        self.seconds = seconds
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    def __repr__(self) -> str:
+        if self.ok:
+            return f"LoadResult({str(self.path)!r}, {len(self.set.cards)} cards)"
+        return f"LoadResult({str(self.path)!r}, error={self.error!r})"
+
+
+class SetCollection:
+    """Sets loaded together, by path, queryable as one. Paths that failed to load are
+    in errors."""
+
+    def __init__(self) -> None:
+        self.sets = {}  # type: Dict[Path, Set]
+        self.errors = {}  # type: Dict[Path, BaseException]
+
+    def add(self, result: LoadResult) -> None:
+        if result.ok:
+            self.sets[result.path] = result.set
+        else:
+            self.errors[result.path] = result.error
+
+    def __len__(self) -> int:
+        return len(self.sets)
+
+    def __iter__(self) -> Iterator[Tuple[Path, Set]]:
+        return iter(self.sets.items())
+
+    def cards(self) -> Iterator[Tuple[Path, Card]]:
+        """(path, card) for every card of every set."""
+        for path, s in self.sets.items():
+            for card in s.cards.values():
+                yield (path, card)
+
+    def find(self, name: str) -> List[Tuple[Path, Card]]:
+        """(path, card) for every set that has a card called name."""
+        return [(path, s.cards[name]) for path, s in self.sets.items() if name in s.cards]
+
+    def create_index(self, field: str, sorted: bool = False) -> None:
+        """Set.create_index on every set."""
+        for s in self.sets.values():
+            s.create_index(field, sorted=sorted)
+
+    def query(self, *filters: Any, **equals: Any) -> List[Tuple[Path, Card]]:
+        """Set.query over every set, as (path, card)."""
+        return [(path, card) for path, s in self.sets.items() for card in s.query(*filters, **equals)]
+
+
+def _load_one(path: Path, compact: bool, cache: Union[bool, ParseCache]) -> Tuple[Set, float]:
+    start = time.perf_counter()
+    s = Set.from_packagefile(path, compact=compact, cache=cache)
+    return s, time.perf_counter() - start
+
+
+def iter_load(
+    paths: Iterable[Union[str, Path]],
+    workers: Optional[int] = None,
+    compact: bool = False,
+    cache: Union[bool, ParseCache] = True,
+) -> Iterator[LoadResult]:
+    """Loads .mse-set files with Set.from_packagefile in a pool of worker processes
+    (at most workers, by default one per CPU), yielding each LoadResult as soon as
+    its set is done, so in no particular order. A set that fails to load yields a
+    result with its error instead of stopping the others. With a single worker or
+    path, sets are loaded in this process."""
+    paths = [Path(p) for p in paths]
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, len(paths)))
+    if workers == 1:
+        for path in paths:
+            try:
+                s, seconds = _load_one(path, compact, cache)
+            except Exception as e:
+                yield LoadResult(path, error=e)
+            else:
+                yield LoadResult(path, s, seconds=seconds)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(_load_one, path, compact, cache): path for path in paths}
+        try:
+            for future in as_completed(futures):
+                path = futures[future]
+                try:
+                    s, seconds = future.result()
+                except Exception as e:
+                    yield LoadResult(path, error=e)
+                else:
+                    yield LoadResult(path, s, seconds=seconds)
+        finally:
+            # Stopped early (break, exception in the consumer): don't start the rest
+            for future in futures:
+                future.cancel()
+
+
+def load_many(
+    paths: Iterable[Union[str, Path]],
+    workers: Optional[int] = None,
+    compact: bool = False,
+    cache: Union[bool, ParseCache] = True,
+    on_result: Optional[Callable[[LoadResult], None]] = None,
+) -> SetCollection:
+    """Loads sets in parallel as iter_load does, into one SetCollection ordered like
+    paths. on_result, if given, is called with each LoadResult as it comes in."""
+    paths = [Path(p) for p in paths]
+    results = {}  # type: Dict[Path, LoadResult]
+    for result in iter_load(paths, workers=workers, compact=compact, cache=cache):
+        results[result.path] = result
+        if on_result is not None:
+            on_result(result)
+    collection = SetCollection()
+    for path in paths:
+        if path in results:
+            collection.add(results[path])
+    return collection
+
+
+def _expand(paths: Iterable[str]) -> List[Path]:
+    """The paths, with directories replaced by the .mse-set files under them. Folders
+    that happen to be called *.mse-set, and set histories, are left out."""
+    found = []  # type: List[Path]
+    for p in map(Path, paths):
+        if p.is_dir():
+            found.extend(
+                sorted(
+                    f for f in p.rglob("*.mse-set")
+                    if f.is_file() and HISTORY_DIR not in f.relative_to(p).parts
+                )
+            )
+        else:
+            found.append(p)
+    return found
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="mseutils load", description="Load many .mse-set files in parallel.")
+    parser.add_argument("paths", nargs="+", help=".mse-set files, or directories to search for them")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="worker processes (default: one per CPU)")
+    parser.add_argument("--compact", action="store_true", help="load cards as CompactCards")
+    parser.add_argument("--no-cache", action="store_true", help="bypass the parse cache")
+    parser.add_argument("--find", metavar="NAME", help="list the sets that have a card called NAME")
+    parser.add_argument("--where", metavar="FIELD=VALUE", action="append", default=[], help="list matching cards")
+    args = parser.parse_args(argv)
+    if any("=" not in w for w in args.where):
+        parser.error("--where takes FIELD=VALUE")
+
+    paths = _expand(args.paths)
+
+    def report(result: LoadResult) -> None:
+        if result.ok:
+            print(f"loaded {result.path} ({len(result.set.cards)} cards, {result.seconds:.2f} s)", flush=True)
+        else:
+            print(f"FAILED {result.path}: {result.error}", file=sys.stderr, flush=True)
+
+    start = time.perf_counter()
+    collection = load_many(
+        paths, workers=args.workers, compact=args.compact, cache=not args.no_cache, on_result=report
+    )
+    n_cards = sum(len(s.cards) for _, s in collection)
+    print(
+        f"{len(collection)} sets, {n_cards} cards loaded in {time.perf_counter() - start:.2f} s;"
+        f" {len(collection.errors)} failed"
+    )
+    if args.find is not None:
+        for path, _ in collection.find(args.find):
+            print(f"{args.find}: {path}")
+    if args.where:
+        equals = dict(w.split("=", 1) for w in args.where)
+        for path, card in collection.query(**equals):
+            print(f"{path}: {card.name}")
+    return 1 if collection.errors else 0
+
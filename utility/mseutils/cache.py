@@ -0,0 +1,205 @@
+from pathlib import Path
+from typing import Any, List, Optional, TextIO, Union
+from zipfile import ZipFile
+import hashlib
+import os
+import pickle
+import struct
+import tempfile
+from .package import SETFILE_MEMBER
+
+
+# Bump whenever what Card, CompactCard or Set pickle changes shape, so stale entries
+# written by an older mseutils are ignored instead of half-loaded.
+_CACHE_VERSION = 4
+_MAGIC = b"MSEc"
+_HEADER = struct.Struct("<4sH16s")  # magic, version, fingerprint
+_SUFFIX = ".pickle"
+_DEFAULT_MAX_BYTES = 512 << 20
+
+
+def _digest(*parts: Any) -> bytes:
+    h = hashlib.blake2b(digest_size=16)
+    for p in parts:
+        h.update(repr(p).encode("utf-8", "surrogatepass"))
+        h.update(b"\x00")
+    return h.digest()
+
+
+def package_fingerprint(zip_ref: ZipFile, compact: bool) -> Optional[bytes]:
+    """What a parsed .mse-set depends on: the CRC and size of its 'set' member (which
+    zip keeps in the directory, so nothing is read or decompressed), and how it was
+    loaded. Images and other members don't matter, they are never cached. None if
+    there's no 'set' member."""
+    try:
+        info = zip_ref.getinfo(SETFILE_MEMBER)
+    except KeyError:
+        return None
+    return _digest("package", info.CRC, info.file_size, compact)
+
+
+def setfile_fingerprint(ifile: TextIO, compact: bool) -> Optional[bytes]:
+    """Same for an unzipped setfile, going by the modification time and size of the
+    file it was opened from. None for anything that isn't a whole file opened from
+    disk (StringIO, a stream that has been read from already, ...)."""
+    name = getattr(ifile, "name", None)
+    if not isinstance(name, (str, os.PathLike)):
+        return None
+    try:
+        if not ifile.seekable() or ifile.tell() != 0:
+            return None
+        st = os.stat(name)
+    except (OSError, ValueError):
+        return None
+    return _digest("setfile", st.st_mtime_ns, st.st_size, getattr(ifile, "encoding", None), compact)
+
+
+class ParseCache:
+    """On-disk cache of parsed sets, one entry per source path (and per compact or
+    not, so loading a set both ways doesn't evict one for the other), evicting least
+    recently used entries once the entries take up more than max_bytes. Entries are
+    pickles and are loaded as such, so only point this at a directory you trust.
+
+    Set.from_setfile and Set.from_packagefile use the default cache (see
+    default_cache) unless told otherwise. An entry is only used while the fingerprint
+    it was stored with still matches the file, so edits invalidate it by themselves;
+    invalidate and clear are for forcing a re-parse anyway."""
+
+    def __init__(self, directory: Union[str, Path], max_bytes: int = _DEFAULT_MAX_BYTES) -> None:
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+
+    def _entry(self, path: Union[str, Path], compact: bool = False) -> Path:
+        name = str(Path(path).resolve()) + ("\x00compact" if compact else "")
+        key = hashlib.blake2b(name.encode("utf-8", "surrogatepass"), digest_size=16)
+        return self.directory / (key.hexdigest() + _SUFFIX)
+
+    def get(self, path: Union[str, Path], fingerprint: bytes, compact: bool = False) -> Any:
+        """The object stored for path (loaded compact or not) under fingerprint, or
+        None on a miss."""
+        entry = self._entry(path, compact)
+        try:
+            with open(entry, "rb") as f:
+                header = f.read(_HEADER.size)
+                if len(header) != _HEADER.size or _HEADER.unpack(header) != (_MAGIC, _CACHE_VERSION, fingerprint):
+                    return None
+                value = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception:
+            # Truncated or otherwise unreadable entry; it'll be rewritten after the parse
+            self._unlink(entry)
+            return None
+        try:
+            os.utime(entry)  # mtime is the last use, for eviction
+        except OSError:
+            pass
+        return value
+
+    def put(self, path: Union[str, Path], fingerprint: bytes, value: Any, compact: bool = False) -> None:
+        """Stores value for path (loaded compact or not), replacing whatever was stored
+        for it before. Values too big to ever fit are not stored."""
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if _HEADER.size + len(data) > self.max_bytes:
+            self._unlink(self._entry(path, compact))
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        entry = self._entry(path, compact)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(_HEADER.pack(_MAGIC, _CACHE_VERSION, fingerprint))
+                f.write(data)
+            os.replace(tmp, entry)
+        except BaseException:
+            self._unlink(Path(tmp))
+            raise
+        self._evict()
+
+    def invalidate(self, path: Union[str, Path]) -> None:
+        """Drops the entries for path, if any."""
+        self._unlink(self._entry(path))
+        self._unlink(self._entry(path, compact=True))
+
+    def clear(self) -> None:
+        """Drops every entry."""
+        for entry in self._entries():
+            self._unlink(entry)
+
+    def size(self) -> int:
+        """Bytes taken up by all entries."""
+        total = 0
+        for entry in self._entries():
+            try:
+                total += entry.stat().st_size
+            except OSError:
+                pass
+        return total
+
+    def _entries(self) -> List[Path]:
+        if not self.directory.is_dir():
+            return []
+        return list(self.directory.glob("*" + _SUFFIX))
+
+    def _evict(self) -> None:
+        stats = []
+        for entry in self._entries():
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            stats.append((st.st_mtime_ns, st.st_size, entry))
+        total = sum(size for _, size, _ in stats)
+        for _, size, entry in sorted(stats, key=lambda s: s[0]):
+            if total <= self.max_bytes:
+                break
+            self._unlink(entry)
+            total -= size
+
+    @staticmethod
+    def _unlink(entry: Path) -> None:
+        try:
+            entry.unlink()
+        except FileNotFoundError:
+            pass
+
+
+_default_cache = None  # type: Optional[ParseCache]
+_default_configured = False
+
+
+def _default_directory() -> Path:
+    env = os.environ.get("MSEUTILS_CACHE_DIR")
+    if env:
+        return Path(env)
+    base = os.environ.get("XDG_CACHE_HOME")
+    return (Path(base) if base else Path.home() / ".cache") / "mseutils"
+
+
+def default_cache() -> Optional[ParseCache]:
+    """The cache used when loading sets with cache=True: whatever set_default_cache
+    was last given, else one in $MSEUTILS_CACHE_DIR (or ~/.cache/mseutils). Setting
+    MSEUTILS_NO_CACHE turns it off."""
+    global _default_cache, _default_configured
+    if not _default_configured:
+        _default_configured = True
+        if not os.environ.get("MSEUTILS_NO_CACHE"):
+            _default_cache = ParseCache(_default_directory())
+    return _default_cache
+
+
+def set_default_cache(cache: Optional[ParseCache]) -> None:
+    """Replaces the default cache; None turns caching off by default."""
+    global _default_cache, _default_configured
+    _default_cache = cache
+    _default_configured = True
+
+
+def _resolve(cache: Union[bool, ParseCache, None]) -> Optional[ParseCache]:
+    """The cache= argument of the Set loaders: True for the default cache, False or
+    None to bypass it, or a specific ParseCache."""
+    if cache is True:
+        return default_cache()
+    if isinstance(cache, ParseCache):
+        return cache
+    return None
@@ -1,17 +1,76 @@
 from contextlib import contextmanager
-from datetime import datetime
-from typing import Any, Callable, Dict, Iterator, List, Optional, TextIO, Tuple
+from datetime import datetime, time
+import functools
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    MutableMapping,
+    Optional,
+    TextIO,
+    Tuple,
+)
 import re
 
 
-def _parse_datetime_if_str(o: Any) -> datetime:
-    if isinstance(o, datetime):
+@functools.lru_cache(maxsize=4096)
+def _decode_time(s: str) -> datetime:
+    """Parses a Card.time_format timestamp. Sets are full of cards created in the same
+    second, hence the cache; the common 'YYYY-MM-DD HH:MM:SS' layout is sliced apart
+    directly since strptime is many times slower."""
+    s = s.strip()
+    if (
+        len(s) == 19
+        and s[4] == s[7] == "-"
+        and s[10] == " "
+        and s[13] == s[16] == ":"
+        and (s[0:4] + s[5:7] + s[8:10] + s[11:13] + s[14:16] + s[17:19]).isdigit()
+    ):
+        try:
+            return datetime(
+                int(s[0:4]), int(s[5:7]), int(s[8:10]), int(s[11:13]), int(s[14:16]), int(s[17:19])
+            )
+        except ValueError:
+            pass  # e.g. month 13; let strptime produce the usual error
+    return datetime.strptime(s, Card.time_format)
+
+
+@functools.lru_cache(maxsize=1024)
+def _decode_date(s: str) -> datetime:
+    """Parses a Card.date_format date, like _decode_time."""
+    if len(s) == 10 and s[4] == s[7] == "-" and (s[0:4] + s[5:7] + s[8:10]).isdigit():
+        try:
+            return datetime(int(s[0:4]), int(s[5:7]), int(s[8:10]))
+        except ValueError:
+            pass
+    return datetime.strptime(s, Card.date_format)
+
+
+def _time_or_now(o: Any) -> Any:
+    """Card time fields are kept as given if they're strings (decoded on access) or
+    datetimes; anything else means 'now'."""
+    if isinstance(o, (str, datetime)):
         return o
-    elif isinstance(o, str):
-        return datetime.strptime(o.strip(), Card.time_format)
     return datetime.now()
 
 
+@functools.lru_cache(maxsize=4096)
+def _format_datetime(d: datetime, fmt: str) -> str:
+    """d.strftime(fmt), which is slow and mostly asked for the same few timestamps."""
+    return d.strftime(fmt)
+
+
+def _encode_time(o: Any) -> str:
+    """Setfile text for a Card time field: raw strings go back out untouched."""
+    if isinstance(o, str):
+        return o
+    return _format_datetime(o, Card.time_format)
+
+
 _re_setfile_scanner = re.compile(
     r"^(?P<indent>\s*)(?:(?:(?P<group_tag>.*?):$)|(?:(?P<key_tag>.*?): (?P<value>.*)$))",
     re.MULTILINE,
@@ -34,97 +93,374 @@ def peek_line(file: TextIO):
     return line
 
 
-def _collect_indented_block(
-    ifile: TextIO, adaptation_func: Optional[Callable] = None
-) -> Tuple[str, Any]:
-    """Attempts to extract indented blocks of data from a setfile, perhaps recursively.
-    Expects ifile to be on a line BEFORE the the indent (e.g. an opening 'card:' tag),
-    collects all lines beginning with an additional layer of indent after that tag into
-    a dict (e.g. '\tnotes: ' will be given back as {'notes' : ''}), and if it returns
-    nominally ifile will be on the line AFTER that layer of indent (e.g. perhaps the
-    opening 'card:' tag of the next card).
+_SCAN_CHUNK_SIZE = 1 << 20  # characters per read() when scanning a whole setfile
 
-    If adaptation_func is not None, it will be passed key / value pairs of the data to
-    allow you to make them into different types on the fly -- for example, your func
-    could take a pair like "time_modified": "2025-03-19 17:00:13" and parse the value
-    into a datetime.
+_Token = Tuple[int, str, Optional[str]]  # (indent, tag, value); value is None for groups
 
-    Can raise IndentationError or ValueError for bad blocks or bad tags.
+
+def _iter_chunked_lines(ifile: TextIO, chunk_size: int = _SCAN_CHUNK_SIZE) -> Iterator[str]:
+    """Yields lines of ifile (with their trailing newline) by reading it in large chunks
+    instead of one readline() per line."""
+    tail = ""
+    while True:
+        chunk = ifile.read(chunk_size)
+        if chunk == "":
+            break
+        lines = (tail + chunk).split("\n")
+        tail = lines.pop()
+        for l in lines:
+            yield l + "\n"
+    if tail != "":
+        yield tail
+
+
+def _iter_text_lines(text: str) -> Iterator[str]:
+    """Yields lines of an already-read setfile (with their trailing newline)."""
+    start = 0
+    while True:
+        end = text.find("\n", start)
+        if end == -1:
+            if start < len(text):
+                yield text[start:]
+            return
+        yield text[start:end + 1]
+        start = end + 1
+
+
+class _TellingLineReader:
+    """Iterates over lines of ifile with readline(), remembering where the most
+    recently read line started so the file can be rewound to it afterwards."""
+
+    def __init__(self, ifile: TextIO) -> None:
+        self.ifile = ifile
+        self.pos = ifile.tell()
+
+    def __iter__(self) -> Iterator[str]:
+        while True:
+            self.pos = self.ifile.tell()
+            l = self.ifile.readline()
+            if l == "":
+                return
+            yield l
+
+
+class _SetfileScanner:
+    """Single-pass tokenizer over the lines of a setfile with one line of lookahead.
+
+    Every line is pulled from the underlying iterator exactly once and run through
+    _re_setfile_scanner at most once; the match is cached as an (indent, tag, value)
+    token, where value is None for group tags such as 'card:'. Lines inside '* text'
+    blocks don't follow the tag grammar, so they are only ever looked at raw.
+
+    offset counts the characters consumed so far, i.e. where the lookahead line starts.
     """
-    global _re_setfile_scanner
 
-    l = ifile.readline()
-    m = _re_setfile_scanner.match(l)
-    if m is None:
+    def __init__(self, lines: Iterable[str], name: str = "<setfile>") -> None:
+        self.name = name
+        self.offset = 0
+        self._lines = iter(lines)
+        self._line = next(self._lines, "")
+        self._token = None  # type: Optional[_Token]
+        self._scanned = False
+
+    @classmethod
+    def from_file(cls, ifile: TextIO, chunk_size: int = _SCAN_CHUNK_SIZE) -> "_SetfileScanner":
+        """Scans the rest of ifile, reading it in chunks of chunk_size characters."""
+        return cls(_iter_chunked_lines(ifile, chunk_size), getattr(ifile, "name", "<setfile>"))
+
+    @classmethod
+    def from_text(cls, text: str, name: str = "<setfile>") -> "_SetfileScanner":
+        """Scans a setfile that has already been read into memory."""
+        return cls(_iter_text_lines(text), name)
+
+    def peek_line(self) -> str:
+        """Returns the lookahead line, or the empty string once input is exhausted."""
+        return self._line
+
+    def peek(self) -> Optional[_Token]:
+        """Returns the lookahead line as a token, or None if it isn't a valid tag line."""
+        if not self._scanned:
+            self._scanned = True
+            m = _re_setfile_scanner.match(self._line)
+            if m is None:
+                self._token = None
+            elif m["key_tag"] is not None:
+                self._token = (len(m["indent"]), m["key_tag"], m["value"])
+            else:
+                self._token = (len(m["indent"]), m["group_tag"], None)
+        return self._token
+
+    def advance(self) -> str:
+        """Consumes the lookahead line and returns it."""
+        l = self._line
+        self.offset += len(l)
+        self._line = next(self._lines, "")
+        self._token = None
+        self._scanned = False
+        return l
+
+
+class _CountingScanner(_SetfileScanner):
+    """_SetfileScanner that also counts the lines it consumes, and the group tags
+    among them and how deeply they nest (tab indents), for instrumentation. A separate
+    class so that the plain scanner's advance stays as cheap as it is."""
+
+    def __init__(self, lines: Iterable[str], name: str = "<setfile>") -> None:
+        super().__init__(lines, name)
+        self.lines = 0
+        self.blocks = 0
+        self.max_depth = 0
+
+    def advance(self) -> str:
+        self.lines += 1
+        token = self._token
+        if self._scanned and token is not None and token[2] is None:
+            self.blocks += 1
+            if token[0] + 1 > self.max_depth:
+                self.max_depth = token[0] + 1
+        return super().advance()
+
+
+def _scan_indented_block(
+    scanner: _SetfileScanner, adaptation_func: Optional[Callable] = None
+) -> Tuple[str, Any]:
+    """Does the work of _collect_indented_block on an already-open scanner."""
+    l = scanner.peek_line()
+    token = scanner.peek()
+    if token is None:
         raise ValueError(
-            f"Expected opening tag at line {l} in {ifile.name}"
+            f"Expected opening tag at line {l} in {scanner.name}"
         )
+    scanner.advance()
+    init_indent, init_tag, value = token
 
-    if m["key_tag"] is not None:
+    if value is not None:
         # Single line data, we can return right away
-        k, v = m["key_tag"], m["value"]
+        k, v = init_tag, value
         if adaptation_func is not None:
             k, v = adaptation_func(k, v)
         return (k, v)
 
-    # Otherwise, we're looking at an indented block.
-    # Remember this initial indent, we'll return if we get back to this level
-    init_indent = m["indent"]
-    init_tag = m["group_tag"]
+    # Otherwise, we're looking at an indented block; we return when we get back to
+    # init_indent.
     fields = {}  # type: Dict[str, Any] | List[str]
 
-    while True:
-        # Get next line and decide what it is
-        l = peek_line(ifile)
-        if l == "":
-            # If we run out of lines with readline, l will be the empty string
-            break
-        if init_tag.endswith(" text"):
-            # Special case... rules text ironically does not follow regex rules very well
+    if init_tag.endswith(" text"):
+        # Special case... rules text ironically does not follow regex rules very well
+        while True:
+            l = scanner.peek_line()
+            if l == "":
+                # Out of lines
+                break
             stripped = l.lstrip()
-            curr_indent = l.replace(stripped, '')
-            if len(curr_indent) <= len(init_indent):
+            if len(l) - len(stripped) <= init_indent:
                 # We're done! Great. The next guy can start on this line
                 break
             if isinstance(fields, dict):
                 fields = []
             fields.append(stripped)
-            ifile.readline() # to pop
-        else:
-            m = _re_setfile_scanner.match(peek_line(ifile))
-            if m is None:
+            scanner.advance()
+        if isinstance(fields, list):
+            fields = _TrackedList(fields)
+    else:
+        while True:
+            l = scanner.peek_line()
+            if l == "":
+                break
+            token = scanner.peek()
+            if token is None:
                 raise ValueError(
-                    f"Unparseable line {l} in {ifile.name})"
+                    f"Unparseable line {l} in {scanner.name})"
                 )
-            if len(m["indent"]) <= len(init_indent):
+            indent, k, v = token
+            if indent <= init_indent:
                 # We're done! Great. The next guy can start on this line
                 break
 
-            if m["group_tag"] is not None:
+            if v is None:
                 # Opening of a new multi-line thing; recurse
-                gt, dat = _collect_indented_block(ifile)
-                if adaptation_func is not None:
-                    gt, dat = adaptation_func(gt, dat)
-                fields[gt] = dat
-            elif m["key_tag"] is not None:
-                k = m["key_tag"]
-                v = m["value"]
-                if adaptation_func is not None:
-                    k, v = adaptation_func(k, v)
-                fields[k] = v
-                ifile.readline() # to pop
+                k, v = _scan_indented_block(scanner)
+            else:
+                scanner.advance()
+            if adaptation_func is not None:
+                k, v = adaptation_func(k, v)
+            fields[k] = v
 
     if adaptation_func is not None:
         init_tag, fields = adaptation_func(init_tag, fields)
     return (init_tag, fields)
 
 
+def _collect_indented_block(
+    ifile: TextIO, adaptation_func: Optional[Callable] = None
+) -> Tuple[str, Any]:
+    """Attempts to extract indented blocks of data from a setfile, perhaps recursively.
+    Expects ifile to be on a line BEFORE the the indent (e.g. an opening 'card:' tag),
+    collects all lines beginning with an additional layer of indent after that tag into
+    a dict (e.g. '\tnotes: ' will be given back as {'notes' : ''}), and if it returns
+    nominally ifile will be on the line AFTER that layer of indent (e.g. perhaps the
+    opening 'card:' tag of the next card).
+
+    If adaptation_func is not None, it will be passed key / value pairs of the data to
+    allow you to make them into different types on the fly -- for example, your func
+    could take a pair like "time_modified": "2025-03-19 17:00:13" and parse the value
+    into a datetime.
+
+    ifile may also be a _SetfileScanner, in which case no seeking is done at all; when
+    given a plain file, it is rewound once at the end to the start of the first line
+    that wasn't part of the block.
+
+    Can raise IndentationError or ValueError for bad blocks or bad tags.
+    """
+    if isinstance(ifile, _SetfileScanner):
+        return _scan_indented_block(ifile, adaptation_func)
+    reader = _TellingLineReader(ifile)
+    scanner = _SetfileScanner(reader, ifile.name)
+    try:
+        return _scan_indented_block(scanner, adaptation_func)
+    finally:
+        if scanner.peek_line() != "":
+            ifile.seek(reader.pos)
+
+
 def _collect_all_indented_blocks(ifile : TextIO, **kwargs) -> Iterator[Tuple[str, Dict[str, Any]]]:
-    """Repeatedly call _collect_indented_block until file is empty."""
-    while True:
-        if peek_line(ifile) == "":
-            return
-        yield _collect_indented_block(ifile, **kwargs)
+    """Repeatedly collect indented blocks until file is empty. The file is read once, in
+    large chunks, through a _SetfileScanner (or ifile may already be one)."""
+    if isinstance(ifile, _SetfileScanner):
+        scanner = ifile
+    else:
+        scanner = _SetfileScanner.from_file(ifile)
+    while scanner.peek_line() != "":
+        yield _scan_indented_block(scanner, **kwargs)
+
+
+class _TrackedDict(dict):
+    """dict that remembers which keys were assigned or deleted since it was created (or
+    since changed was last cleared), and calls listener(key) for each such change if
+    one is attached. Mutating a value in place, e.g. appending to a list stored in it,
+    is not noticed."""
+
+    __slots__ = ("changed", "listener")
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.changed = set()  # type: set[Any]
+        self.listener = None  # type: Optional[Callable[[Any], None]]
+
+    def _touch(self, key: Any) -> None:
+        self.changed.add(key)
+        if self.listener is not None:
+            self.listener(key)
+
+    def __setitem__(self, key: Any, value: Any) -> None:
+        super().__setitem__(key, value)
+        self._touch(key)
+
+    def __delitem__(self, key: Any) -> None:
+        super().__delitem__(key)
+        self._touch(key)
+
+    def pop(self, key: Any, *default: Any) -> Any:
+        if key not in self:
+            return super().pop(key, *default)
+        v = super().pop(key)
+        self._touch(key)
+        return v
+
+    def popitem(self) -> Tuple[Any, Any]:
+        k, v = super().popitem()
+        self._touch(k)
+        return (k, v)
+
+    def setdefault(self, key: Any, default: Any = None) -> Any:
+        if key in self:
+            return self[key]
+        self[key] = default
+        return default
+
+    def update(self, *args, **kwargs) -> None:
+        for k, v in dict(*args, **kwargs).items():
+            self[k] = v
+
+    def clear(self) -> None:
+        keys = list(self.keys())
+        super().clear()
+        for k in keys:
+            self._touch(k)
+
+    def __ior__(self, other: Any) -> "_TrackedDict":
+        self.update(other)
+        return self
+
+    def __reduce__(self) -> Tuple[Any, ...]:
+        # The default for dict subclasses would restore items through __setitem__
+        # before changed even exists
+        return (_restore_tracked_dict, (dict(self), set(self.changed)))
+
+
+def _restore_tracked_dict(items: Dict[Any, Any], changed: "set[Any]") -> _TrackedDict:
+    d = _TrackedDict(items)
+    d.changed = changed
+    return d
+
+
+def _mutator(name: str) -> Callable[..., Any]:
+    method = getattr(list, name)
+
+    def mutate(self: "_TrackedList", *args: Any, **kwargs: Any) -> Any:
+        result = method(self, *args, **kwargs)
+        self.changed = True
+        return result
+
+    mutate.__name__ = name
+    return mutate
+
+
+class _TrackedList(list):
+    """list that remembers whether it was changed in place since it was created (or
+    since changed was last cleared). The lines of '* text' blocks ('rule text') are
+    read into these, so that appending a line makes the card dirty."""
+
+    __slots__ = ("changed",)
+
+    def __init__(self, *args: Any) -> None:
+        super().__init__(*args)
+        self.changed = False
+
+    __setitem__ = _mutator("__setitem__")
+    __delitem__ = _mutator("__delitem__")
+    __iadd__ = _mutator("__iadd__")
+    __imul__ = _mutator("__imul__")
+    append = _mutator("append")
+    extend = _mutator("extend")
+    insert = _mutator("insert")
+    pop = _mutator("pop")
+    remove = _mutator("remove")
+    clear = _mutator("clear")
+    sort = _mutator("sort")
+    reverse = _mutator("reverse")
+
+    def __reduce__(self) -> Tuple[Any, ...]:
+        return (_restore_tracked_list, (list(self), self.changed))
+
+
+def _restore_tracked_list(items: List[Any], changed: bool) -> _TrackedList:
+    l = _TrackedList(items)
+    l.changed = changed
+    return l
+
+
+def _lists_changed(values: Iterable[Any]) -> bool:
+    for v in values:
+        if v.__class__ is _TrackedList and v.changed:
+            return True
+    return False
+
+
+def _clear_lists(values: Iterable[Any]) -> None:
+    for v in values:
+        if v.__class__ is _TrackedList:
+            v.changed = False
 
 
 class Card:
@@ -133,20 +469,133 @@ class Card:
     time_format = r"%Y-%m-%d %H:%M:%S"
     date_format = r"%Y-%m-%d"
 
+    # No per-instance __dict__; _dirty goes last so that it is restored last on unpickle
+    __slots__ = (
+        "has_styling",
+        "notes",
+        "_time_created",  # str as read from a setfile, or datetime
+        "_time_modified",
+        "name",
+        "_fields",
+        "_listener",  # called as listener(card, attribute name) after every edit
+        "_dirty",
+    )
+
     def __init__(self, **kwargs) -> None:
+        object.__setattr__(self, "_listener", None)
         self.has_styling = kwargs.pop("has_styling", "false")
         self.notes = kwargs.pop("notes", "")
-        # Time is tricky; it might be coming in as a string
-        self.time_created = _parse_datetime_if_str(kwargs.pop("time_created", None))
-        self.time_modified = _parse_datetime_if_str(kwargs.pop("time_modified", None))
+        # Time is tricky; it might be coming in as a string, which we only parse if
+        # someone actually asks for the datetime
+        self.time_created = _time_or_now(kwargs.pop("time_created", None))
+        self.time_modified = _time_or_now(kwargs.pop("time_modified", None))
         self.name = kwargs.pop("name", "")
         self.remaining_keys = kwargs  # type: Dict[str, Any]
+        # Only edits made after construction count
+        self._dirty = False
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        object.__setattr__(self, name, value)
+        if name != "_dirty":
+            object.__setattr__(self, "_dirty", True)
+            if self._listener is not None:
+                self._listener(self, name)
+
+    def _notify(self, field: str) -> None:
+        """Reports an edit of field (e.g. a remaining_keys entry) to the listener."""
+        if self._listener is not None:
+            self._listener(self, field)
+
+    def __reduce__(self) -> Tuple[Any, ...]:
+        # Pickles (e.g. the parse cache) skip __init__ and __setattr__ on the way back
+        # in; listeners are not carried over.
+        return (
+            _restore_card,
+            (
+                type(self),
+                self.has_styling,
+                self.notes,
+                self._time_created,
+                self._time_modified,
+                self.name,
+                dict(self._fields),
+                self._dirty,
+            ),
+        )
+
+    def _set_listener(self, listener: Optional[Callable[["Card", str], None]]) -> None:
+        """Attaches the callback that Set uses to keep its indexes current, or detaches
+        it with None. Each card can only report to one listener at a time."""
+        object.__setattr__(self, "_listener", listener)
+        self._fields.listener = None if listener is None else self._notify
+
+    @property
+    def time_created(self) -> datetime:
+        """Assign a datetime, or a string in time_format that is only parsed once
+        someone reads it back; unread strings are written back out unchanged."""
+        t = self._time_created
+        return _decode_time(t) if isinstance(t, str) else t
+
+    @time_created.setter
+    def time_created(self, value: Any) -> None:
+        self._time_created = value
+
+    @property
+    def time_modified(self) -> datetime:
+        """Like time_created."""
+        t = self._time_modified
+        return _decode_time(t) if isinstance(t, str) else t
+
+    @time_modified.setter
+    def time_modified(self, value: Any) -> None:
+        self._time_modified = value
+
+    @property
+    def remaining_keys(self) -> MutableMapping[str, Any]:
+        """All card fields other than the five every card has, in setfile order."""
+        return self._fields
+
+    @remaining_keys.setter
+    def remaining_keys(self, value: Mapping[str, Any]) -> None:
+        fields = value if isinstance(value, _TrackedDict) else _TrackedDict(value)
+        fields.listener = None if self._listener is None else self._notify
+        self._fields = fields
+
+    def time_field(self, key: str) -> Optional[datetime]:
+        """remaining_keys[key] (e.g. 'time created') as a datetime, decoded like
+        time_created, or None if the card has no such field."""
+        t = self.remaining_keys.get(key)
+        return _decode_time(t) if isinstance(t, str) else t
+
+    def _field_items(self) -> Iterable[Tuple[str, Any]]:
+        """(key, value) of remaining_keys, as cheaply as this kind of card can."""
+        return self._fields.items()
+
+    @property
+    def dirty(self) -> bool:
+        """Whether any field was assigned since this card was created or last saved, or
+        a 'rule text' (etc.) list read from a setfile was changed in place. Other
+        in-place changes to mutable values need mark_dirty()."""
+        return self._dirty or len(self._fields.changed) > 0 or _lists_changed(self._fields.values())
+
+    def mark_dirty(self) -> None:
+        self._dirty = True
+
+    def mark_clean(self) -> None:
+        self._dirty = False
+        self._fields.changed.clear()
+        _clear_lists(self._fields.values())
 
     def __eq__(self, other: object) -> bool:
         if isinstance(other, Card):
             return self.name == other.name  # This works well for "if card in set:"
         return False
 
+    def __hash__(self) -> int:
+        # Has to agree with __eq__, so don't rename cards while they're in a set() or
+        # used as dict keys
+        return hash(self.name)
+
     def is_identical_to(self, other: "Card") -> bool:
         """Deep comparison of two Cards."""
         return (
@@ -165,17 +614,26 @@ class Card:
             f"\thas_styling: {'true' if self.has_styling == "true" else 'false'}"
         )
         ret.append(f"\tnotes: {self.notes}")
-        ret.append(f"\ttime_created: {self.time_created.strftime(Card.time_format)}")
-        ret.append(f"\ttime_modified: {self.time_modified.strftime(Card.time_format)}")
+        ret.append(f"\ttime_created: {_encode_time(self._time_created)}")
+        ret.append(f"\ttime_modified: {_encode_time(self._time_modified)}")
         ret.append(f"\tname: {self.name}")
         for k, v in self.remaining_keys.items():
-            ret.append(f"\t{str(k)}: {str(v)}")
+            if isinstance(v, list):
+                ret.append(f"\t{str(k)}:")
+                ret.extend("\t\t" + str(item).rstrip("\n") for item in v)
+            elif isinstance(v, dict):
+                ret.extend(_render_field(k, v, "\t").splitlines())
+            elif isinstance(v, datetime):
+                ret.append(f"\t{str(k)}: {_datetime_text(k, v)}")
+            else:
+                ret.append(f"\t{str(k)}: {str(v)}")
         return ret
 
     def to_setfile(self, ofile: TextIO, indent: Optional[str] = "") -> None:
         """Writes self as lines to output text file, optionally with indent."""
-        for s in self.to_setfile_strs():
-            ofile.write(f"{indent}{s}\n")
+        out = []  # type: List[str]
+        _render_card(self, indent or "", out)
+        ofile.write("".join(out))
 
     @classmethod
     def from_setfile(cls, ifile: TextIO) -> "Card":
@@ -229,28 +687,189 @@ class Card:
         ifile.seek(prev_pos)
         return Card(**card_fields)
 
-def _cardify_incoming_types(k: Any, v: Any) -> Tuple[Any, Any]:
+def _restore_card(
+    cls: type,
+    has_styling: Any,
+    notes: Any,
+    time_created: Any,
+    time_modified: Any,
+    name: Any,
+    fields: Dict[str, Any],
+    dirty: bool,
+) -> Card:
+    c = object.__new__(cls)
+    setattr_ = object.__setattr__
+    setattr_(c, "_listener", None)
+    setattr_(c, "has_styling", has_styling)
+    setattr_(c, "notes", notes)
+    setattr_(c, "_time_created", time_created)
+    setattr_(c, "_time_modified", time_modified)
+    setattr_(c, "name", name)
+    setattr_(c, "_fields", _TrackedDict(fields))
+    setattr_(c, "_dirty", dirty)
+    return c
+
+
+def _cardify_incoming_types(
+    k: Any, v: Any, card_factory: Callable[..., Card] = Card
+) -> Tuple[Any, Any]:
     if k == "card":
-        c = Card(**v)
+        c = card_factory(**v)
         return (c.name, c)
     elif isinstance(k, str):
         if "time" in k:
-            return(k, datetime.strptime(v, Card.time_format))
+            # Kept as read: Card decodes time_created/time_modified when they're
+            # read, and other time fields through time_field()
+            return (k, v)
         elif k == "game_version" or k == "stylesheet_version":
-            return(k, datetime.strptime(v, Card.date_format))
+            return(k, _decode_date(v))
     return (k, v)
 
 def _uncardify_outgoing(ofile: TextIO, data: dict[str, Any], curr_indent: str="") -> None:
+    out = []  # type: List[str]
+    _render_items(data, curr_indent, out)
+    ofile.write("".join(out))
+
+
+# Flush SetfileWriter's buffer to the file once it holds this many strings; a card
+# is two of them.
+_WRITE_BATCH = 1 << 14
+
+# "{indent}\t{key}: " for every field key seen so far, per indent
+_field_prefixes = {}  # type: Dict[str, Dict[str, str]]
+
+
+def _render_lines(key: Any, lines: List[Any], indent: str) -> str:
+    """A list value ('rule text' and other '* text' blocks): the key on its own line,
+    then each item one tab further in, as _scan_indented_block reads them back."""
+    items = [str(item) for item in lines]
+    return f"{indent}{key}:\n" + "".join(
+        f"{indent}\t{item}" if item.endswith("\n") else f"{indent}\t{item}\n" for item in items
+    )
+
+
+def _datetime_text(key: Any, d: datetime) -> str:
+    """A datetime value as the setfile writes it: time fields always with the time,
+    so midnight and a few seconds stays that, and dates like game_version without."""
+    if "time" in str(key) or d.time() != time(0):
+        return _format_datetime(d, Card.time_format)
+    return _format_datetime(d, Card.date_format)
+
+
+def _render_field(key: Any, value: Any, indent: str) -> str:
+    """A card field that isn't a plain string: a list, a nested block such as
+    styling_data, or a number or date set from Python."""
+    out = []  # type: List[str]
+    _render_block(key, value, indent, out)
+    return "".join(out)
+
+
+def _render_card(card: Card, indent: str, out: List[str]) -> None:
+    """Appends the setfile text of card to out; the same text as to_setfile_strs
+    gives, joined up with indent and newlines."""
+    has_styling = "true" if card.has_styling == "true" else "false"
+    created = card._time_created
+    modified = card._time_modified
+    out.append(
+        f"{indent}card:\n{indent}\thas_styling: {has_styling}\n{indent}\tnotes: {card.notes}\n"
+        f"{indent}\ttime_created: {created if created.__class__ is str else _encode_time(created)}\n"
+        f"{indent}\ttime_modified: {modified if modified.__class__ is str else _encode_time(modified)}\n"
+        f"{indent}\tname: {card.name}\n"
+    )
+    prefixes = _field_prefixes.get(indent)
+    if prefixes is None:
+        prefixes = _field_prefixes[indent] = {}
+    try:
+        out.append("".join([
+            f"{prefixes[k]}{v}\n" if v.__class__ is str else _render_field(k, v, indent + "\t")
+            for k, v in card._field_items()
+        ]))
+    except KeyError:
+        # First time we see one of these keys
+        for k, _ in card._field_items():
+            if k not in prefixes:
+                prefixes[k] = f"{indent}\t{k}: "
+        out.append("".join([
+            f"{prefixes[k]}{v}\n" if v.__class__ is str else _render_field(k, v, indent + "\t")
+            for k, v in card._field_items()
+        ]))
+
+
+def _render_items(data: Mapping[str, Any], indent: str, out: List[str]) -> None:
+    """Appends the setfile text of top-level (or nested, by indent) blocks to out."""
     for k, v in data.items():
-        if isinstance(v, dict):
-            ofile.write(f"{curr_indent}{k}:\n")
-            _uncardify_outgoing(ofile, v, curr_indent + "\t")
-        elif isinstance(v, datetime):
-            if v.hour == 0 and v.minute == 0:
-                ofile.write(f"{curr_indent}{k}: {v.strftime(Card.date_format)}\n")
-            else:
-                ofile.write(f"{curr_indent}{k}: {v.strftime(Card.time_format)}\n")
-        elif isinstance(v, Card):
-            v.to_setfile(ofile)
-        else:
-            ofile.write(f"{curr_indent}{k}: {v}\n")
\ No newline at end of file
+        _render_block(k, v, indent, out)
+
+
+def _render_block(k: Any, v: Any, indent: str, out: List[str]) -> None:
+    if isinstance(v, dict):
+        out.append(f"{indent}{k}:\n")
+        _render_items(v, indent + "\t", out)
+    elif isinstance(v, datetime):
+        out.append(f"{indent}{k}: {_datetime_text(k, v)}\n")
+    elif isinstance(v, Card):
+        # Cards are written at the top level wherever they are
+        _render_card(v, "", out)
+    elif isinstance(v, list):
+        out.append(_render_lines(k, v, indent))
+    else:
+        out.append(f"{indent}{k}: {v}\n")
+
+
+def _render(k: Any, v: Any) -> str:
+    """Setfile text of one top-level block."""
+    out = []  # type: List[str]
+    _render_block(k, v, "", out)
+    return "".join(out)
+
+
+class SetfileWriter:
+    """Batched setfile serializer: renders blocks and cards into one buffer and
+    writes it to ofile in large chunks rather than a line at a time. Takes any
+    iterable, so a set can be streamed through without ever being held whole, e.g.
+
+        with SetfileWriter(ofile) as writer:
+            writer.write_blocks(Set.iter_blocks(ifile))
+
+    Output is the same text _uncardify_outgoing / Card.to_setfile would write.
+    Everything is written by the time flush() returns or the with block ends."""
+
+    def __init__(self, ofile: TextIO, batch: int = _WRITE_BATCH) -> None:
+        self.ofile = ofile
+        self.batch = batch
+        self._out = []  # type: List[str]
+
+    def write_block(self, key: Any, value: Any) -> None:
+        """Writes one top-level block (a card, the styling dict, 'game: ...')."""
+        _render_block(key, value, "", self._out)
+        if len(self._out) >= self.batch:
+            self.flush()
+
+    def write_blocks(self, blocks: Iterable[Tuple[Any, Any]]) -> None:
+        """Writes (key, value) blocks, as in Set.all_data.items() or Set.iter_blocks."""
+        out = self._out
+        batch = self.batch
+        for key, value in blocks:
+            _render_block(key, value, "", out)
+            if len(out) >= batch:
+                self.flush()
+
+    def write_cards(self, cards: Iterable[Card]) -> None:
+        out = self._out
+        batch = self.batch
+        for card in cards:
+            _render_card(card, "", out)
+            if len(out) >= batch:
+                self.flush()
+
+    def flush(self) -> None:
+        if self._out:
+            self.ofile.write("".join(self._out))
+            self._out.clear()
+
+    def __enter__(self) -> "SetfileWriter":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        if exc[0] is None:
+            self.flush()
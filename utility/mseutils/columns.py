@@ -0,0 +1,407 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+import builtins
+import math
+import struct
+import sys
+from .card import Card
+from .index import _field_value, _hash_key, _number
+
+
+NUMERIC = "numeric"
+CATEGORICAL = "categorical"
+
+_MISSING = -1  # code of a missing categorical value
+_AGGREGATES = ("count", "sum", "mean", "min", "max", "median")
+
+_FILE_MAGIC = b"MSEt"
+_FILE_VERSION = 1
+_FILE_HEADER = struct.Struct("<4sHII")  # magic, version, rows, columns
+
+
+def _is_missing(v: Any) -> bool:
+    return v is None or v == ""
+
+
+class NumericColumn:
+    """A field as floats, one per row; missing values (and ones that aren't numbers)
+    are NaN."""
+
+    kind = NUMERIC
+
+    def __init__(self, field: str) -> None:
+        self.field = field
+        self.values = array("d")
+        self._sorted = None  # type: Optional[List[float]]
+
+    def _convert(self, v: Any) -> float:
+        n = None if _is_missing(v) else _number(v)
+        return math.nan if n is None else n
+
+    def append(self, v: Any) -> None:
+        self.values.append(self._convert(v))
+        self._sorted = None
+
+    def extend(self, values: Iterable[Any]) -> None:
+        self.values.extend(map(self._convert, values))
+        self._sorted = None
+
+    def set(self, row: int, v: Any) -> None:
+        self.values[row] = self._convert(v)
+        self._sorted = None
+
+    def move(self, src: int, dst: int) -> None:
+        """Moves row src over row dst and drops the last row (src must be the last)."""
+        self.values[dst] = self.values[src]
+        self.values.pop()
+        self._sorted = None
+
+    def present(self) -> List[float]:
+        """The values that aren't missing, sorted; kept until the column changes."""
+        if self._sorted is None:
+            self._sorted = sorted(v for v in self.values if v == v)
+        return self._sorted
+
+
+class CategoricalColumn:
+    """A field dictionary-encoded: values holds each distinct value once, codes the
+    index into it of every row's value (-1 for missing). Values stay in values after
+    the last row using them changes."""
+
+    kind = CATEGORICAL
+
+    def __init__(self, field: str) -> None:
+        self.field = field
+        self.values = []  # type: List[Any]
+        self.codes = array("i")
+        self._codes = {}  # type: Dict[Any, int]
+
+    def _code(self, v: Any) -> int:
+        key = None if _is_missing(v) else _hash_key(v)
+        if key is None:
+            return _MISSING
+        code = self._codes.get(key)
+        if code is None:
+            code = self._codes[key] = len(self.values)
+            self.values.append(key)
+        return code
+
+    def append(self, v: Any) -> None:
+        self.codes.append(self._code(v))
+
+    def extend(self, values: Iterable[Any]) -> None:
+        self.codes.extend(map(self._code, values))
+
+    def set(self, row: int, v: Any) -> None:
+        self.codes[row] = self._code(v)
+
+    def move(self, src: int, dst: int) -> None:
+        self.codes[dst] = self.codes[src]
+        self.codes.pop()
+
+
+_Column = Union[NumericColumn, CategoricalColumn]
+
+
+def _detect_kind(values: Iterable[Any]) -> str:
+    """Numeric if every value present is a number (and there is one), else categorical."""
+    seen = False
+    for v in values:
+        if _is_missing(v):
+            continue
+        if _number(v) is None:
+            return CATEGORICAL
+        seen = True
+    return NUMERIC if seen else CATEGORICAL
+
+
+def _percentile(values: List[float], q: float) -> float:
+    """q-th percentile of sorted values, interpolating linearly between them."""
+    if not 0 <= q <= 100:
+        raise ValueError(f"Percentile must be between 0 and 100, not {q}")
+    if len(values) == 0:
+        return math.nan
+    pos = (len(values) - 1) * q / 100
+    lo = math.floor(pos)
+    hi = min(lo + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (pos - lo)
+
+
+def _aggregate(values: List[float], agg: str) -> float:
+    if agg == "count":
+        return len(values)
+    if len(values) == 0:
+        return 0.0 if agg == "sum" else math.nan
+    if agg == "sum":
+        return math.fsum(values)
+    if agg == "mean":
+        return math.fsum(values) / len(values)
+    if agg == "min":
+        return min(values)
+    if agg == "max":
+        return max(values)
+    return _percentile(sorted(values), 50)
+
+
+class CardTable:
+    """Card fields as columns, for statistics over every card of a set: numeric fields
+    (mass_g, trophic_tier, ...) as arrays of floats, converted once, and categorical
+    ones (animal_type, ...) dictionary-encoded. Each field's kind is detected from
+    its values unless given in kinds.
+
+    Made with Set.create_table, a table follows cards added and removed through
+    add_card/remove_card and edits to the cards, as indexes do; rows don't stay in
+    card order. names holds each row's card name.
+
+        table = s.create_table("mass_g", "animal_type")
+        table.group_by("animal_type", "mass_g", "mean")
+    """
+
+    def __init__(
+        self, cards: Iterable[Card], fields: Iterable[str], kinds: Optional[Dict[str, str]] = None
+    ) -> None:
+        kinds = kinds if kinds is not None else {}
+        for kind in kinds.values():
+            if kind not in (NUMERIC, CATEGORICAL):
+                raise ValueError(f"Column kind must be '{NUMERIC}' or '{CATEGORICAL}', not '{kind}'")
+        self._kinds = kinds
+        self._fields = list(fields)
+        self._rebuild(cards)
+
+    def _rebuild(self, cards: Iterable[Card]) -> None:
+        self.cards = list(cards)  # type: List[Card]
+        self.names = [c.name for c in self.cards]  # type: List[str]
+        self._rows = {id(c): i for i, c in enumerate(self.cards)}  # type: Dict[int, int]
+        self.columns = {}  # type: Dict[str, _Column]
+        for field in self._fields:
+            values = [_field_value(c, field) for c in self.cards]
+            kind = self._kinds.get(field) or _detect_kind(values)
+            column = NumericColumn(field) if kind == NUMERIC else CategoricalColumn(field)
+            column.extend(values)
+            self.columns[field] = column
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def _column(self, field: str, kind: Optional[str] = None) -> _Column:
+        column = self.columns.get(field)
+        if column is None:
+            raise ValueError(f"No column '{field}' in this table")
+        if kind is not None and column.kind != kind:
+            raise ValueError(f"Column '{field}' is {column.kind}, not {kind}")
+        return column
+
+    def column(self, field: str) -> Union["array[float]", List[Any]]:
+        """A numeric column's floats (NaN where missing), or a categorical one's
+        values (None where missing), in row order."""
+        column = self._column(field)
+        if isinstance(column, NumericColumn):
+            return column.values
+        values = column.values
+        return [values[c] if c != _MISSING else None for c in column.codes]
+
+    # Numeric statistics, all skipping missing values
+
+    def count(self, field: str) -> int:
+        column = self._column(field)
+        if isinstance(column, NumericColumn):
+            return len(column.present())
+        return len(column.codes) - column.codes.count(_MISSING)
+
+    def sum(self, field: str) -> float:
+        return _aggregate(self._column(field, NUMERIC).present(), "sum")
+
+    def mean(self, field: str) -> float:
+        return _aggregate(self._column(field, NUMERIC).present(), "mean")
+
+    def min(self, field: str) -> float:
+        values = self._column(field, NUMERIC).present()
+        return values[0] if values else math.nan
+
+    def max(self, field: str) -> float:
+        values = self._column(field, NUMERIC).present()
+        return values[-1] if values else math.nan
+
+    def percentile(self, field: str, q: Union[float, Sequence[float]]) -> Union[float, List[float]]:
+        """The q-th percentile (0-100) of field, interpolated linearly as numpy does, or
+        a list of them if q is a sequence."""
+        values = self._column(field, NUMERIC).present()
+        if isinstance(q, (int, float)):
+            return _percentile(values, q)
+        return [_percentile(values, p) for p in q]
+
+    def histogram(
+        self, field: str, bins: int = 10, range: Optional[Tuple[float, float]] = None
+    ) -> Tuple[List[int], List[float]]:
+        """Counts of field's values in bins equal-width bins over range (by default
+        min to max), and the bins+1 edges; the last bin includes its upper edge and
+        values outside range aren't counted."""
+        if bins < 1:
+            raise ValueError(f"Need at least one bin, not {bins}")
+        values = self._column(field, NUMERIC).present()
+        if range is None:
+            lo, hi = (values[0], values[-1]) if values else (0.0, 1.0)
+        else:
+            lo, hi = range
+        if lo == hi:
+            lo, hi = lo - 0.5, hi + 0.5
+        # range is the argument here, hence builtins.range
+        edges = [lo + (hi - lo) * i / bins for i in builtins.range(bins)] + [hi]
+        starts = [bisect_left(values, e) for e in edges]
+        starts[-1] = bisect_right(values, hi)
+        counts = [starts[i + 1] - starts[i] for i in builtins.range(bins)]
+        return (counts, edges)
+
+    def value_counts(self, field: str) -> Dict[Any, int]:
+        """How many rows have each value of a categorical field, most common first."""
+        column = self._column(field, CATEGORICAL)
+        counts = Counter(column.codes)
+        counts.pop(_MISSING, None)
+        return {column.values[code]: n for code, n in counts.most_common()}
+
+    def group_by(self, by: str, field: Optional[str] = None, agg: str = "mean") -> Dict[Any, float]:
+        """agg (count, sum, mean, min, max or median) of numeric field for each value of
+        categorical column by, e.g. group_by("animal_type", "mass_g", "mean"). Without
+        field, counts the rows of each group. Rows missing either value are skipped."""
+        if agg not in _AGGREGATES:
+            raise ValueError(f"Aggregate must be one of {', '.join(_AGGREGATES)}, not '{agg}'")
+        keys = self._column(by, CATEGORICAL)
+        if field is None:
+            return self.value_counts(by)
+        values = self._column(field, NUMERIC).values
+        groups = {}  # type: Dict[int, List[float]]
+        for code, v in zip(keys.codes, values):
+            if v == v and code != _MISSING:
+                group = groups.get(code)
+                if group is None:
+                    groups[code] = [v]
+                else:
+                    group.append(v)
+        return {keys.values[code]: _aggregate(group, agg) for code, group in sorted(groups.items())}
+
+    # Keeping in sync with the set (called through Set's _IndexSet)
+
+    def _add(self, card: Card) -> None:
+        self._rows[id(card)] = len(self.cards)
+        self.cards.append(card)
+        self.names.append(card.name)
+        for field, column in self.columns.items():
+            column.append(_field_value(card, field))
+
+    def _remove(self, card: Card) -> None:
+        row = self._rows.pop(id(card), None)
+        if row is None:
+            return
+        last = len(self.cards) - 1
+        if row != last:
+            moved = self.cards[last]
+            self.cards[row] = moved
+            self.names[row] = self.names[last]
+            self._rows[id(moved)] = row
+        self.cards.pop()
+        self.names.pop()
+        for column in self.columns.values():
+            column.move(last, row)
+
+    def _card_changed(self, card: Card, field: str) -> None:
+        row = self._rows.get(id(card))
+        if row is None:
+            return
+        if field in ("remaining_keys", "_fields"):
+            fields = list(self.columns)
+        else:
+            field = field.lstrip("_")
+            fields = [field] if field in self.columns else []
+            if field == "name":
+                self.names[row] = card.name
+        for f in fields:
+            self.columns[f].set(row, _field_value(card, f))
+
+    # Binary export
+
+    def save(self, path: Union[str, Path]) -> None:
+        """Writes names and every column to a compact binary file: a header, then for
+        each column its name, kind and either little-endian float64s or the distinct
+        values (as strings) and int32 codes. CardTable.load reads it back."""
+        with open(path, "wb") as f:
+            f.write(_FILE_HEADER.pack(_FILE_MAGIC, _FILE_VERSION, len(self), len(self.columns)))
+            _write_strings(f, self.names)
+            for field, column in self.columns.items():
+                _write_strings(f, [field])
+                if isinstance(column, NumericColumn):
+                    f.write(b"d")
+                    f.write(_little_endian(column.values))
+                else:
+                    f.write(b"c")
+                    _write_strings(f, [str(v) for v in column.values])
+                    f.write(_little_endian(column.codes))
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> "CardTable":
+        """A table read back from save, with names and columns but no cards (so it
+        isn't kept in sync with anything)."""
+        with open(path, "rb") as f:
+            data = f.read()
+        try:
+            magic, version, n_rows, n_columns = _FILE_HEADER.unpack_from(data)
+        except struct.error:
+            raise ValueError(f"{path} is not a card table")
+        if magic != _FILE_MAGIC or version != _FILE_VERSION:
+            raise ValueError(f"{path} is not a card table (or from another version of mseutils)")
+        table = cls([], [])
+        pos = _FILE_HEADER.size
+        table.names, pos = _read_strings(data, pos)
+        for _ in range(n_columns):
+            (field,), pos = _read_strings(data, pos)
+            kind = data[pos:pos + 1]
+            pos += 1
+            column = None  # type: Optional[_Column]
+            if kind == b"d":
+                column = NumericColumn(field)
+                column.values, pos = _read_array("d", data, pos, n_rows)
+            elif kind == b"c":
+                column = CategoricalColumn(field)
+                column.values, pos = _read_strings(data, pos)
+                column._codes = {v: i for i, v in enumerate(column.values)}
+                column.codes, pos = _read_array("i", data, pos, n_rows)
+            else:
+                raise ValueError(f"{path} is corrupt (column '{field}')")
+            table.columns[field] = column
+            table._fields.append(field)
+        return table
+
+
+def _little_endian(values: "array[Any]") -> bytes:
+    if sys.byteorder == "big":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _read_array(typecode: str, data: bytes, pos: int, n: int) -> Tuple["array[Any]", int]:
+    values = array(typecode)
+    end = pos + n * values.itemsize
+    values.frombytes(data[pos:end])
+    if sys.byteorder == "big":
+        values.byteswap()
+    return (values, end)
+
+
+def _write_strings(f: Any, strings: List[str]) -> None:
+    encoded = [s.encode("utf-8", "surrogatepass") for s in strings]
+    f.write(struct.pack("<I", len(encoded)))
+    f.write(_little_endian(array("I", [len(b) for b in encoded])))
+    f.write(b"".join(encoded))
+
+
+def _read_strings(data: bytes, pos: int) -> Tuple[List[str], int]:
+    (n,) = struct.unpack_from("<I", data, pos)
+    lengths, pos = _read_array("I", data, pos + 4, n)
+    strings = []  # type: List[str]
+    for length in lengths:
+        strings.append(data[pos:pos + length].decode("utf-8", "surrogatepass"))
+        pos += length
+    return (strings, pos)
@@ -0,0 +1,194 @@
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Mapping, MutableMapping, Optional, Tuple
+from .card import Card, _clear_lists, _lists_changed
+
+
+# Short values ('Bird', 'false', 'art1', '') repeat across cards, long ones rarely do
+_INTERN_MAX_LEN = 32
+
+
+class _CardShape:
+    """One ordered tuple of remaining_keys field names, shared by every CompactCard
+    whose fields come in exactly that order. Shapes are created through a CardSchema
+    and linked by the field appended to get from one to the next, so that cards with
+    the same layout always end up on the same shape object."""
+
+    __slots__ = ("keys", "index", "_next")
+
+    def __init__(self, keys: Tuple[str, ...]) -> None:
+        self.keys = keys
+        self.index = {k: i for i, k in enumerate(keys)}  # type: Dict[str, int]
+        self._next = {}  # type: Dict[str, _CardShape]
+
+
+class CardSchema:
+    """Interned field names, short values and field layouts shared by the CompactCards
+    of one set (or any other group of cards loaded together)."""
+
+    def __init__(self) -> None:
+        self._root = _CardShape(())
+        self._strings = {}  # type: Dict[str, str]
+
+    def intern(self, s: Any) -> Any:
+        """Returns the schema's copy of s if s is a short enough string, else s."""
+        if isinstance(s, str) and len(s) <= _INTERN_MAX_LEN:
+            return self._strings.setdefault(s, s)
+        return s
+
+    def _with_key(self, shape: _CardShape, key: str) -> _CardShape:
+        nxt = shape._next.get(key)
+        if nxt is None:
+            key = self.intern(key)
+            nxt = _CardShape(shape.keys + (key,))
+            shape._next[key] = nxt
+        return nxt
+
+    def _shape_for(self, keys: Any) -> _CardShape:
+        shape = self._root
+        for k in keys:
+            shape = self._with_key(shape, k)
+        return shape
+
+    def new_card(self, **kwargs) -> "CompactCard":
+        """Card factory for this schema, e.g. for _cardify_incoming_types."""
+        return CompactCard(schema=self, **kwargs)
+
+
+class _CompactFields(MutableMapping):
+    """Read/write dict-like view of a CompactCard's remaining_keys."""
+
+    __slots__ = ("_card",)
+
+    def __init__(self, card: "CompactCard") -> None:
+        self._card = card
+
+    def __getitem__(self, key: str) -> Any:
+        card = self._card
+        i = card._shape.index.get(key)
+        if i is None:
+            raise KeyError(key)
+        return card._values[i]
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        card = self._card
+        value = card._schema.intern(value)
+        i = card._shape.index.get(key)
+        if i is None:
+            card._shape = card._schema._with_key(card._shape, key)
+            card._values.append(value)
+        else:
+            card._values[i] = value
+        object.__setattr__(card, "_dirty", True)
+        card._notify(key)
+
+    def __delitem__(self, key: str) -> None:
+        card = self._card
+        i = card._shape.index.get(key)
+        if i is None:
+            raise KeyError(key)
+        keys = card._shape.keys
+        card._shape = card._schema._shape_for(keys[:i] + keys[i + 1:])
+        del card._values[i]
+        object.__setattr__(card, "_dirty", True)
+        card._notify(key)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._card._shape.keys)
+
+    def __len__(self) -> int:
+        return len(self._card._values)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._card._shape.index
+
+    def __repr__(self) -> str:
+        return repr(dict(zip(self._card._shape.keys, self._card._values)))
+
+
+class CompactCard(Card):
+    """Card that stores remaining_keys as a value list laid out by a shared _CardShape,
+    instead of one dict per card. remaining_keys is a read/write view with the same
+    behaviour as the dict an ordinary Card has. Field names and short values are
+    interned in the CardSchema, which sets loaded with compact=True share between all
+    their cards."""
+
+    __slots__ = ("_schema", "_shape", "_values")
+
+    def __init__(self, schema: Optional[CardSchema] = None, **kwargs) -> None:
+        object.__setattr__(self, "_schema", schema if schema is not None else CardSchema())
+        super().__init__(**kwargs)
+        self.has_styling = self._schema.intern(self.has_styling)
+        self.notes = self._schema.intern(self.notes)
+        object.__setattr__(self, "_dirty", False)
+
+    @property
+    def remaining_keys(self) -> MutableMapping[str, Any]:
+        return _CompactFields(self)
+
+    @remaining_keys.setter
+    def remaining_keys(self, value: Mapping[str, Any]) -> None:
+        schema = self._schema
+        object.__setattr__(self, "_shape", schema._shape_for(value.keys()))
+        object.__setattr__(self, "_values", [schema.intern(v) for v in value.values()])
+        object.__setattr__(self, "_dirty", True)
+        self._notify("remaining_keys")
+
+    def _set_listener(self, listener: Optional[Callable[[Card, str], None]]) -> None:
+        object.__setattr__(self, "_listener", listener)
+
+    def _field_items(self) -> Iterable[Tuple[str, Any]]:
+        return zip(self._shape.keys, self._values)
+
+    def __reduce__(self) -> Tuple[Any, ...]:
+        # The schema is pickled once and shared again by every card that used it
+        return (
+            _restore_compact_card,
+            (
+                self._schema,
+                self.has_styling,
+                self.notes,
+                self._time_created,
+                self._time_modified,
+                self.name,
+                self._shape.keys,
+                self._values,
+                self._dirty,
+            ),
+        )
+
+    @property
+    def dirty(self) -> bool:
+        return self._dirty or _lists_changed(self._values)
+
+    def mark_clean(self) -> None:
+        self._dirty = False
+        _clear_lists(self._values)
+
+    @property
+    def schema(self) -> CardSchema:
+        return self._schema
+
+
+def _restore_compact_card(
+    schema: CardSchema,
+    has_styling: Any,
+    notes: Any,
+    time_created: Any,
+    time_modified: Any,
+    name: Any,
+    keys: Tuple[str, ...],
+    values: List[Any],
+    dirty: bool,
+) -> CompactCard:
+    c = object.__new__(CompactCard)
+    setattr_ = object.__setattr__
+    setattr_(c, "_listener", None)
+    setattr_(c, "_schema", schema)
+    setattr_(c, "has_styling", has_styling)
+    setattr_(c, "notes", notes)
+    setattr_(c, "_time_created", time_created)
+    setattr_(c, "_time_modified", time_modified)
+    setattr_(c, "name", name)
+    setattr_(c, "_shape", schema._shape_for(keys))
+    setattr_(c, "_values", values)
+    setattr_(c, "_dirty", dirty)
+    return c
@@ -0,0 +1,228 @@
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+import hashlib
+from .card import Card
+from .compact import CompactCard
+from .set import Set
+
+
+def _card_fields(card: Card) -> Dict[str, Any]:
+    """Every field of card, in setfile order, with time fields as they are stored (so
+    a timestamp nobody touched compares by its original string)."""
+    fields = {
+        "has_styling": card.has_styling,
+        "notes": card.notes,
+        "time_created": card._time_created,
+        "time_modified": card._time_modified,
+        "name": card.name,
+    }  # type: Dict[str, Any]
+    fields.update(card.remaining_keys.items())
+    return fields
+
+
+def _field_str(v: Any) -> str:
+    """Value as it would be written to a setfile, which is what we compare by."""
+    if isinstance(v, datetime):
+        return v.strftime(Card.time_format)
+    return str(v)
+
+
+class _Fingerprint:
+    """A card's fields rendered once, plus a digest of the lot for quick comparison."""
+
+    __slots__ = ("card", "fields", "strs", "digest")
+
+    def __init__(self, card: Card) -> None:
+        self.card = card
+        self.fields = _card_fields(card)
+        self.strs = {k: _field_str(v) for k, v in self.fields.items()}
+        h = hashlib.blake2b(digest_size=16)
+        for k, v in self.strs.items():
+            h.update(f"{k}\x00{v}\x01".encode("utf-8", "surrogatepass"))
+        self.digest = h.digest()
+
+
+def card_fingerprint(card: Card) -> bytes:
+    """Digest of everything that would be written out for card, field order included.
+    Two cards have the same fingerprint exactly when is_identical_to would hold
+    (give or take a datetime vs. the same time as a string)."""
+    return _Fingerprint(card).digest
+
+
+def _fingerprints(s: Set) -> Dict[str, _Fingerprint]:
+    return {k: _Fingerprint(v) for k, v in s.all_data.items() if isinstance(v, Card)}
+
+
+def _field_deltas(old: _Fingerprint, new: _Fingerprint) -> Dict[str, Tuple[Optional[str], Optional[str]]]:
+    """{field: (old value, new value)} for every field that differs; None stands for a
+    field that isn't there."""
+    deltas = {}
+    for k in list(old.strs) + [k for k in new.strs if k not in old.strs]:
+        o = old.strs.get(k)
+        n = new.strs.get(k)
+        if o != n:
+            deltas[k] = (o, n)
+    return deltas
+
+
+class SetDiff:
+    """Differences between two versions of a set. Cards are matched by their all_data
+    key (i.e. name); changed maps each card that is in both but differs to its
+    per-field deltas. blocks_changed lists other top-level keys (game, styling, ...)
+    that were added, removed or changed."""
+
+    def __init__(self) -> None:
+        self.added = []  # type: List[Card]
+        self.removed = []  # type: List[Card]
+        self.changed = {}  # type: Dict[str, Dict[str, Tuple[Optional[str], Optional[str]]]]
+        self.blocks_changed = []  # type: List[str]
+
+    def __bool__(self) -> bool:
+        return bool(self.added or self.removed or self.changed or self.blocks_changed)
+
+    def __repr__(self) -> str:
+        return (
+            f"SetDiff(added={[c.name for c in self.added]}, removed={[c.name for c in self.removed]}, "
+            f"changed={list(self.changed)}, blocks_changed={self.blocks_changed})"
+        )
+
+
+def diff_sets(old: Set, new: Set) -> SetDiff:
+    """Compares two sets in time linear in their size: each card is fingerprinted once
+    and only cards with differing fingerprints are compared field by field."""
+    d = SetDiff()
+    old_prints = _fingerprints(old)
+    new_prints = _fingerprints(new)
+    for k, fp in new_prints.items():
+        old_fp = old_prints.get(k)
+        if old_fp is None:
+            d.added.append(fp.card)
+        elif old_fp.digest != fp.digest:
+            d.changed[k] = _field_deltas(old_fp, fp)
+    d.removed = [fp.card for k, fp in old_prints.items() if k not in new_prints]
+    for k in list(old.all_data) + [k for k in new.all_data if k not in old.all_data]:
+        if k in old_prints or k in new_prints:
+            continue
+        if k not in old.all_data or k not in new.all_data or old.all_data[k] != new.all_data[k]:
+            d.blocks_changed.append(k)
+    return d
+
+
+class MergeConflict:
+    """Both sides changed the same thing differently. field is None for conflicts over
+    a whole top-level block or card (e.g. one side edited a card the other deleted).
+    Values are as written to a setfile, None meaning absent; the merge keeps ours."""
+
+    def __init__(
+        self, key: str, field: Optional[str], base: Optional[str], ours: Optional[str], theirs: Optional[str]
+    ) -> None:
+        self.key = key
+        self.field = field
+        self.base = base
+        self.ours = ours
+        self.theirs = theirs
+
+    def __repr__(self) -> str:
+        where = self.key if self.field is None else f"{self.key}.{self.field}"
+        return f"MergeConflict({where}: base={self.base!r}, ours={self.ours!r}, theirs={self.theirs!r})"
+
+
+def _rebuild_card(like: Card, fields: Dict[str, Any]) -> Card:
+    if isinstance(like, CompactCard):
+        return like.schema.new_card(**fields)
+    return Card(**fields)
+
+
+def _merge_cards(
+    key: str,
+    base: Optional[_Fingerprint],
+    ours: _Fingerprint,
+    theirs: _Fingerprint,
+    conflicts: List[MergeConflict],
+) -> Card:
+    """Field-by-field three-way merge of a card both sides changed."""
+    base_strs = base.strs if base is not None else {}
+    merged = {}  # type: Dict[str, Any]
+    for k in list(ours.fields) + [k for k in theirs.fields if k not in ours.fields]:
+        b, o, t = base_strs.get(k), ours.strs.get(k), theirs.strs.get(k)
+        if o == t or t == b:
+            value = ours.fields.get(k)
+            present = o is not None
+        elif o == b:
+            value = theirs.fields.get(k)
+            present = t is not None
+        else:
+            conflicts.append(MergeConflict(key, k, b, o, t))
+            value = ours.fields.get(k)
+            present = o is not None
+        if present:
+            merged[k] = value
+    return _rebuild_card(ours.card, merged)
+
+
+class MergeResult:
+    """Outcome of merge_sets: the merged Set, plus every conflict that was resolved by
+    keeping our side."""
+
+    def __init__(self, merged: Set, conflicts: List[MergeConflict]) -> None:
+        self.set = merged
+        self.conflicts = conflicts
+
+    @property
+    def clean(self) -> bool:
+        return len(self.conflicts) == 0
+
+
+def merge_sets(base: Set, ours: Set, theirs: Set) -> MergeResult:
+    """Three-way merge of two edited copies of a set against their common ancestor.
+    Anything changed on one side only is taken from that side; cards changed on both
+    sides are merged field by field. Keys keep our order, with keys only they added
+    appended in their order. Cards that didn't need merging are the same objects as
+    in ours or theirs, not copies."""
+    base_prints = _fingerprints(base)
+    our_prints = _fingerprints(ours)
+    their_prints = _fingerprints(theirs)
+    conflicts = []  # type: List[MergeConflict]
+    merged = {}  # type: Dict[str, Any]
+
+    def block_key(s: Set, prints: Dict[str, _Fingerprint], k: str) -> Optional[str]:
+        """Something equal for equal blocks: card fingerprint, or the value's repr."""
+        if k not in s.all_data:
+            return None
+        fp = prints.get(k)
+        return repr(fp.digest) if fp is not None else repr(s.all_data[k])
+
+    keys = list(ours.all_data) + [k for k in theirs.all_data if k not in ours.all_data]
+    # Keys both sides deleted never show up in keys, so they stay deleted
+    for k in keys:
+        b = block_key(base, base_prints, k)
+        o = block_key(ours, our_prints, k)
+        t = block_key(theirs, their_prints, k)
+        if o == t or t == b:
+            if o is not None:
+                merged[k] = ours.all_data[k]
+        elif o == b:
+            if t is not None:
+                merged[k] = theirs.all_data[k]
+        elif k in our_prints and k in their_prints:
+            merged[k] = _merge_cards(k, base_prints.get(k), our_prints[k], their_prints[k], conflicts)
+        else:
+            # One side deleted what the other changed, or a non-card block changed on
+            # both sides
+            conflicts.append(
+                MergeConflict(
+                    k, None, _block_text(base, k), _block_text(ours, k), _block_text(theirs, k)
+                )
+            )
+            if o is not None:
+                merged[k] = ours.all_data[k]
+    return MergeResult(Set(all_data=merged, members=dict(ours.members)), conflicts)
+
+
+def _block_text(s: Set, k: str) -> Optional[str]:
+    if k not in s.all_data:
+        return None
+    v = s.all_data[k]
+    if isinstance(v, Card):
+        return "\n".join(v.to_setfile_strs())
+    return _field_str(v)
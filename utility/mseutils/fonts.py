@@ -0,0 +1,422 @@
+"""Which font files provide the fonts that MSE styles use.
+
+Usage: python -m mseutils fonts [--fonts DIR] [--index PATH] [--copy DEST] PATH [PATH ...]
+
+PATHs are .mse-style folders, or .mse-game folders (meaning every style for that
+game in the same folder). Prints each font the styles name and the file that
+provides it, exiting with 1 if any is missing; --copy puts those files (only) in
+DEST, in the same subfolders as under --fonts (two games' fonts may well share a
+file name), to install them on a machine that renders cards.
+
+Styles name fonts by family ("Cardenio Modern"), while the files under
+"Other - Fonts" are named anything. FontIndex reads the name table of every
+TrueType/OpenType file (and collection) and the header of every Type 1 .pfb, memory
+mapped so that only the few pages holding them are read, and keeps the result in a
+JSON file. Opening the index again only re-reads the files whose modification time
+or size changed.
+"""
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set as PySet, Tuple, Union
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import re
+import shutil
+import struct
+from .assets import _write_atomic
+from .cache import _default_directory
+
+
+FONT_DIR = Path(__file__).resolve().parent.parent.parent / "Other - Fonts"
+FONT_SUFFIXES = (".ttf", ".otf", ".ttc", ".otc", ".pfb")
+_INDEX_VERSION = 1
+
+# Name IDs in the name table
+_FAMILY, _SUBFAMILY, _FULL_NAME, _POSTSCRIPT_NAME, _TYPOGRAPHIC_FAMILY = 1, 2, 4, 6, 16
+
+
+class FontFace:
+    """One font in a file (a collection holds several, told apart by index). Any of
+    its names finds it: family is what Windows and MSE call it ("Futura LtCn BT"),
+    typographic_family groups weights that family splits up ("Futura")."""
+
+    __slots__ = (
+        "path", "index", "family", "style", "full_name", "postscript_name", "typographic_family", "bold", "italic"
+    )
+
+    def __init__(
+        self,
+        path: str,
+        index: int,
+        family: str,
+        style: str,
+        full_name: str = "",
+        postscript_name: str = "",
+        typographic_family: str = "",
+        bold: bool = False,
+        italic: bool = False,
+    ) -> None:
+        self.path = path  # relative to the indexed folder, with forward slashes
+        self.index = index
+        self.family = family
+        self.style = style
+        self.full_name = full_name
+        self.postscript_name = postscript_name
+        self.typographic_family = typographic_family
+        self.bold = bold
+        self.italic = italic
+
+    def names(self) -> List[str]:
+        return [n for n in (self.family, self.full_name, self.postscript_name, self.typographic_family) if n]
+
+    def as_list(self) -> List[Any]:
+        return [getattr(self, name) for name in self.__slots__]
+
+    def __repr__(self) -> str:
+        return f"FontFace({self.family!r}, {self.style!r}, {self.path!r})"
+
+
+def _decode_name(platform: int, encoding: int, raw: bytes) -> Optional[str]:
+    if platform == 0 or platform == 3 and encoding in (0, 1, 10):
+        return raw.decode("utf-16-be", "replace")
+    if platform == 1 and encoding == 0:
+        return raw.decode("mac_roman", "replace")
+    return None
+
+
+def _read_names(data: Any, table: int) -> Dict[int, str]:
+    """The name table at offset table: {name ID: name}, preferring Windows English,
+    then any English, then whatever there is."""
+    _, count, strings = struct.unpack_from(">HHH", data, table)
+    best = {}  # type: Dict[int, Tuple[int, str]]
+    for i in range(count):
+        platform, encoding, language, name_id, length, offset = struct.unpack_from(">6H", data, table + 6 + 12 * i)
+        if name_id not in (_FAMILY, _SUBFAMILY, _FULL_NAME, _POSTSCRIPT_NAME, _TYPOGRAPHIC_FAMILY):
+            continue
+        if platform == 3 and language == 0x409:
+            rank = 3
+        elif platform == 1 and language == 0 or platform == 0:
+            rank = 2
+        else:
+            rank = 1
+        if name_id in best and best[name_id][0] >= rank:
+            continue
+        start = table + strings + offset
+        name = _decode_name(platform, encoding, bytes(data[start:start + length]))
+        if name:
+            best[name_id] = (rank, name.strip("\x00 "))
+    return {name_id: name for name_id, (_, name) in best.items()}
+
+
+def _read_sfnt(data: Any, offset: int, path: str, index: int) -> Optional[FontFace]:
+    """The face whose table directory is at offset (0, or from a collection header)."""
+    tag, n_tables = struct.unpack_from(">4sH", data, offset)
+    if tag not in (b"\x00\x01\x00\x00", b"OTTO", b"true", b"typ1"):
+        return None
+    tables = {}  # type: Dict[bytes, int]
+    for i in range(n_tables):
+        table_tag, _, table_offset, _ = struct.unpack_from(">4sIII", data, offset + 12 + 16 * i)
+        tables[table_tag] = table_offset
+    if b"name" not in tables:
+        return None
+    names = _read_names(data, tables[b"name"])
+    if _FAMILY not in names:
+        return None
+    style = names.get(_SUBFAMILY, "Regular")
+    bold, italic = "bold" in style.lower(), "italic" in style.lower() or "oblique" in style.lower()
+    if b"head" in tables:
+        (mac_style,) = struct.unpack_from(">H", data, tables[b"head"] + 44)
+        bold, italic = bold or bool(mac_style & 1), italic or bool(mac_style & 2)
+    return FontFace(
+        path,
+        index,
+        names[_FAMILY],
+        style,
+        names.get(_FULL_NAME, ""),
+        names.get(_POSTSCRIPT_NAME, ""),
+        names.get(_TYPOGRAPHIC_FAMILY, ""),
+        bold,
+        italic,
+    )
+
+
+_re_type1_key = re.compile(rb"/(FamilyName|FullName|FontName|Weight|ItalicAngle)\s*(?:\(([^)]*)\)|/?(\S+))")
+
+
+def _read_pfb(data: Any, path: str) -> List[FontFace]:
+    """A Type 1 font: the names are in the cleartext first segment."""
+    if data[0] != 0x80 or data[1] != 1:
+        return []
+    (length,) = struct.unpack_from("<I", data, 2)
+    header = bytes(data[6:6 + min(length, 16384)])
+    keys = {
+        m.group(1).decode("ascii"): (m.group(2) or m.group(3)).decode("latin-1")
+        for m in _re_type1_key.finditer(header)
+    }
+    if "FamilyName" not in keys:
+        return []
+    weight = keys.get("Weight", "Regular")
+    italic = keys.get("ItalicAngle", "0") not in ("0", "0.0")
+    style = "Regular" if weight in ("Medium", "Roman", "Book") else weight
+    if italic:
+        style = "Italic" if style == "Regular" else f"{style} Italic"
+    return [
+        FontFace(
+            path,
+            0,
+            keys["FamilyName"],
+            style,
+            keys.get("FullName", ""),
+            keys.get("FontName", ""),
+            "",
+            weight.lower() in ("bold", "black", "heavy", "extrabold", "semibold", "demi", "demibold"),
+            italic,
+        )
+    ]
+
+
+def read_faces(path: Union[str, Path], name: Optional[str] = None) -> List[FontFace]:
+    """The faces in the font file at path (under the relative name, if given).
+    Files that aren't fonts, or are damaged, have none."""
+    path = Path(path)
+    name = path.name if name is None else name
+    try:
+        with open(path, "rb") as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):  # unreadable, or empty
+        return []
+    try:
+        if path.suffix.lower() == ".pfb":
+            return _read_pfb(data, name)
+        if data[:4] == b"ttcf":
+            (n_fonts,) = struct.unpack_from(">I", data, 8)
+            offsets = struct.unpack_from(f">{n_fonts}I", data, 12)
+            faces = (_read_sfnt(data, offset, name, i) for i, offset in enumerate(offsets))
+            return [face for face in faces if face is not None]
+        face = _read_sfnt(data, 0, name, 0)
+        return [face] if face is not None else []
+    except (struct.error, IndexError):
+        return []
+    finally:
+        data.close()
+
+
+def _default_index_path(root: Path) -> Path:
+    key = hashlib.blake2b(str(root.resolve()).encode("utf-8", "surrogatepass"), digest_size=8).hexdigest()
+    return _default_directory() / "fonts" / f"{root.name}-{key}.json"
+
+
+class FontIndex:
+    """The faces of every font file under root, by name:
+
+        fonts = FontIndex.open("Other - Fonts")
+        fonts.find("Cardenio Modern", bold=True)    # FontFace(... 'Wingspan/CardenioModern-Bold.otf')
+
+    The index is kept in index_path (by default in the mseutils cache directory),
+    with the modification time and size of each file it was read from; open() and
+    refresh() re-read just the files that changed, and forget deleted ones.
+    """
+
+    def __init__(self, root: Union[str, Path], index_path: Optional[Union[str, Path]] = None) -> None:
+        self.root = Path(root)
+        self.index_path = Path(index_path) if index_path is not None else _default_index_path(self.root)
+        self._files = {}  # type: Dict[str, Tuple[int, int, List[FontFace]]]  # path: mtime, size, faces
+        self._by_name = {}  # type: Dict[str, List[FontFace]]
+
+    @classmethod
+    def open(cls, root: Union[str, Path] = FONT_DIR, index_path: Optional[Union[str, Path]] = None) -> "FontIndex":
+        """The index of root, loaded from index_path and brought up to date."""
+        index = cls(root, index_path)
+        index._load()
+        if index.refresh():
+            index.save()
+        return index
+
+    def _load(self) -> None:
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return
+        if saved.get("version") != _INDEX_VERSION:
+            return
+        self._files = {
+            path: (mtime, size, [FontFace(*face) for face in faces])
+            for path, (mtime, size, faces) in saved["files"].items()
+        }
+        self._rebuild()
+
+    def save(self) -> None:
+        files = {
+            path: [mtime, size, [face.as_list() for face in faces]] for path, (mtime, size, faces) in self._files.items()
+        }
+        data = {"version": _INDEX_VERSION, "root": str(self.root.resolve()), "files": files}
+        _write_atomic(self.index_path, json.dumps(data, ensure_ascii=False, indent=0).encode("utf-8"))
+
+    def _scan(self) -> Iterator[Tuple[str, Path, os.stat_result]]:
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                if filename.lower().endswith(FONT_SUFFIXES):
+                    path = Path(dirpath) / filename
+                    yield (path.relative_to(self.root).as_posix(), path, path.stat())
+
+    def refresh(self) -> bool:
+        """Re-reads new and changed files and drops deleted ones; returns whether
+        anything changed. Walks root and stats every font file, but only reads the
+        ones whose modification time or size changed."""
+        seen = set()  # type: PySet[str]
+        changed = False
+        for name, path, st in self._scan():
+            seen.add(name)
+            known = self._files.get(name)
+            if known is not None and known[0] == st.st_mtime_ns and known[1] == st.st_size:
+                continue
+            self._files[name] = (st.st_mtime_ns, st.st_size, read_faces(path, name))
+            changed = True
+        for name in set(self._files) - seen:
+            del self._files[name]
+            changed = True
+        if changed:
+            self._rebuild()
+        return changed
+
+    def _rebuild(self) -> None:
+        self._by_name = {}
+        for name in sorted(self._files):
+            for face in self._files[name][2]:
+                for face_name in set(n.casefold() for n in face.names()):
+                    self._by_name.setdefault(face_name, []).append(face)
+
+    def __len__(self) -> int:
+        return sum(len(faces) for _, _, faces in self._files.values())
+
+    def __iter__(self) -> Iterator[FontFace]:
+        for name in sorted(self._files):
+            yield from self._files[name][2]
+
+    def faces(self, name: str) -> List[FontFace]:
+        """Every face with name as its family, full, PostScript or typographic family
+        name (case doesn't matter), in path order."""
+        return self._by_name.get(name.casefold(), [])
+
+    def find(self, name: str, bold: bool = False, italic: bool = False) -> Optional[FontFace]:
+        """The face of name best matching bold and italic, as a font dialog would pick
+        it: an exact match, else the same weight, else the first face."""
+        faces = self.faces(name)
+        if not faces:
+            return None
+        for face in faces:
+            if face.bold == bold and face.italic == italic:
+                return face
+        for face in faces:
+            if face.bold == bold:
+                return face
+        return faces[0]
+
+    def path(self, face: FontFace) -> Path:
+        return self.root / face.path
+
+
+# "font:" blocks of a style, with their name, italic name and weight; symbol fonts
+# are MSE's own (.mse-symbol-font) and aren't looked for.
+_re_font_block = re.compile(r"^(\t+)font:\n((?:\1\t.*\n?)*)", re.MULTILINE)
+_re_font_key = re.compile(r"^\t+(name|italic name|weight|style):[ \t]*(.*?)\s*$", re.MULTILINE)
+
+
+class FontUse:
+    """A font a style uses: the name (as written), whether bold and/or italic, and
+    which styles use it."""
+
+    def __init__(self, name: str, bold: bool, italic: bool) -> None:
+        self.name = name
+        self.bold = bold
+        self.italic = italic
+        self.styles = []  # type: List[str]
+
+    def __repr__(self) -> str:
+        return f"FontUse({self.name!r}, bold={self.bold}, italic={self.italic})"
+
+
+def style_fonts(styles: Iterable[Union[str, Path]]) -> List[FontUse]:
+    """The fonts the .mse-style folders name in their 'style' file, once each (names
+    that are scripts, like "{ font_name() }", can't be known before rendering and are
+    left out)."""
+    uses = {}  # type: Dict[Tuple[str, bool, bool], FontUse]
+    for style in styles:
+        style = Path(style)
+        text = (style / "style").read_text(encoding="utf-8-sig")
+        for m in _re_font_block.finditer(text):
+            keys = dict(_re_font_key.findall(m.group(2)))
+            bold = keys.get("weight", "").lower() == "bold"
+            italic = keys.get("style", "").lower() == "italic"
+            wanted = [(keys.get("name", ""), bold, italic)]
+            if keys.get("italic name"):
+                wanted.append((keys["italic name"], bold, True))
+            for name, bold, italic in wanted:
+                if not name or name.startswith("{"):
+                    continue
+                use = uses.get((name.casefold(), bold, italic))
+                if use is None:
+                    use = uses[(name.casefold(), bold, italic)] = FontUse(name, bold, italic)
+                if style.name not in use.styles:
+                    use.styles.append(style.name)
+    return list(uses.values())
+
+
+def game_styles(game: Union[str, Path]) -> List[Path]:
+    """The .mse-style folders next to the .mse-game folder game that are for it."""
+    game = Path(game)
+    name = game.name[:-len(".mse-game")].casefold()
+    found = []  # type: List[Path]
+    for style in sorted(game.parent.glob("*.mse-style")):
+        try:
+            text = (style / "style").read_text(encoding="utf-8-sig")
+        except OSError:
+            continue
+        m = re.search(r"^game:[ \t]*(.*?)\s*$", text, re.MULTILINE)
+        if m is not None and m.group(1).casefold() == name:
+            found.append(style)
+    return found
+
+
+def resolve(index: FontIndex, styles: Iterable[Union[str, Path]]) -> List[Tuple[FontUse, Optional[FontFace]]]:
+    """Each font the styles use, with the face that provides it (None if none does)."""
+    return [(use, index.find(use.name, use.bold, use.italic)) for use in style_fonts(styles)]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="mseutils fonts", description="Find the font files styles need.")
+    parser.add_argument("paths", type=Path, nargs="+", help=".mse-style or .mse-game folders")
+    parser.add_argument("--fonts", type=Path, default=FONT_DIR, help="folder of font files (default: Other - Fonts)")
+    parser.add_argument("--index", type=Path, help="where to keep the index (default: in the mseutils cache)")
+    parser.add_argument(
+        "--copy", type=Path, metavar="DEST", help="copy the font files needed to DEST, keeping their subfolders"
+    )
+    args = parser.parse_args(argv)
+
+    styles = []  # type: List[Path]
+    for path in args.paths:
+        styles.extend(game_styles(path) if path.name.endswith(".mse-game") else [path])
+    index = FontIndex.open(args.fonts, args.index)
+    missing = 0
+    needed = []  # type: List[FontFace]
+    for use, face in resolve(index, styles):
+        variant = " ".join(s for s in ("bold" if use.bold else "", "italic" if use.italic else "") if s)
+        label = f"{use.name} ({variant})" if variant else use.name
+        if face is None:
+            print(f"{label}: missing (used by {', '.join(use.styles)})")
+            missing += 1
+            continue
+        print(f"{label}: {face.path}")
+        if face not in needed:
+            needed.append(face)
+    if args.copy is not None:
+        for face in needed:
+            target = args.copy / face.path
+            if not target.exists() or target.stat().st_size != index.path(face).stat().st_size:
+                target.parent.mkdir(parents=True, exist_ok=True)
+                shutil.copy2(index.path(face), target)
+    return 1 if missing else 0
@@ -0,0 +1,282 @@
+"""Revision history of .mse-set files, instead of one full .bak copy each.
+
+Usage: python -m mseutils history record SET [-m MESSAGE]
+       python -m mseutils history log SET
+       python -m mseutils history restore SET [-r REVISION] [-o OUT]
+
+The history of sets/foo.mse-set lives in sets/.history/foo/:
+
+    packs/000001.pack      top-level blocks of the 'set' text first seen in revision 1
+    objects/ab/ab12...     each distinct image (etc.) member, stored once (an AssetStore)
+    revisions/000001.json  what revision 1 is made of
+
+A revision lists its blocks as runs of consecutive blocks from the packs, so one
+edited card among thousands costs a pack with that card and a few more runs, and
+its members by content hash. Disk use grows with the edits, not with the size
+of the set times the number of revisions. Histories can share one AssetStore
+instead, so that art common to several sets is stored once between them.
+"""
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple, Union
+from zipfile import ZipFile
+import argparse
+import io
+import json
+import struct
+import sys
+import zlib
+from .assets import AssetStore, _digest, _write_atomic
+from .offsets import _split_text_blocks
+from .package import SETFILE_MEMBER, PackageMember, _open_setfile_member, _write_package
+from .set import Set
+
+
+HISTORY_DIR = ".history"
+_PACK_MAGIC = b"MSEp"
+_PACK_HEADER = struct.Struct("<4sI")  # magic, number of blocks
+
+_Run = List[int]  # [pack, first block, number of blocks]
+
+
+def _pack(blocks: List[bytes]) -> bytes:
+    """Blocks (UTF-8) as one zlib stream: a header, their lengths, then the blocks."""
+    lengths = struct.pack(f"<{len(blocks)}I", *(len(b) for b in blocks))
+    return zlib.compress(_PACK_HEADER.pack(_PACK_MAGIC, len(blocks)) + lengths + b"".join(blocks))
+
+
+def _unpack(data: bytes) -> List[str]:
+    raw = zlib.decompress(data)
+    magic, n = _PACK_HEADER.unpack_from(raw)
+    if magic != _PACK_MAGIC:
+        raise ValueError("Not a history pack")
+    lengths = struct.unpack_from(f"<{n}I", raw, _PACK_HEADER.size)
+    pos = _PACK_HEADER.size + 4 * n
+    blocks = []  # type: List[str]
+    for length in lengths:
+        blocks.append(raw[pos:pos + length].decode("utf-8", "surrogatepass"))
+        pos += length
+    return blocks
+
+
+class Revision:
+    """One recorded version of a set. runs says which blocks make up its 'set' text;
+    members maps each other member's name to [content hash, CRC, size]."""
+
+    def __init__(
+        self,
+        number: int,
+        time: str,
+        message: str,
+        runs: List[_Run],
+        members: Dict[str, List[Any]],
+        setfile: List[int],
+    ) -> None:
+        self.number = number
+        self.time = time
+        self.message = message
+        self.runs = runs
+        self.members = members
+        self.setfile = setfile  # [CRC, size] of the 'set' member it was recorded from
+
+    @property
+    def blocks(self) -> int:
+        return sum(run[2] for run in self.runs)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return dict(vars(self))
+
+    def __repr__(self) -> str:
+        return f"Revision({self.number}, {self.time!r}, {self.blocks} blocks, {len(self.members)} members)"
+
+
+class SetHistory:
+    """The revisions of one .mse-set file. record() adds the file as it is now (MSE's
+    .bak does the same, once); text, load and restore get any revision back.
+
+        history = SetHistory.for_set("sets/thistle-again.mse-set")
+        history.record("sets/thistle-again.mse-set")
+        history.restore("sets/thistle-again.mse-set", revision=3)
+    """
+
+    def __init__(self, directory: Union[str, Path], assets: Optional[AssetStore] = None) -> None:
+        self.directory = Path(directory)
+        self.assets = assets if assets is not None else AssetStore(self.directory / "objects")
+        self._packs = {}  # type: Dict[int, List[str]]  # packs already read, by number
+
+    @classmethod
+    def for_set(cls, path: Union[str, Path], assets: Optional[AssetStore] = None) -> "SetHistory":
+        """The history kept for path, in .history/<its stem> next to it (not
+        .history/<its name>, which 'mseutils load' would take for a set)."""
+        path = Path(path)
+        return cls(path.parent / HISTORY_DIR / path.stem, assets)
+
+    def _revision_path(self, number: int) -> Path:
+        return self.directory / "revisions" / f"{number:06d}.json"
+
+    def _pack_path(self, number: int) -> Path:
+        return self.directory / "packs" / f"{number:06d}.pack"
+
+    def revisions(self) -> List[Revision]:
+        """Every revision, oldest first."""
+        try:
+            names = sorted(p.name for p in (self.directory / "revisions").iterdir() if p.suffix == ".json")
+        except FileNotFoundError:
+            return []
+        return [self.revision(int(name[:-5])) for name in names]
+
+    def revision(self, number: int) -> Revision:
+        try:
+            with open(self._revision_path(number), "r", encoding="utf-8") as f:
+                return Revision(**json.load(f))
+        except FileNotFoundError:
+            raise ValueError(f"No revision {number} in {self.directory}")
+
+    def latest(self) -> Optional[Revision]:
+        try:
+            names = [p.name for p in (self.directory / "revisions").iterdir() if p.suffix == ".json"]
+        except FileNotFoundError:
+            return None
+        return self.revision(int(max(names)[:-5])) if names else None
+
+    def _resolve(self, revision: Union[None, int, Revision]) -> Revision:
+        if isinstance(revision, Revision):
+            return revision
+        if revision is None:
+            latest = self.latest()
+            if latest is None:
+                raise ValueError(f"No revisions in {self.directory}")
+            return latest
+        return self.revision(revision)
+
+    def _read_pack(self, number: int) -> List[str]:
+        blocks = self._packs.get(number)
+        if blocks is None:
+            with open(self._pack_path(number), "rb") as f:
+                blocks = self._packs[number] = _unpack(f.read())
+        return blocks
+
+    def _blocks(self, revision: Revision) -> List[Tuple[str, int, int]]:
+        """(text, pack, index in pack) of every block of revision, in order."""
+        blocks = []  # type: List[Tuple[str, int, int]]
+        for pack, first, count in revision.runs:
+            texts = self._read_pack(pack)
+            blocks.extend((texts[i], pack, i) for i in range(first, first + count))
+        return blocks
+
+    def text(self, revision: Union[None, int, Revision] = None) -> str:
+        """The 'set' text of revision (by default the latest)."""
+        revision = self._resolve(revision)
+        return "".join(
+            "".join(self._read_pack(pack)[first:first + count]) for pack, first, count in revision.runs
+        )
+
+    def members(self, revision: Union[None, int, Revision] = None) -> Dict[str, PackageMember]:
+        """The other members of revision as lazy handles on the stored objects."""
+        revision = self._resolve(revision)
+        return {name: self.assets.member(digest) for name, (digest, _, _) in revision.members.items()}
+
+    def load(self, revision: Union[None, int, Revision] = None) -> Set:
+        """revision as a Set, as Set.from_packagefile would have loaded it."""
+        revision = self._resolve(revision)
+        s = Set.from_setfile(io.StringIO(self.text(revision)), cache=False)
+        s.members = self.members(revision)
+        return s
+
+    def restore(self, path: Union[str, Path], revision: Union[None, int, Revision] = None) -> None:
+        """Writes revision out as a .mse-set at path (atomically, so path may be the set
+        itself). Members are copied still compressed."""
+        revision = self._resolve(revision)
+        _write_package(Path(path), self.text(revision), self.members(revision))
+
+    def record(self, path: Union[str, Path], message: str = "") -> Optional[Revision]:
+        """Adds the .mse-set at path as a new revision, storing only the blocks of its
+        'set' text and the members that the latest revision doesn't already have.
+        Returns None (and records nothing) if the file hasn't changed since. A
+        member is only read to hash it if its name, CRC or size changed."""
+        path = Path(path)
+        latest = self.latest()
+        with ZipFile(path, "r") as zip_ref:
+            set_info = zip_ref.getinfo(SETFILE_MEMBER)
+            setfile = [set_info.CRC, set_info.file_size]
+            infos = [info for info in zip_ref.infolist() if info.filename != SETFILE_MEMBER and not info.is_dir()]
+            if latest is not None and latest.setfile == setfile and {
+                info.filename: [info.CRC, info.file_size] for info in infos
+            } == {name: m[1:] for name, m in latest.members.items()}:
+                return None
+            with _open_setfile_member(zip_ref, path) as ifile:
+                source = ifile.read()
+            members = {}  # type: Dict[str, List[Any]]
+            for info in infos:
+                old = latest.members.get(info.filename) if latest is not None else None
+                if old is not None and old[1:] == [info.CRC, info.file_size]:
+                    digest = old[0]
+                else:
+                    digest = self.assets.add_member(PackageMember(path, info))
+                members[info.filename] = [digest, info.CRC, info.file_size]
+
+        number = latest.number + 1 if latest is not None else 1
+        known = {}  # type: Dict[str, Tuple[int, int]]
+        if latest is not None:
+            for text, pack, index in self._blocks(latest):
+                known.setdefault(_digest(text.encode("utf-8", "surrogatepass")), (pack, index))
+        new_blocks = []  # type: List[bytes]
+        runs = []  # type: List[_Run]
+        for start, end in _split_text_blocks(source) if source else []:
+            data = source[start:end].encode("utf-8", "surrogatepass")
+            digest = _digest(data)
+            where = known.get(digest)
+            if where is None:
+                where = known[digest] = (number, len(new_blocks))
+                new_blocks.append(data)
+            pack, index = where
+            if runs and runs[-1][0] == pack and runs[-1][1] + runs[-1][2] == index:
+                runs[-1][2] += 1
+            else:
+                runs.append([pack, index, 1])
+        if new_blocks:
+            _write_atomic(self._pack_path(number), _pack(new_blocks))
+        revision = Revision(
+            number, datetime.now().isoformat(timespec="seconds"), message, runs, members, setfile
+        )
+        # The revision file goes last: until it exists, nothing refers to the rest
+        _write_atomic(
+            self._revision_path(number),
+            json.dumps(revision.as_dict(), ensure_ascii=False, separators=(",", ":")).encode("utf-8"),
+        )
+        return revision
+
+    def disk_usage(self) -> int:
+        """Bytes the whole history takes up."""
+        return sum(p.stat().st_size for p in self.directory.rglob("*") if p.is_file())
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="mseutils history", description="Revision history of .mse-set files.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    record = commands.add_parser("record", help="record the set as it is now")
+    record.add_argument("set", type=Path)
+    record.add_argument("-m", "--message", default="")
+    log = commands.add_parser("log", help="list the recorded revisions")
+    log.add_argument("set", type=Path)
+    restore = commands.add_parser("restore", help="write out a recorded revision")
+    restore.add_argument("set", type=Path)
+    restore.add_argument("-r", "--revision", type=int, help="revision number (default: latest)")
+    restore.add_argument("-o", "--output", type=Path, help="where to write it (default: over the set)")
+    args = parser.parse_args(argv)
+
+    history = SetHistory.for_set(args.set)
+    try:
+        if args.command == "record":
+            revision = history.record(args.set, args.message)
+            print("unchanged" if revision is None else f"recorded revision {revision.number}")
+        elif args.command == "log":
+            for revision in history.revisions():
+                print(f"{revision.number:>6}  {revision.time}  {revision.blocks} blocks  {revision.message}")
+            print(f"{history.disk_usage()} bytes in {history.directory}")
+        else:
+            history.restore(args.output or args.set, args.revision)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+    return 0
@@ -0,0 +1,275 @@
+from bisect import bisect_left, bisect_right
+from math import isfinite
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from .card import Card
+
+
+# Fields every Card has as attributes rather than in remaining_keys
+_CARD_ATTRIBUTES = ("has_styling", "notes", "time_created", "time_modified", "name")
+
+
+def _field_value(card: Card, field: str) -> Any:
+    if field in _CARD_ATTRIBUTES:
+        return getattr(card, field)
+    return card.remaining_keys.get(field)
+
+
+def _hash_key(v: Any) -> Any:
+    """Setfile values are mostly strings, but people will ask for trophic_tier=3, so
+    numbers, and strings that are numbers, are looked up by one canonical form
+    ("3", "3.0" and 3 are the same key, as they are to a scan). Returns None for
+    values that can't be indexed (missing, or unhashable like 'rule text' lists)."""
+    if isinstance(v, bool):
+        return str(v).lower()
+    if isinstance(v, (list, dict)):
+        return None
+    n = _number(v)
+    if n is not None:
+        return str(int(n)) if n.is_integer() else repr(n)
+    return v
+
+
+def _number(v: Any) -> Optional[float]:
+    """Numeric value of a field for sorted indexes and range filters, or None. nan and
+    inf are not numbers here: they don't sort, and no range should hold them."""
+    if isinstance(v, bool):
+        return None
+    if not isinstance(v, (int, float, str)):
+        return None
+    try:
+        n = float(v)
+    except (ValueError, OverflowError):
+        return None
+    return n if isfinite(n) else None
+
+
+class HashIndex:
+    """Index of cards by the exact value of one categorical field (e.g. animal_type)."""
+
+    def __init__(self, field: str) -> None:
+        self.field = field
+        self._by_value = {}  # type: Dict[Any, Dict[int, Card]]
+        self._keys = {}  # type: Dict[int, Any]
+
+    def add(self, card: Card) -> None:
+        key = _hash_key(_field_value(card, self.field))
+        if key is None:
+            return
+        self._keys[id(card)] = key
+        self._by_value.setdefault(key, {})[id(card)] = card
+
+    def remove(self, card: Card) -> None:
+        key = self._keys.pop(id(card), None)
+        if key is None:
+            return
+        cards = self._by_value[key]
+        del cards[id(card)]
+        if len(cards) == 0:
+            del self._by_value[key]
+
+    def add_all(self, cards: Iterable[Card]) -> None:
+        for card in cards:
+            self.add(card)
+
+    def lookup(self, value: Any) -> Dict[int, Card]:
+        """Cards whose field equals value, keyed by id()."""
+        return self._by_value.get(_hash_key(value), {})
+
+    def values(self) -> List[Any]:
+        """Distinct values currently indexed."""
+        return list(self._by_value)
+
+
+class SortedIndex:
+    """Index of cards ordered by the numeric value of one field (e.g. mass_g), for
+    range lookups. Cards whose value isn't a number are left out."""
+
+    def __init__(self, field: str) -> None:
+        self.field = field
+        self._numbers = []  # type: List[float]
+        self._cards = []  # type: List[Card]
+        self._keys = {}  # type: Dict[int, float]
+
+    def add(self, card: Card) -> None:
+        n = _number(_field_value(card, self.field))
+        if n is None:
+            return
+        i = bisect_right(self._numbers, n)
+        self._numbers.insert(i, n)
+        self._cards.insert(i, card)
+        self._keys[id(card)] = n
+
+    def add_all(self, cards: Iterable[Card]) -> None:
+        """Adds many cards with one sort instead of one insertion each."""
+        for card in cards:
+            n = _number(_field_value(card, self.field))
+            if n is not None:
+                self._keys[id(card)] = n
+                self._cards.append(card)
+        self._cards.sort(key=lambda c: self._keys[id(c)])
+        self._numbers = [self._keys[id(c)] for c in self._cards]
+
+    def remove(self, card: Card) -> None:
+        n = self._keys.pop(id(card), None)
+        if n is None:
+            return
+        i = bisect_left(self._numbers, n)
+        while self._cards[i] is not card:
+            i += 1
+        del self._numbers[i]
+        del self._cards[i]
+
+    def range(
+        self,
+        lo: Optional[float] = None,
+        hi: Optional[float] = None,
+        inclusive: Tuple[bool, bool] = (True, True),
+    ) -> Dict[int, Card]:
+        """Cards with lo <= value <= hi (either end may be None for unbounded), in
+        ascending order of value, keyed by id()."""
+        start = 0
+        end = len(self._numbers)
+        if lo is not None:
+            start = (bisect_left if inclusive[0] else bisect_right)(self._numbers, lo)
+        if hi is not None:
+            end = (bisect_right if inclusive[1] else bisect_left)(self._numbers, hi)
+        return {id(c): c for c in self._cards[start:end]}
+
+
+class Eq:
+    """Query filter: field equals value."""
+
+    def __init__(self, field: str, value: Any) -> None:
+        self.field = field
+        self.value = value
+
+    def _from_index(self, index: Any) -> Optional[Dict[int, Card]]:
+        if isinstance(index, HashIndex):
+            return index.lookup(self.value)
+        if isinstance(index, SortedIndex) and _number(self.value) is not None:
+            n = _number(self.value)
+            return index.range(n, n)
+        return None
+
+    def matches(self, card: Card) -> bool:
+        v = _field_value(card, self.field)
+        key = _hash_key(v)
+        if key is not None and key == _hash_key(self.value):
+            return True
+        n = _number(v)
+        return n is not None and n == _number(self.value)
+
+
+class Range:
+    """Query filter: lo <= field <= hi, comparing numerically. Either end may be None,
+    and each can be made exclusive, e.g. Range("mass_g", lo=1000, inclusive=(False, True))
+    for mass_g > 1000."""
+
+    def __init__(
+        self,
+        field: str,
+        lo: Optional[float] = None,
+        hi: Optional[float] = None,
+        inclusive: Tuple[bool, bool] = (True, True),
+    ) -> None:
+        self.field = field
+        self.lo = lo
+        self.hi = hi
+        self.inclusive = inclusive
+
+    def _from_index(self, index: Any) -> Optional[Dict[int, Card]]:
+        if isinstance(index, SortedIndex):
+            return index.range(self.lo, self.hi, self.inclusive)
+        return None
+
+    def matches(self, card: Card) -> bool:
+        n = _number(_field_value(card, self.field))
+        if n is None:
+            return False
+        if self.lo is not None and (n < self.lo or (n == self.lo and not self.inclusive[0])):
+            return False
+        if self.hi is not None and (n > self.hi or (n == self.hi and not self.inclusive[1])):
+            return False
+        return True
+
+
+class And:
+    """Query filter: all of the given filters hold."""
+
+    def __init__(self, *filters: Any) -> None:
+        self.filters = filters
+
+    def matches(self, card: Card) -> bool:
+        return all(f.matches(card) for f in self.filters)
+
+
+def _flatten(filters: Iterable[Any]) -> List[Any]:
+    flat = []
+    for f in filters:
+        if isinstance(f, And):
+            flat.extend(_flatten(f.filters))
+        else:
+            flat.append(f)
+    return flat
+
+
+class _IndexSet:
+    """The secondary indexes of one Set, and the query planner over them."""
+
+    def __init__(self) -> None:
+        self.indexes = {}  # type: Dict[str, Any]
+        self.tables = []  # type: List[Any]  # CardTables kept in sync alongside
+
+    @property
+    def active(self) -> bool:
+        """Whether anything needs to hear about cards being added, removed or edited."""
+        return len(self.indexes) > 0 or len(self.tables) > 0
+
+    def create(self, field: str, sorted: bool, cards: Iterable[Card]) -> None:
+        index = SortedIndex(field) if sorted else HashIndex(field)
+        index.add_all(cards)
+        self.indexes[field] = index
+
+    def add(self, card: Card) -> None:
+        for index in self.indexes.values():
+            index.add(card)
+        for table in self.tables:
+            table._add(card)
+
+    def remove(self, card: Card) -> None:
+        for index in self.indexes.values():
+            index.remove(card)
+        for table in self.tables:
+            table._remove(card)
+
+    def card_changed(self, card: Card, field: str) -> None:
+        """Listener for Card edits: re-files card under its new value."""
+        for table in self.tables:
+            table._card_changed(card, field)
+        if field in ("remaining_keys", "_fields"):
+            indexes = list(self.indexes.values())
+        else:
+            field = field.lstrip("_")  # e.g. _time_created
+            indexes = [self.indexes[field]] if field in self.indexes else []
+        for index in indexes:
+            index.remove(card)
+            index.add(card)
+
+    def query(self, filters: List[Any], cards: Iterable[Card]) -> List[Card]:
+        filters = _flatten(filters)
+        candidates = []  # type: List[Dict[int, Card]]
+        leftover = []
+        for f in filters:
+            index = self.indexes.get(getattr(f, "field", None))
+            found = f._from_index(index) if index is not None and hasattr(f, "_from_index") else None
+            if found is None:
+                leftover.append(f)
+            else:
+                candidates.append(found)
+        if len(candidates) == 0:
+            return [c for c in cards if all(f.matches(c) for f in leftover)]
+        candidates.sort(key=len)
+        result = candidates[0]
+        for other in candidates[1:]:
+            result = {k: c for k, c in result.items() if k in other}
+        return [c for c in result.values() if all(f.matches(c) for f in leftover)]
@@ -0,0 +1,312 @@
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+from zipfile import ZipFile, is_zipfile
+import json
+import mmap
+import os
+import re
+import tempfile
+from .card import Card, _SetfileScanner, _cardify_incoming_types, _render, _scan_indented_block
+from .package import SETFILE_MEMBER, _copy_permissions
+
+
+INDEX_SUFFIX = ".mseidx"  # the index of sets/foo.mse-set is sets/foo.mse-set.mseidx
+_INDEX_VERSION = 1
+
+# One pass finds both the start of every top-level line (no indent) and every
+# card-level 'name: ' line, which is all an index needs. The first line may start
+# with a UTF-8 byte order mark.
+_re_index_lines = re.compile(
+    rb"^(?:\xef\xbb\xbf)?(?:(?P<top>[^\t \r\n][^\r\n]*)|\tname: (?P<name>[^\r\n]*))\r?$", re.MULTILINE
+)
+
+
+class _Block:
+    """Where one top-level block lives: key is its all_data key (the name, for
+    cards), offset and length are in bytes."""
+
+    __slots__ = ("key", "offset", "length", "is_card")
+
+    def __init__(self, key: str, offset: int, length: int, is_card: bool) -> None:
+        self.key = key
+        self.offset = offset
+        self.length = length
+        self.is_card = is_card
+
+
+def _top_level_tag(line: bytes) -> str:
+    """The tag of a top-level line, as _re_setfile_scanner would find it."""
+    text = line.decode("utf-8")
+    if text.endswith(":"):
+        return text[:-1]
+    return text.split(": ", 1)[0]
+
+
+def _scan_blocks(data: Any) -> List[_Block]:
+    """Offsets of the top-level blocks of a whole setfile in data (bytes or an mmap)."""
+    blocks = []  # type: List[_Block]
+    current = None  # type: Optional[_Block]
+    for m in _re_index_lines.finditer(data):
+        if m.group("top") is not None:
+            start = m.start("top")
+            if current is not None:
+                current.length = start - current.offset
+            tag = _top_level_tag(m.group("top"))
+            current = _Block(tag, start, 0, tag == "card")
+            current.key = None if current.is_card else tag
+            blocks.append(current)
+        elif current is not None and current.is_card and current.key is None:
+            current.key = m.group("name").decode("utf-8")
+    if current is not None:
+        current.length = len(data) - current.offset
+    for block in blocks:
+        if block.key is None:
+            # A card without a name line at the usual indent; ask the parser
+            block.key = _parse_block(_decode(data[block.offset:block.offset + block.length]))[0]
+    return blocks
+
+
+# Start of every top-level line of setfile text, i.e. of every top-level block
+_re_top_level = re.compile(r"^[^\t \n]", re.MULTILINE)
+
+
+def _split_text_blocks(source: str) -> List[Tuple[int, int]]:
+    """(start, end) of every top-level block of decoded setfile text, by character.
+    Anything before the first top-level line goes with the first block."""
+    starts = [m.start() for m in _re_top_level.finditer(source)]
+    if len(starts) == 0 or starts[0] != 0:
+        starts.insert(0, 0)
+    return list(zip(starts, starts[1:] + [len(source)]))
+
+
+def _decode(raw: bytes) -> str:
+    # As a text-mode read of the file would decode it
+    return raw.decode("utf-8").replace("\r\n", "\n")
+
+
+def _parse_block(text: str) -> Tuple[Any, Any]:
+    return _scan_indented_block(_SetfileScanner.from_text(text), adaptation_func=_cardify_incoming_types)
+
+
+def _package_fingerprint(path: Path) -> List[Any]:
+    with ZipFile(path) as zip_ref:
+        info = zip_ref.getinfo(SETFILE_MEMBER)
+        return ["package", info.CRC, info.file_size]
+
+
+def _file_fingerprint(path: Path) -> List[Any]:
+    st = os.stat(path)
+    return ["setfile", st.st_mtime_ns, st.st_size]
+
+
+class BlockIndex:
+    """Byte offset and length of every top-level block of a setfile, cards by name.
+    Built in one regex pass over the raw bytes, without parsing anything, and saved
+    as JSON next to the set (see INDEX_SUFFIX). fingerprint records which version of
+    the file it describes: mtime and size of a plain setfile, or CRC and size of the
+    'set' member of a .mse-set package, whose offsets are into that member."""
+
+    def __init__(self, fingerprint: List[Any], blocks: List[_Block]) -> None:
+        self.fingerprint = fingerprint
+        self.blocks = blocks
+        self._by_key = {}  # type: Dict[str, List[_Block]]
+        for block in blocks:
+            self._by_key.setdefault(block.key, []).append(block)
+
+    @classmethod
+    def build(cls, path: Union[str, Path]) -> "BlockIndex":
+        """Indexes a plain setfile (memory-mapped) or a .mse-set package."""
+        path = Path(path)
+        if is_zipfile(path):
+            with ZipFile(path) as zip_ref:
+                info = zip_ref.getinfo(SETFILE_MEMBER)
+                blocks = _scan_blocks(zip_ref.read(info))
+            return cls(["package", info.CRC, info.file_size], blocks)
+        fingerprint = _file_fingerprint(path)
+        with open(path, "rb") as f:
+            if fingerprint[2] == 0:
+                return cls(fingerprint, [])
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                return cls(fingerprint, _scan_blocks(data))
+
+    @classmethod
+    def for_file(cls, path: Union[str, Path], store: bool = True) -> "BlockIndex":
+        """The saved index of path if it's still up to date, else a freshly built one
+        (saved next to path, unless store is False)."""
+        path = Path(path)
+        index = cls.load(path)
+        if index is None:
+            index = cls.build(path)
+            if store:
+                index.save(path)
+        return index
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> Optional["BlockIndex"]:
+        """The index saved for path, or None if there is none or the file has changed
+        since it was built."""
+        path = Path(path)
+        try:
+            with open(_index_path(path), "r", encoding="utf-8") as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if saved.get("version") != _INDEX_VERSION:
+            return None
+        try:
+            current = _package_fingerprint(path) if saved["fingerprint"][0] == "package" else _file_fingerprint(path)
+        except (OSError, KeyError):
+            return None
+        if current != saved["fingerprint"]:
+            return None
+        return cls(saved["fingerprint"], [_Block(*b) for b in saved["blocks"]])
+
+    def save(self, path: Union[str, Path]) -> None:
+        """Writes the index next to path, the set it describes."""
+        saved = {
+            "version": _INDEX_VERSION,
+            "fingerprint": self.fingerprint,
+            "blocks": [[b.key, b.offset, b.length, b.is_card] for b in self.blocks],
+        }
+        with open(_index_path(Path(path)), "w", encoding="utf-8") as f:
+            json.dump(saved, f, ensure_ascii=False, separators=(",", ":"))
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._by_key
+
+    def __len__(self) -> int:
+        return len(self._by_key)
+
+    def keys(self) -> List[str]:
+        """Top-level keys in file order, as they would be in Set.all_data."""
+        return list(self._by_key)
+
+    def card_names(self) -> List[str]:
+        return [k for k, blocks in self._by_key.items() if blocks[-1].is_card]
+
+    def spans(self, key: str) -> List[Tuple[int, int]]:
+        """(offset, length) of every block under key; more than one if the key repeats,
+        in which case the last one is what Set.from_setfile would keep."""
+        return [(b.offset, b.length) for b in self._by_key[key]]
+
+
+def _index_path(path: Path) -> Path:
+    return path.with_name(path.name + INDEX_SUFFIX)
+
+
+class IndexedSetfile:
+    """Random access to the blocks of a setfile through its BlockIndex: only the
+    blocks asked for are parsed, straight from their recorded offsets. A plain
+    setfile is memory-mapped, so untouched parts aren't even read; the 'set' member
+    of a package has to be inflated whole, but still isn't parsed.
+
+        with IndexedSetfile.open("sets/thistledown-core.mse-set") as setfile:
+            wren = setfile.card("Carolina Wren")
+    """
+
+    def __init__(self, path: Union[str, Path], index: BlockIndex) -> None:
+        self.path = Path(path)
+        self.index = index
+        self._file = None  # type: Any
+        self._data = None  # type: Any
+        if index.fingerprint[0] == "package":
+            with ZipFile(self.path) as zip_ref:
+                self._data = zip_ref.read(SETFILE_MEMBER)
+        elif index.blocks:
+            self._map()
+
+    def _map(self) -> None:
+        self._file = open(self.path, "rb")
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    @classmethod
+    def open(cls, path: Union[str, Path], store: bool = True) -> "IndexedSetfile":
+        """Opens path with its saved index, building (and, if store, saving) it first
+        if there is none or the file has changed."""
+        return cls(path, BlockIndex.for_file(path, store=store))
+
+    def _text(self, block: _Block) -> str:
+        return _decode(self._data[block.offset:block.offset + block.length])
+
+    def block(self, key: str) -> Any:
+        """The value Set.from_setfile would have put in all_data[key]; KeyError if
+        there's no such block."""
+        return _parse_block(self._text(self.index._by_key[key][-1]))[1]
+
+    def card(self, name: str) -> Optional[Card]:
+        """The card called name, or None."""
+        blocks = self.index._by_key.get(name)
+        if blocks is None or not blocks[-1].is_card:
+            return None
+        return _parse_block(self._text(blocks[-1]))[1]
+
+    def cards(self, names: Iterable[str]) -> Dict[str, Card]:
+        """The cards among names that exist, by name, in file order."""
+        wanted = set(names)
+        return {
+            b.key: self.card(b.key)
+            for b in self.index.blocks
+            if b.key in wanted and b.is_card and self.index._by_key[b.key][-1] is b
+        }
+
+    def iter_cards(self) -> Iterator[Card]:
+        for name in self.index.card_names():
+            yield self.card(name)
+
+    def replace_block(self, key: str, value: Any, store: bool = True) -> None:
+        """Patches one block (e.g. an edited card) in a plain setfile, rewriting only
+        the bytes from that block on; the file is replaced atomically and the index
+        updated to match. A card that was renamed keeps its place under its new name.
+        Packages can't be patched in place; load them and use Set.to_packagefile."""
+        if self.index.fingerprint[0] == "package":
+            raise ValueError(f"Can't patch {self.path} in place, it's a package")
+        blocks = self.index._by_key[key]
+        if len(blocks) > 1:
+            raise ValueError(f"'{key}' occurs more than once in {self.path}")
+        block = blocks[0]
+        new = _render(key, value).encode("utf-8")
+        fd, temp_name = tempfile.mkstemp(prefix=f".{self.path.name}.", suffix=".tmp", dir=self.path.parent)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(self._data[:block.offset])
+                f.write(new)
+                f.write(self._data[block.offset + block.length:])
+                f.flush()
+                os.fsync(f.fileno())
+            _copy_permissions(self.path, Path(temp_name))
+            self.close()
+            os.replace(temp_name, self.path)
+        except BaseException:
+            if os.path.exists(temp_name):
+                os.unlink(temp_name)
+            if self._data is None:
+                self._map()  # the file is unchanged, so carry on reading it
+            raise
+        delta = len(new) - block.length
+        block.length = len(new)
+        for b in self.index.blocks:
+            if b.offset > block.offset:
+                b.offset += delta
+        new_key = value.name if isinstance(value, Card) else key
+        if new_key != key:
+            block.key = new_key
+        self.index = BlockIndex(_file_fingerprint(self.path), self.index.blocks)
+        if store:
+            self.index.save(self.path)
+        self._map()
+
+    def close(self) -> None:
+        """Unmaps and closes the file. _data is only dropped once that has worked, so
+        a failed close leaves the object as it was rather than half closed."""
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        if self._file is not None:
+            self._file.close()
+        self._file = None
+        self._data = None
+
+    def __enter__(self) -> "IndexedSetfile":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
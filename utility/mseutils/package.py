@@ -0,0 +1,183 @@
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterator, Optional, TextIO, Union
+from contextlib import contextmanager
+from datetime import datetime
+from zipfile import ZipFile, ZipInfo, ZIP_DEFLATED
+import io
+import os
+import shutil
+import struct
+import tempfile
+
+
+SETFILE_MEMBER = "set"  # name of the plaintext setfile inside every .mse-set
+
+_LOCAL_HEADER_SIZE = 30  # fixed part of a zip local file header
+_DATA_DESCRIPTOR_FLAG = 0x08
+_COPY_CHUNK_SIZE = 1 << 20
+
+
+class PackageMember:
+    """Lazy handle on one member (e.g. an 'art1.png' image) of a zipped .mse-set file.
+    Only the zip directory entry is kept around; the member itself is not read or
+    decompressed until read() or open() is called."""
+
+    def __init__(self, filepath: Path, info: ZipInfo) -> None:
+        self.filepath = Path(filepath)
+        self.info = info
+
+    @property
+    def name(self) -> str:
+        return self.info.filename
+
+    @property
+    def size(self) -> int:
+        """Uncompressed size in bytes."""
+        return self.info.file_size
+
+    @property
+    def compress_size(self) -> int:
+        return self.info.compress_size
+
+    @property
+    def crc(self) -> int:
+        return self.info.CRC
+
+    @contextmanager
+    def open(self) -> Iterator[BinaryIO]:
+        """Opens the member for streaming, decompressing as it is read."""
+        with ZipFile(self.filepath, "r") as zip_ref:
+            with zip_ref.open(self.info) as member:
+                yield member
+
+    def read(self) -> bytes:
+        """Reads and decompresses the whole member."""
+        with self.open() as member:
+            return member.read()
+
+    def __repr__(self) -> str:
+        return f"PackageMember({str(self.filepath)!r}, {self.name!r})"
+
+
+def _package_members(filepath: Path, zip_ref: ZipFile) -> Dict[str, PackageMember]:
+    """Handles on every member of an open .mse-set besides the setfile itself."""
+    return {
+        info.filename: PackageMember(filepath, info)
+        for info in zip_ref.infolist()
+        if info.filename != SETFILE_MEMBER and not info.is_dir()
+    }
+
+
+@contextmanager
+def _open_setfile_member(zip_ref: ZipFile, filepath: Path) -> Iterator[TextIO]:
+    """Opens the 'set' member of an open .mse-set as a text stream, straight out of the
+    zip with no temporary files."""
+    try:
+        info = zip_ref.getinfo(SETFILE_MEMBER)
+    except KeyError:
+        raise ValueError(f"Missing 'set' file! (Are you sure {filepath} is an mse-set?)")
+    with zip_ref.open(info) as raw:
+        yield io.TextIOWrapper(raw, encoding="utf-8-sig")
+
+
+def _copy_member_raw(src: BinaryIO, info: ZipInfo, zout: ZipFile, name: Optional[str] = None) -> ZipInfo:
+    """Appends a member of another zip to zout by copying its compressed bytes as-is,
+    without inflating and deflating them again, under name (by default its own). src
+    must be the raw source zip file."""
+    src.seek(info.header_offset)
+    header = src.read(_LOCAL_HEADER_SIZE)
+    name_len, extra_len = struct.unpack("<HH", header[26:30])
+    src.seek(info.header_offset + _LOCAL_HEADER_SIZE + name_len + extra_len)
+
+    out_info = ZipInfo(name if name is not None else info.filename, date_time=info.date_time)
+    out_info.compress_type = info.compress_type
+    out_info.external_attr = info.external_attr
+    out_info.create_system = info.create_system
+    out_info.comment = info.comment
+    out_info.CRC = info.CRC
+    out_info.compress_size = info.compress_size
+    out_info.file_size = info.file_size
+    # Sizes are known up front, so the copy never needs a trailing data descriptor
+    out_info.flag_bits = info.flag_bits & ~_DATA_DESCRIPTOR_FLAG
+
+    fp = zout.fp
+    out_info.header_offset = fp.tell()
+    fp.write(out_info.FileHeader())
+    remaining = info.compress_size
+    while remaining > 0:
+        chunk = src.read(min(remaining, _COPY_CHUNK_SIZE))
+        if chunk == b"":
+            raise ValueError(f"Truncated member {info.filename} in {src.name}")
+        fp.write(chunk)
+        remaining -= len(chunk)
+
+    # Register with zout as if it had been written normally
+    zout.filelist.append(out_info)
+    zout.NameToInfo[out_info.filename] = out_info
+    zout.start_dir = fp.tell()
+    zout._didModify = True
+    return out_info
+
+
+def _new_member_info(name: str) -> ZipInfo:
+    info = ZipInfo(name, date_time=datetime.now().timetuple()[:6])
+    info.compress_type = ZIP_DEFLATED
+    info.external_attr = 0o644 << 16
+    return info
+
+
+def _copy_permissions(original: Path, temp: Path) -> None:
+    """mkstemp creates files readable only by their owner; keep the mode of the file
+    being replaced (or a regular 0644) instead."""
+    if original.exists():
+        shutil.copymode(original, temp)
+    else:
+        os.chmod(temp, 0o644)
+
+
+def _write_package(
+    filepath: Path,
+    setfile_text: str,
+    members: Dict[str, Union[PackageMember, bytes]],
+) -> Dict[str, PackageMember]:
+    """Atomically writes a .mse-set zip: members first, in order, then the setfile.
+    PackageMember values are copied from their source archive still compressed; bytes
+    values are (re)compressed. The archive is built in a temporary file next to
+    filepath and renamed over it only once complete, so filepath may also be one of
+    the sources. Returns handles on the members of the newly written file."""
+    filepath = Path(filepath)
+    fd, temp_name = tempfile.mkstemp(
+        prefix=f".{filepath.name}.", suffix=".tmp", dir=filepath.parent
+    )
+    try:
+        with os.fdopen(fd, "w+b") as temp_file:
+            with ZipFile(temp_file, "w", compression=ZIP_DEFLATED) as zout:
+                sources = {}  # type: Dict[Path, BinaryIO]
+                try:
+                    for name, member in members.items():
+                        if isinstance(member, PackageMember):
+                            if member.filepath not in sources:
+                                sources[member.filepath] = open(member.filepath, "rb")
+                            _copy_member_raw(sources[member.filepath], member.info, zout, name)
+                        else:
+                            zout.writestr(_new_member_info(name), member)
+                finally:
+                    for src in sources.values():
+                        src.close()
+                zout.writestr(
+                    _new_member_info(SETFILE_MEMBER), setfile_text.encode("utf-8-sig")
+                )
+                written = {
+                    info.filename: PackageMember(filepath, info)
+                    for info in zout.infolist()
+                    if info.filename != SETFILE_MEMBER
+                }
+            temp_file.flush()
+            os.fsync(temp_file.fileno())
+        _copy_permissions(filepath, Path(temp_name))
+        os.replace(temp_name, filepath)
+    except BaseException:
+        if os.path.exists(temp_name):
+            os.unlink(temp_name)
+        raise
+    return written
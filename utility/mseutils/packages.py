@@ -0,0 +1,351 @@
+"""Game, style, locale and symbol font packages: the data/*.mse-* folders.
+
+They are written in the same indented format as 'set' files, but keys repeat
+('card field:' once per field, 'choice:' once per choice) and values can be
+scripts, so they are read into Blocks, which keep every entry in order, rather
+than dicts. 'include file: NAME' pulls in another file: at the level of keys its
+entries (as the game does with add_cards_scripts), inside a script its text (as
+init script does with script). NAME is relative to the including package, or
+/other.mse-game/NAME for a file of another package next to it.
+
+Every file is read and parsed once per PackageFileCache, and the default one is
+shared by the whole process, so loading all of data/ reads each include once.
+
+    game = load_package("data/thistledown.mse-game")
+    [f.name for f in game.card_fields]    # ['shape', 'name', 'sciencename', ...]
+    game.card_field("cover").choices      # ['Leaf litter', 'Ground cover', ...]
+"""
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Union
+from zipfile import ZipFile, is_zipfile
+
+
+# The file holding each kind of package's data, by folder suffix
+PACKAGE_FILES = {
+    ".mse-game": "game",
+    ".mse-style": "style",
+    ".mse-locale": "locale",
+    ".mse-symbol-font": "symbol-font",
+    ".mse-export-template": "export-template",
+    ".mse-include": "include",
+}
+INCLUDE_KEY = "include file"
+
+# Values of these keys are scripts even when every line happens to look like a key
+# ('add cards script:' is not one, it holds a name and a script)
+_TEXT_KEYS = ("script", "init script", "sort script", "default", "card list sort script")
+
+
+class Block:
+    """The entries of one indented block (or a whole file), in order: (key, value)
+    pairs where value is a string or a nested Block. Keys can repeat; block["key"]
+    and get() give the first value, get_all() every one."""
+
+    def __init__(self, entries: Optional[List[Tuple[str, Any]]] = None) -> None:
+        self.entries = entries if entries is not None else []  # type: List[Tuple[str, Any]]
+
+    def __getitem__(self, key: str) -> Any:
+        for k, v in self.entries:
+            if k == key:
+                return v
+        raise KeyError(key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def get_all(self, key: str) -> List[Any]:
+        return [v for k, v in self.entries if k == key]
+
+    def __contains__(self, key: str) -> bool:
+        return any(k == key for k, _ in self.entries)
+
+    def __iter__(self) -> Iterator[str]:
+        """The distinct keys, in order of first appearance."""
+        return iter(dict.fromkeys(k for k, _ in self.entries))
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def flag(self, key: str, default: bool = False) -> bool:
+        """A true/false value."""
+        value = self.get(key)
+        return default if not isinstance(value, str) else value.strip().lower() in ("true", "yes", "1")
+
+    def to_dict(self) -> Dict[str, Any]:
+        """As nested dicts, keeping only the first of repeated keys."""
+        d = {}  # type: Dict[str, Any]
+        for k, v in self.entries:
+            if k not in d:
+                d[k] = v.to_dict() if isinstance(v, Block) else v
+        return d
+
+    def __repr__(self) -> str:
+        keys = list(self)
+        return f"Block({', '.join(keys[:5])}{', ...' if len(keys) > 5 else ''})"
+
+
+_Line = Tuple[int, int, str]  # line number, indent (tabs), line without indent
+
+
+def _split_lines(text: str) -> List[_Line]:
+    if text.startswith("﻿"):
+        text = text[1:]
+    lines = []  # type: List[_Line]
+    for number, line in enumerate(text.splitlines(), 1):
+        stripped = line.lstrip("\t")
+        lines.append((number, len(line) - len(stripped), stripped.rstrip()))
+    return lines
+
+
+def _is_content(line: _Line) -> bool:
+    return line[2] != "" and not line[2].startswith("#")
+
+
+class _Parser:
+    def __init__(
+        self,
+        name: str,
+        include_entries: Callable[[str], List[Tuple[str, Any]]],
+        include_text: Callable[[str], str],
+    ) -> None:
+        self.name = name
+        self.include_entries = include_entries
+        self.include_text = include_text
+
+    def block(self, lines: List[_Line], indent: int) -> Block:
+        entries = []  # type: List[Tuple[str, Any]]
+        i = 0
+        while i < len(lines):
+            number, depth, line = lines[i]
+            i += 1
+            if not _is_content(lines[i - 1]):
+                continue
+            if depth != indent:
+                raise ValueError(f"Unexpected indentation at line {number} of {self.name}")
+            key, sep, value = line.partition(":")
+            if not sep:
+                raise ValueError(f"Expected 'key: value' at line {number} of {self.name}")
+            key, value = key.strip(), value.strip()
+            # The lines indented under this one (and blank lines among them)
+            start = i
+            while i < len(lines) and (lines[i][1] > indent or not _is_content(lines[i])):
+                i += 1
+            end = i
+            while end > start and not _is_content(lines[end - 1]):
+                end -= 1
+            children = lines[start:end]
+            i = end
+            if key == INCLUDE_KEY and not children:
+                entries.extend(self.include_entries(value))
+            elif not children:
+                entries.append((key, value))
+            elif value or key in _TEXT_KEYS or any(
+                _is_content(l) and l[1] == indent + 1 and ":" not in l[2] for l in children
+            ):
+                text = self.text(children, indent + 1)
+                entries.append((key, f"{value}\n{text}" if value else text))
+            else:
+                entries.append((key, self.block(children, indent + 1)))
+        return Block(entries)
+
+    def text(self, lines: List[_Line], indent: int) -> str:
+        """Lines of a multi-line value, less indent tabs, with scripts included."""
+        out = []  # type: List[str]
+        for _, depth, line in lines:
+            prefix = "\t" * (depth - indent) if line else ""
+            if line.startswith(INCLUDE_KEY + ":"):
+                included = self.include_text(line[len(INCLUDE_KEY) + 1:].strip())
+                out.extend(prefix + l if l else l for l in included.split("\n"))
+            else:
+                out.append(prefix + line)
+        return "\n".join(out)
+
+
+class PackageFileCache:
+    """The text, and parsed entries, of each package file read so far, by path, so
+    that a file included by many packages is read and parsed once. Files are not
+    checked for changes: clear() forgets them. Packages loaded through the same
+    cache share their Blocks, so treat those as read-only."""
+
+    def __init__(self) -> None:
+        self._texts = {}  # type: Dict[Tuple[str, str], str]
+        self._blocks = {}  # type: Dict[Tuple[str, str], Block]
+        self._expanded = {}  # type: Dict[Tuple[str, str], str]
+        self._busy = []  # type: List[Tuple[str, str]]  # files being parsed, to catch include loops
+        self.reads = 0  # how many files have been read from disk
+
+    def clear(self) -> None:
+        self._texts.clear()
+        self._blocks.clear()
+        self._expanded.clear()
+
+    def text(self, package: Path, name: str) -> str:
+        """The file name (a path within it) of package, a folder or zipped package."""
+        key = (str(package), name)
+        text = self._texts.get(key)
+        if text is None:
+            try:
+                if package.is_dir():
+                    data = (package / name).read_bytes()
+                elif is_zipfile(package):
+                    with ZipFile(package) as zip_ref:
+                        data = zip_ref.read(name)
+                else:
+                    raise FileNotFoundError(package)
+            except (OSError, KeyError):
+                raise ValueError(f"No file {name} in {package}")
+            self.reads += 1
+            text = self._texts[key] = data.decode("utf-8-sig")
+        return text
+
+    def _resolve(self, package: Path, name: str) -> Tuple[Path, str]:
+        if name.startswith("/"):
+            other, _, rest = name[1:].partition("/")
+            return (package.parent / other, rest)
+        return (package, name)
+
+    def _guard(self, key: Tuple[str, str]) -> None:
+        if key in self._busy:
+            raise ValueError(f"{key[1]} in {key[0]} includes itself")
+
+    def block(self, package: Union[str, Path], name: str) -> Block:
+        """The entries of the file, with includes resolved."""
+        package = Path(package)
+        key = (str(package), name)
+        block = self._blocks.get(key)
+        if block is None:
+            self._guard(key)
+            self._busy.append(key)
+            try:
+                parser = _Parser(
+                    f"{package / name}",
+                    lambda include: self.block(*self._resolve(package, include)).entries,
+                    lambda include: self.expanded_text(*self._resolve(package, include)),
+                )
+                block = self._blocks[key] = parser.block(_split_lines(self.text(package, name)), 0)
+            finally:
+                self._busy.pop()
+        return block
+
+    def expanded_text(self, package: Union[str, Path], name: str) -> str:
+        """The text of the file as a script, with its own includes put in."""
+        package = Path(package)
+        key = (str(package), name)
+        text = self._expanded.get(key)
+        if text is None:
+            self._guard(key)
+            self._busy.append(key)
+            try:
+                parser = _Parser(
+                    f"{package / name}",
+                    lambda include: [],
+                    lambda include: self.expanded_text(*self._resolve(package, include)),
+                )
+                text = self._expanded[key] = parser.text(_split_lines(self.text(package, name)), 0)
+            finally:
+                self._busy.pop()
+        return text
+
+
+_default_file_cache = PackageFileCache()
+
+
+def default_file_cache() -> PackageFileCache:
+    """The PackageFileCache shared by every load_package that isn't given one."""
+    return _default_file_cache
+
+
+def _choices(values: List[Any], prefix: str = "") -> List[str]:
+    """Choice names; a group's choices are named "group choice", as MSE does."""
+    names = []  # type: List[str]
+    for value in values:
+        if isinstance(value, Block):
+            name = prefix + value.get("name", "")
+            nested = value.get_all("choice")
+            names.extend(_choices(nested, name + " ") if nested else [name])
+        else:
+            names.append(prefix + value)
+    return names
+
+
+class Field:
+    """A 'card field:' or 'set field:' of a game (or 'extra card field:' of a style).
+    The common properties are attributes; the rest are in block."""
+
+    def __init__(self, block: Block) -> None:
+        self.block = block
+        self.type = block.get("type", "")
+        self.name = block.get("name", "")
+        self.description = block.get("description", "")
+        self.identifying = block.flag("identifying")
+        self.editable = block.flag("editable", True)
+        self.save_value = block.flag("save value", True)
+        self.script = block.get("script")  # type: Optional[str]
+        self.default = block.get("default")  # type: Optional[str]
+        self.choices = _choices(block.get_all("choice"))
+
+    def __repr__(self) -> str:
+        return f"Field({self.type!r}, {self.name!r})"
+
+
+class Package:
+    """A loaded package: block has every entry of its main file ('game', 'style',
+    ...) with includes resolved; the commonly needed ones are attributes."""
+
+    def __init__(self, path: Path, kind: str, block: Block) -> None:
+        self.path = path
+        self.kind = kind  # the main file's name: "game", "style", ...
+        self.block = block
+        self.full_name = block.get("full name", "")
+        self.short_name = block.get("short name", "")
+        self.version = block.get("version", "")
+        self.game = block.get("game")  # type: Optional[str]  # the game a style is for
+        self.depends_on = [(d.get("package", ""), d.get("version", "")) for d in block.get_all("depends on")]
+        self.card_fields = [Field(b) for b in block.get_all("card field")]
+        self.set_fields = [Field(b) for b in block.get_all("set field")]
+        self.extra_card_fields = [Field(b) for b in block.get_all("extra card field")]
+        style = block.get("card style")
+        # Style of each card field, by field name
+        self.card_style = dict(style.entries) if isinstance(style, Block) else {}  # type: Dict[str, Any]
+
+    @property
+    def name(self) -> str:
+        return self.path.name
+
+    def card_field(self, name: str) -> Field:
+        for f in self.card_fields:
+            if f.name == name:
+                return f
+        raise KeyError(name)
+
+    def set_field(self, name: str) -> Field:
+        for f in self.set_fields:
+            if f.name == name:
+                return f
+        raise KeyError(name)
+
+    def __repr__(self) -> str:
+        return f"Package({self.name!r})"
+
+
+def load_package(path: Union[str, Path], cache: Optional[PackageFileCache] = None) -> Package:
+    """The package at path, a .mse-game, .mse-style, ... folder or zip. Its files
+    are read through cache, by default the process-wide one."""
+    path = Path(path)
+    kind = PACKAGE_FILES.get(path.suffix)
+    if kind is None:
+        raise ValueError(f"{path} is not an MSE package")
+    cache = cache if cache is not None else default_file_cache()
+    return Package(path, kind, cache.block(path, kind))
+
+
+def load_packages(directory: Union[str, Path], cache: Optional[PackageFileCache] = None) -> Dict[str, Package]:
+    """Every package in directory (such as data/), by folder name."""
+    return {
+        p.name: load_package(p, cache)
+        for p in sorted(Path(directory).iterdir())
+        if p.suffix in PACKAGE_FILES
+    }
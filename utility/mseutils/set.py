@@ -1,7 +1,53 @@
 from pathlib import Path
-from typing import Any, BinaryIO, Dict, TextIO
-from zipfile import ZipFile
-from .card import Card, _collect_all_indented_blocks, _cardify_incoming_types, _uncardify_outgoing
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, TextIO, Tuple, Union
+from zipfile import BadZipFile, ZipFile
+import functools
+import hashlib
+import io
+from .card import (
+    Card,
+    _CountingScanner,
+    _SetfileScanner,
+    _TrackedDict,
+    _collect_all_indented_blocks,
+    _cardify_incoming_types,
+    _decode_date,
+    _decode_time,
+    _scan_indented_block,
+    _render,
+)
+from .aio import _run, _shared
+from .cache import ParseCache, _resolve, package_fingerprint, setfile_fingerprint
+from .columns import CardTable
+from .compact import CardSchema
+from .index import Eq, _IndexSet
+from .package import SETFILE_MEMBER, PackageMember, _open_setfile_member, _package_members, _write_package
+from .stats import ParseStats, _counting, _operation, _phase
+
+
+# How to read a loaded set's text again: ("setfile", path, encoding) or
+# ("package", path, None)
+_Origin = Tuple[str, str, Optional[str]]
+
+
+def _text_digest(text: str) -> bytes:
+    return hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+
+
+def _reread_source(origin: _Origin, digest: Optional[bytes]) -> Optional[str]:
+    """The text a set was loaded from, read again, or None if it can't be read or
+    isn't what it was (digest) any more."""
+    kind, path, encoding = origin
+    try:
+        if kind == "package":
+            with ZipFile(path) as zip_ref, _open_setfile_member(zip_ref, Path(path)) as ifile:
+                text = ifile.read()
+        else:
+            with open(path, "rt", encoding=encoding) as ifile:
+                text = ifile.read()
+    except (OSError, ValueError, BadZipFile):
+        return None
+    return text if digest is None or _text_digest(text) == digest else None
 
 
 class Set:
@@ -9,40 +55,370 @@ class Set:
 
     def __init__(
         self,
-        all_data : Dict[str, Any]
+        all_data : Dict[str, Any],
+        members : Optional[Dict[str, Union[PackageMember, bytes]]] = None,
     ) -> None:
         # We need to take all data from the original setfile verbatim, in order -- MSE
         # will often throw a fit if things are rearranged.
-        self.all_data = all_data # NEVER SORT THIS DICT
+        self.all_data = _TrackedDict(all_data) # NEVER SORT THIS DICT
         self.cards = {} # type: Dict[str, Card]
         for k, v in self.all_data.items():
             if isinstance(v, Card):
                 self.cards[v.name] = v # Another way to reference SAME card object
+        # Everything else in the .mse-set zip (art etc.), as lazy handles. Assign bytes
+        # to an entry to replace that member on the next to_packagefile.
+        self.members = members if members is not None else {} # type: Dict[str, Union[PackageMember, bytes]]
+        # Text this Set was last loaded from or saved to, and where in it each top-level
+        # block of all_data lives (a key can appear more than once in a setfile). Text
+        # loaded from a file isn't pickled (into the parse cache, or to another
+        # process); _source reads it again when it's needed, from _source_origin.
+        self._source_text = None # type: Optional[str]
+        self._source_origin = None # type: Optional[_Origin]
+        self._source_digest = None # type: Optional[bytes]
+        self._spans = {} # type: Dict[str, List[Tuple[int, int]]]
+        self._indexes = _IndexSet()
+
+    @property
+    def _source(self) -> Optional[str]:
+        if self._source_text is None and self._source_origin is not None:
+            self._source_text = _reread_source(self._source_origin, self._source_digest)
+            self._source_origin = None
+            if self._source_text is None:
+                # The file changed or went away: every block will be rendered again
+                self._spans = {}
+        return self._source_text
+
+    @_source.setter
+    def _source(self, text: Optional[str]) -> None:
+        self._source_text = text
+        self._source_origin = None
+        self._source_digest = None
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # Indexes are keyed by id(), so they don't survive pickling
+        state = self.__dict__.copy()
+        state["_indexes"] = None
+        if state["_source_origin"] is not None and state["_source_text"] is not None:
+            state["_source_digest"] = _text_digest(state["_source_text"])
+            state["_source_text"] = None
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._indexes = _IndexSet()
+
+    def add_card(self, card: Card) -> None:
+        """Adds card to the end of the set, or replaces the card of the same name."""
+        old = self.cards.get(card.name)
+        if old is not None:
+            self._unindex(old)
+        self.all_data[card.name] = card
+        self.cards[card.name] = card
+        if self._indexes.active:
+            self._indexes.add(card)
+            card._set_listener(self._indexes.card_changed)
+
+    def remove_card(self, name: str) -> Card:
+        """Removes and returns the card called name; raises KeyError if there is none."""
+        card = self.cards.pop(name)
+        del self.all_data[name]
+        self._unindex(card)
+        return card
+
+    def _unindex(self, card: Card) -> None:
+        if self._indexes.active:
+            self._indexes.remove(card)
+            card._set_listener(None)
+
+    def create_index(self, field: str, sorted: bool = False) -> None:
+        """Indexes cards by field for query(): a hash index for categorical fields such
+        as animal_type, or with sorted=True an index by numeric value for range queries
+        on fields such as mass_g. Indexes follow cards added and removed through
+        add_card/remove_card and edits made to the cards' fields, but not changes made
+        to all_data or cards directly."""
+        self._listen()
+        self._indexes.create(field, sorted, self.cards.values())
+
+    def drop_index(self, field: str) -> None:
+        del self._indexes.indexes[field]
+        self._stop_listening()
+
+    def create_table(self, *fields: str, kinds: Optional[Dict[str, str]] = None) -> CardTable:
+        """A CardTable of fields over the cards, for statistics such as
+        table.percentile("mass_g", 90). Like indexes, it follows cards added and
+        removed through add_card/remove_card and edits made to the cards."""
+        table = CardTable(self.cards.values(), fields, kinds)
+        self._listen()
+        self._indexes.tables.append(table)
+        return table
+
+    def drop_table(self, table: CardTable) -> None:
+        """Stops keeping table in sync with the cards."""
+        self._indexes.tables.remove(table)
+        self._stop_listening()
+
+    def _listen(self) -> None:
+        if not self._indexes.active:
+            for card in self.cards.values():
+                card._set_listener(self._indexes.card_changed)
+
+    def _stop_listening(self) -> None:
+        if not self._indexes.active:
+            for card in self.cards.values():
+                card._set_listener(None)
+
+    def query(self, *filters: Any, **equals: Any) -> List[Card]:
+        """Returns the cards matching all of filters (Eq, Range or And from
+        mseutils.index) and field=value keyword arguments, e.g.
+        query(Range("mass_g", lo=1000), animal_type="Bird"). Filters on indexed fields
+        are answered from the indexes; the rest are checked card by card."""
+        all_filters = list(filters) + [Eq(k, v) for k, v in equals.items()]
+        return self._indexes.query(all_filters, self.cards.values())
+
+    def _is_dirty(self, key: str) -> bool:
+        if key in self.all_data.changed:
+            return True
+        val = self.all_data[key]
+        if isinstance(val, Card):
+            return val.dirty
+        if isinstance(val, (dict, list)):
+            # Nested blocks such as 'set info' or 'styling' aren't tracked; they are few
+            # and small, so compare them with what their text parses to instead
+            return self._parsed_source(key) != val
+        return False
+
+    def _parsed_source(self, key: str) -> Any:
+        """The value of top-level block key as its text was last loaded or saved."""
+        source = self._source
+        if source is None:
+            return None
+        val = None
+        for start, end in self._spans[key]:
+            scanner = _SetfileScanner.from_text(source[start:end])
+            _, val = _scan_indented_block(scanner, adaptation_func=_cardify_incoming_types)
+        return val
+
+    def mark_dirty(self, key: str) -> None:
+        """Makes the next save render top-level block key (a card name, 'set info',
+        ...) again rather than copy its text, for changes made in place that aren't
+        noticed otherwise. KeyError if there is no such block."""
+        if key not in self.all_data:
+            raise KeyError(key)
+        self.all_data.changed.add(key)
+
+    def added_keys(self) -> List[str]:
+        """Top-level keys (card names included) added since the last load or save."""
+        return [k for k in self.all_data if k not in self._spans]
+
+    def removed_keys(self) -> List[str]:
+        """Top-level keys (card names included) removed since the last load or save."""
+        return [k for k in self._spans if k not in self.all_data]
+
+    def changed_keys(self) -> List[str]:
+        """Top-level keys (card names included) that were there at the last load or save
+        and have been assigned or edited since."""
+        return [k for k in self.all_data if k in self._spans and self._is_dirty(k)]
 
     def to_setfile(self, ofile: TextIO) -> None:
-        """Dumps to unzipped, plaintext setfile (i.e. file simply named 'set')"""
-        _uncardify_outgoing(ofile, self.all_data)
+        """Dumps to unzipped, plaintext setfile (i.e. file simply named 'set').
+        Blocks that haven't changed since the Set was loaded or last saved are copied
+        verbatim from that text; only added or changed blocks are rendered again.
+        Afterwards, the written text is the new baseline for tracking changes."""
+        with _operation("to_setfile", getattr(ofile, "name", None)) as stats:
+            pieces = [] # type: List[str]
+            spans = {} # type: Dict[str, List[Tuple[int, int]]]
+            pos = 0
+            rendered = 0
+            with _phase(stats, "render"):
+                source = self._source
+                for k, v in self.all_data.items():
+                    old_spans = self._spans.get(k)
+                    if old_spans is not None and not self._is_dirty(k):
+                        text = "".join(source[start:end] for start, end in old_spans)
+                    else:
+                        text = _render(k, v)
+                        rendered += 1
+                        if isinstance(v, Card):
+                            v.mark_clean()
+                    pieces.append(text)
+                    spans[k] = [(pos, pos + len(text))]
+                    pos += len(text)
+                self._source = "".join(pieces)
+            with _phase(stats, "write"):
+                ofile.write(self._source)
+            self._spans = spans
+            self.all_data.changed.clear()
+            if stats is not None:
+                stats.blocks_rendered += rendered
+                stats.cards += len(self.cards)
+                if stats.operation == "to_setfile":
+                    stats.bytes_written += len(self._source.encode("utf-8", "surrogatepass"))
+
+    async def asave(self, filepath: Path) -> None:
+        """to_packagefile, run on the mseutils executor. The set mustn't be changed
+        until this returns. If it is cancelled once writing has started, the write
+        still completes (files are replaced atomically either way)."""
+        await _run(functools.partial(self.to_packagefile, Path(filepath)))
+
+    async def ato_setfile(self, ofile: TextIO) -> None:
+        """to_setfile, run on the mseutils executor."""
+        await _run(functools.partial(self.to_setfile, ofile))
+
+    def to_packagefile(self, filepath: Path) -> None:
+        """Dumps to zipped .mse-set file. Members that were loaded from a package and not
+        replaced are copied over still compressed, so unchanged art costs no inflate /
+        deflate. The zip is built in a temporary file and renamed into place, so it is
+        safe to save over the package this Set was read from; afterwards members refer
+        to the newly written file."""
+        with _operation("to_packagefile", filepath) as stats:
+            setfile = io.StringIO()
+            self.to_setfile(setfile)
+            with _phase(stats, "write"):
+                self.members = _write_package(Path(filepath), setfile.getvalue(), self.members)
+            if stats is not None:
+                stats.bytes_written = Path(filepath).stat().st_size
 
     @classmethod
-    def from_setfile(cls, ifile: TextIO) -> "Set":
-        """Reads from unzipped, plaintext setfile (i.e. file simply named 'set')"""
+    def from_setfile(
+        cls, ifile: TextIO, compact: bool = False, cache: Union[bool, ParseCache] = True
+    ) -> "Set":
+        """Reads from unzipped, plaintext setfile (i.e. file simply named 'set').
+        The text is kept so that to_setfile can copy unchanged blocks verbatim.
+        With compact=True, cards are loaded as CompactCards sharing one CardSchema,
+        which takes a fraction of the memory for big sets.
+        Files opened from disk go through the parse cache (see ParseCache): cache=True
+        uses the default one, False bypasses it, or pass a ParseCache of your own."""
+        with _operation("from_setfile", getattr(ifile, "name", None)) as stats:
+            parse_cache = _resolve(cache)
+            fingerprint = setfile_fingerprint(ifile, compact) if parse_cache is not None else None
+            if fingerprint is not None:
+                with _phase(stats, "cache"):
+                    s = parse_cache.get(ifile.name, fingerprint, compact)
+                if s is not None:
+                    ifile.seek(0, io.SEEK_END)
+                    if stats is not None:
+                        stats.cache_hits += 1
+                        stats.cards += len(s.cards)
+                    return s
+            s = cls._parse_setfile(ifile, compact, stats)
+            if fingerprint is not None:
+                s._source_origin = ("setfile", str(Path(ifile.name).resolve()), getattr(ifile, "encoding", None))
+                with _phase(stats, "cache"):
+                    parse_cache.put(ifile.name, fingerprint, s, compact)
+        return s
+
+    @classmethod
+    def _parse_setfile(cls, ifile: TextIO, compact: bool, stats: Optional[ParseStats] = None) -> "Set":
         set_fields = {}
+        spans = {} # type: Dict[str, List[Tuple[int, int]]]
+        adapt = _cardify_incoming_types
+        if compact:
+            adapt = functools.partial(_cardify_incoming_types, card_factory=CardSchema().new_card)
+        scanner_cls = _SetfileScanner
+        if stats is not None:
+            adapt = _counting(stats, adapt)
+            scanner_cls = _CountingScanner
+            decodes = _decode_time.cache_info().misses + _decode_date.cache_info().misses
+
+        with _phase(stats, "read"):
+            source = ifile.read()
+        with _phase(stats, "parse"):
+            scanner = scanner_cls.from_text(source, getattr(ifile, "name", "<setfile>"))
+            while scanner.peek_line() != "":
+                start = scanner.offset
+                key, val = _scan_indented_block(scanner, adaptation_func=adapt)
+                set_fields[key] = val
+                spans.setdefault(key, []).append((start, scanner.offset))
+        with _phase(stats, "build"):
+            s = Set(all_data=set_fields)
+            s._source = source
+            s._spans = spans
+        if stats is not None:
+            stats.lines_scanned += scanner.lines
+            stats.blocks += scanner.blocks
+            stats.max_depth = max(stats.max_depth, scanner.max_depth)
+            stats.time_decodes += _decode_time.cache_info().misses + _decode_date.cache_info().misses - decodes
+            stats.cards += len(s.cards)
+            if stats.bytes_read == 0:
+                # from_packagefile has already counted the compressed member
+                stats.bytes_read = len(source.encode("utf-8", "surrogatepass"))
+        return s
 
-        for key, val in _collect_all_indented_blocks(ifile, adaptation_func=_cardify_incoming_types):
-            set_fields[key] = val
-        return Set(all_data=set_fields)
+    @classmethod
+    def iter_blocks(cls, ifile: TextIO) -> Iterator[Tuple[str, Any]]:
+        """Lazily yields the top-level (key, value) blocks of an unzipped setfile, in file
+        order, as each one is parsed. Cards come back as (card name, Card), same as they
+        would appear in all_data. Nothing past the yielded block is parsed until the
+        next one is asked for, so memory use doesn't grow with the size of the set and
+        breaking out of the loop stops parsing altogether."""
+        yield from _collect_all_indented_blocks(ifile, adaptation_func=_cardify_incoming_types)
+
+    @classmethod
+    def iter_cards(cls, ifile: TextIO) -> Iterator[Card]:
+        """Lazily yields each Card of an unzipped setfile as it is parsed, skipping over
+        all other top-level blocks."""
+        for _, val in cls.iter_blocks(ifile):
+            if isinstance(val, Card):
+                yield val
+
+    @classmethod
+    def find_card(cls, ifile: TextIO, name: str) -> Optional[Card]:
+        """Returns the first card called name in an unzipped setfile, or None, without
+        parsing anything after it."""
+        for card in cls.iter_cards(ifile):
+            if card.name == name:
+                return card
+        return None
+
+    @classmethod
+    def from_packagefile(
+        cls,
+        filepath: Path,
+        delete_temporaries=True,
+        compact: bool = False,
+        cache: Union[bool, ParseCache] = True,
+    ) -> "Set":
+        """Reads from zipped .mse-set file. The 'set' member is parsed straight out of the
+        zip and nothing is written to disk; all other members (images etc.) end up in
+        members as PackageMember handles that are only decompressed when read.
+        delete_temporaries is accepted for compatibility but there are none anymore.
+        compact and cache are as for from_setfile; the cache entry is keyed by the CRC
+        and size of the 'set' member, so replacing images doesn't invalidate it."""
+        filepath = Path(filepath)
+        parse_cache = _resolve(cache)
+        with _operation("from_packagefile", filepath) as stats, ZipFile(filepath, 'r') as zip_ref:
+            fingerprint = package_fingerprint(zip_ref, compact) if parse_cache is not None else None
+            s = None
+            if fingerprint is not None:
+                with _phase(stats, "cache"):
+                    s = parse_cache.get(filepath, fingerprint, compact)
+                if s is not None and stats is not None:
+                    stats.cache_hits += 1
+                    stats.cards += len(s.cards)
+            if s is None:
+                if stats is not None and SETFILE_MEMBER in zip_ref.NameToInfo:
+                    stats.bytes_read = zip_ref.getinfo(SETFILE_MEMBER).compress_size
+                with _open_setfile_member(zip_ref, filepath) as ifile:
+                    s = cls._parse_setfile(ifile, compact, stats)
+                s._source_origin = ("package", str(filepath.resolve()), None)
+                if fingerprint is not None:
+                    with _phase(stats, "cache"):
+                        parse_cache.put(filepath, fingerprint, s, compact)
+            with _phase(stats, "members"):
+                s.members = _package_members(filepath, zip_ref)
+        return s
 
     @classmethod
-    def from_packagefile(cls, filepath: Path, delete_temporaries=True) -> "Set":
-        """Reads from zipped .mse-set file, unzips to temporary zip location"""
-        temp_folder = filepath.parent / filepath.stem
-        with ZipFile(filepath, 'r') as zip_ref:
-            zip_ref.extractall(filepath)
-        setfile = temp_folder / 'set'
-        if not setfile.exists():
-            raise ValueError(f"Missing 'set' file! (Are you sure {filepath} is an mse-set?)")
-        with open(setfile, 'rt') as ifile:
-            s = Set.from_setfile(ifile)
-            if delete_temporaries:
-                temp_folder.unlink()
-            return s
+    async def aload(
+        cls, filepath: Path, compact: bool = False, cache: Union[bool, ParseCache] = True
+    ) -> "Set":
+        """from_packagefile, run on the mseutils executor (see mseutils.aio) so as not
+        to block the event loop. Concurrent aloads of the same file with the same
+        arguments share one load and get the same Set; copy it before editing if
+        other requests might be using it. Cancelling an aload only cancels the load
+        itself once no other aload is waiting for it."""
+        filepath = Path(filepath)
+        key = ("from_packagefile", str(filepath.resolve()), compact, cache)
+        return await _shared(
+            key, functools.partial(cls.from_packagefile, filepath, compact=compact, cache=cache)
+        )
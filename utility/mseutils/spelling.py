@@ -0,0 +1,569 @@
+"""Spellchecking card text against the hunspell dictionaries MSE ships, without MSE.
+
+Usage: python -m mseutils spellcheck [-l LANG] [--dictionaries DIR] [--words FILE]
+    [--field FIELD ...] [-j WORKERS] PATH [PATH ...]
+
+PATHs are .mse-set files (every card) or JSON card data such as habitats.json
+(every record). Each misspelling is printed with where it is; the exit status is
+1 if there were any, for CI.
+
+A dictionary is compiled once from its .aff/.dic pair: every word form the affix
+rules allow is generated and written to a hash table file, which is memory-mapped
+to look words up. Compiled files are cached (see dictionary_cache()) by a hash of
+the .aff and .dic, so they are only rebuilt when those change. Compound words
+(COMPOUNDRULE, COMPOUNDFLAG) aren't supported: German-style compounds and
+numbers like "1st" come out as misspelled, or are skipped as not being words.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Pattern, Sequence, Set as PySet, Tuple, Union
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+import zlib
+from .assets import _write_atomic
+from .cache import _default_directory
+from .card import Card
+from .set import Set
+
+
+# The dictionaries in this repository
+DICTIONARY_DIR = Path(__file__).resolve().parent.parent.parent / "data" / "dictionaries"
+
+# Fields that aren't prose, skipped unless asked for by name
+SKIP_FIELDS = ("sciencename", "latin name", "art", "has_styling", "time_created", "time_modified")
+
+_COMPILED_MAGIC = b"MSEd"
+_COMPILED_VERSION = 1
+_COMPILED_HEADER = struct.Struct("<4sHIII")  # magic, version, words, slots, metadata length
+_EMPTY = 0xFFFFFFFF  # slot without a word
+_FLAG_SEP = "\x1f"  # between the prefix flags of an entry
+
+_CHUNK_ITEMS = 2000  # texts sent to a worker at a time
+
+# Words are runs of letters, possibly joined by apostrophes (don't, Wren's); MSE
+# markup such as <sym>...</sym> and <b> is dropped first.
+_re_word = re.compile(r"[^\W\d_]+(?:['’][^\W\d_]+)*")
+_re_tag = re.compile(r"<[^>]*>")
+
+
+class _Affix:
+    __slots__ = ("strip", "add", "contflags", "condition")
+
+    def __init__(self, strip: str, add: str, contflags: Sequence[str], condition: Optional[Pattern[str]]) -> None:
+        self.strip = strip
+        self.add = add
+        self.contflags = contflags
+        self.condition = condition
+
+
+class _AffixClass:
+    __slots__ = ("cross", "rules")
+
+    def __init__(self, cross: bool) -> None:
+        self.cross = cross
+        self.rules = []  # type: List[_Affix]
+
+
+def _suffixed(word: str, rule: _Affix) -> Optional[str]:
+    if not word.endswith(rule.strip) or len(word) <= len(rule.strip) and rule.add == "":
+        return None
+    if rule.condition is not None and rule.condition.search(word) is None:
+        return None
+    return word[:len(word) - len(rule.strip)] + rule.add
+
+
+def _prefixed(word: str, rule: _Affix) -> Optional[str]:
+    if not word.startswith(rule.strip) or len(word) <= len(rule.strip) and rule.add == "":
+        return None
+    if rule.condition is not None and rule.condition.match(word) is None:
+        return None
+    return rule.add + word[len(rule.strip):]
+
+
+class _AffixFile:
+    """What word generation needs from a .aff file."""
+
+    def __init__(self) -> None:
+        self.encoding = "utf-8"
+        self.flag_mode = "short"
+        self.aliases = []  # type: List[List[str]]
+        self.prefixes = {}  # type: Dict[str, _AffixClass]
+        self.suffixes = {}  # type: Dict[str, _AffixClass]
+        self.needaffix = None  # type: Optional[str]
+        self.forbidden = None  # type: Optional[str]
+        self.onlyincompound = None  # type: Optional[str]
+        self.iconv = []  # type: List[Tuple[str, str]]
+
+    def flags(self, s: str) -> List[str]:
+        if self.aliases and s.isdigit():
+            index = int(s) - 1
+            return self.aliases[index] if 0 <= index < len(self.aliases) else []
+        if self.flag_mode == "long":
+            return [s[i:i + 2] for i in range(0, len(s), 2)]
+        if self.flag_mode == "num":
+            return [f for f in s.split(",") if f]
+        return list(s)
+
+
+def _encoding(name: str) -> str:
+    # Python knows Hunspell's "microsoft-cp1251" as "cp1251"
+    return name.lower().replace("microsoft-", "")
+
+
+def _condition(cond: str, suffix: bool) -> Optional[Pattern[str]]:
+    if cond in ("", "."):
+        return None
+    # Hunspell conditions are character classes, literals and '.', as in re
+    escaped = re.sub(r"([\\(){}*+?|$])", r"\\\1", cond)
+    return re.compile(f"(?:{escaped})$" if suffix else escaped)
+
+
+def _read_aff(path: Path) -> _AffixFile:
+    aff = _AffixFile()
+    if not path.exists():
+        return aff  # a .dic on its own is just a word list
+    raw = path.read_bytes()
+    m = re.search(rb"^SET\s+(\S+)", raw, re.MULTILINE)
+    if m is not None:
+        aff.encoding = _encoding(m.group(1).decode("ascii"))
+    text = raw.decode(aff.encoding, "replace")
+    if text.startswith("﻿"):
+        text = text[1:]
+    conditions = {}  # type: Dict[Tuple[str, bool], Optional[Pattern[str]]]
+    lines = [line.split() for line in text.splitlines()]
+    flagged = []  # AF lines hold flags, so their meaning depends on FLAG
+    af_count = True  # the first AF line is the number of aliases
+    for parts in lines:
+        if not parts or parts[0].startswith("#"):
+            continue
+        key = parts[0]
+        if key == "FLAG" and len(parts) > 1:
+            aff.flag_mode = parts[1].lower().replace("utf-8", "short")
+        elif key == "AF" and len(parts) > 1:
+            if not af_count:
+                flagged.append(parts[1])
+            af_count = False
+        elif key in ("NEEDAFFIX", "PSEUDOROOT") and len(parts) > 1:
+            aff.needaffix = parts[1]
+        elif key == "FORBIDDENWORD" and len(parts) > 1:
+            aff.forbidden = parts[1]
+        elif key == "ONLYINCOMPOUND" and len(parts) > 1:
+            aff.onlyincompound = parts[1]
+        elif key == "ICONV" and len(parts) > 2:
+            aff.iconv.append((parts[1], parts[2]))
+    aff.aliases = [aff.flags(f) for f in flagged]
+    for parts in lines:
+        if len(parts) < 4 or parts[0] not in ("PFX", "SFX"):
+            continue
+        suffix = parts[0] == "SFX"
+        classes = aff.suffixes if suffix else aff.prefixes
+        flag = parts[1]
+        if flag not in classes:
+            # Header line: PFX flag cross_product count
+            classes[flag] = _AffixClass(parts[2] == "Y")
+            continue
+        strip = "" if parts[2] == "0" else parts[2]
+        add, _, cont = parts[3].partition("/")
+        add = "" if add == "0" else add
+        cond = parts[4] if len(parts) > 4 else "."
+        key = (cond, suffix)
+        if key not in conditions:
+            try:
+                conditions[key] = _condition(cond, suffix)
+            except re.error:
+                conditions[key] = None
+        classes[flag].rules.append(_Affix(strip, add, aff.flags(cont) if cont else [], conditions[key]))
+    return aff
+
+
+_re_dic_entry = re.compile(r"((?:[^/\\\s]|\\.)+)(?:/(\S*))?")
+
+
+def _read_dic(path: Path, aff: _AffixFile) -> Iterator[Tuple[str, List[str]]]:
+    with open(path, "r", encoding=aff.encoding, errors="replace") as f:
+        lines = iter(f)
+        next(lines, None)  # approximate word count
+        for line in lines:
+            m = _re_dic_entry.match(line.lstrip("﻿"))
+            if m is None:
+                continue
+            word = m.group(1).replace("\\/", "/")
+            yield (word, aff.flags(m.group(2)) if m.group(2) else [])
+
+
+def _expand(aff: _AffixFile, entries: Iterable[Tuple[str, List[str]]]) -> Dict[str, List[Any]]:
+    """Every word form that entries and the suffix rules allow, as {form: [whether
+    it is a word on its own, prefix flags it takes]}. Prefixes are left for lookup
+    to strip, as hunspell does: elisions like Italian dell' would otherwise multiply
+    the number of forms by a hundred."""
+    forms = {}  # type: Dict[str, List[Any]]
+    forbidden = set()  # type: PySet[str]
+
+    def add(form: str, alone: bool, prefixes: Iterable[str]) -> None:
+        entry = forms.get(form)
+        if entry is None:
+            forms[form] = [alone, set(prefixes)]
+        else:
+            entry[0] = entry[0] or alone
+            entry[1].update(prefixes)
+
+    for word, flags in entries:
+        if aff.forbidden is not None and aff.forbidden in flags:
+            forbidden.add(word)
+            continue
+        prefixes = [flag for flag in flags if flag in aff.prefixes]
+        crossing = [flag for flag in prefixes if aff.prefixes[flag].cross]
+        add(word, aff.needaffix not in flags and aff.onlyincompound not in flags, prefixes)
+        for flag in flags:
+            sfx = aff.suffixes.get(flag)
+            if sfx is None:
+                continue
+            for rule in sfx.rules:
+                form = _suffixed(word, rule)
+                if form is None:
+                    continue
+                # Continuation flags can allow prefixes too (French l' on nouns)
+                allowed = [cont for cont in rule.contflags if cont in aff.prefixes]
+                add(form, aff.needaffix not in rule.contflags, allowed + crossing if sfx.cross else allowed)
+                # One level of continuation classes (twofold suffixes)
+                for cont in rule.contflags:
+                    sfx2 = aff.suffixes.get(cont)
+                    if sfx2 is not None:
+                        for rule2 in sfx2.rules:
+                            form2 = _suffixed(form, rule2)
+                            if form2 is not None:
+                                add(form2, True, [c for c in rule2.contflags if c in aff.prefixes])
+    for word in forbidden:
+        forms.pop(word, None)
+    return {form: entry for form, entry in forms.items() if entry[0] or entry[1]}
+
+
+def _source_hash(aff: Path, dic: Path) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    h.update(f"{_COMPILED_VERSION}\x00".encode("ascii"))
+    for path in (aff, dic):
+        h.update(path.read_bytes() if path.exists() else b"")
+        h.update(b"\x00")
+    return h.hexdigest()
+
+
+def dictionary_cache() -> Path:
+    """Where compiled dictionaries are kept: dictionaries/ in $MSEUTILS_CACHE_DIR (or
+    ~/.cache/mseutils), as it is set when this is called."""
+    return _default_directory() / "dictionaries"
+
+
+def compile_dictionary(aff: Union[str, Path], dic: Union[str, Path], out: Union[str, Path]) -> int:
+    """Expands a hunspell .aff/.dic pair into a compiled dictionary file at out;
+    returns how many word forms it holds. The file is a hash table: a header, JSON
+    metadata (prefix rules, ICONV), a power-of-two number of little-endian uint32
+    slots (offset of an entry in the blob that follows, probed linearly from the
+    form's CRC-32) and the entries, each "form\t" then 1 or 0 for whether it is a
+    word on its own, the prefix flags it takes and a newline."""
+    aff, dic = Path(aff), Path(dic)
+    if not dic.exists():
+        raise ValueError(f"No dictionary {dic}")
+    affixes = _read_aff(aff)
+    forms = _expand(affixes, _read_dic(dic, affixes))
+    if len(forms) == 0:
+        raise ValueError(f"Dictionary {dic} has no words")
+    n_slots = 1 << (2 * len(forms) - 1).bit_length()  # at most half full
+    mask = n_slots - 1
+    slots = [_EMPTY] * n_slots
+    entries = []  # type: List[bytes]
+    offset = 0
+    crc32 = zlib.crc32
+    for form in sorted(forms):
+        alone, prefixes = forms[form]
+        key = form.encode("utf-8", "surrogatepass") + b"\t"
+        entry = key + ("1" if alone else "0").encode("ascii") + _FLAG_SEP.join(sorted(prefixes)).encode("utf-8")
+        i = crc32(key) & mask
+        while slots[i] != _EMPTY:
+            i = (i + 1) & mask
+        slots[i] = offset
+        entries.append(entry + b"\n")
+        offset += len(entry) + 1
+    metadata = json.dumps(
+        {
+            "source": dic.stem,
+            "iconv": affixes.iconv,
+            "prefixes": [
+                [flag, rule.strip, rule.add, rule.condition.pattern if rule.condition is not None else None]
+                for flag, pfx in affixes.prefixes.items()
+                for rule in pfx.rules
+            ],
+        },
+        ensure_ascii=False,
+    ).encode("utf-8")
+    data = b"".join([
+        _COMPILED_HEADER.pack(_COMPILED_MAGIC, _COMPILED_VERSION, len(forms), n_slots, len(metadata)),
+        metadata,
+        struct.pack(f"<{n_slots}I", *slots),
+        b"".join(entries),
+    ])
+    _write_atomic(Path(out), data)
+    return len(forms)
+
+
+class Dictionary:
+    """A compiled dictionary, memory-mapped. Opening one costs next to nothing, so
+    every worker process opens its own.
+
+        d = Dictionary.load("en_us")
+        d.check("Wren's")           # True
+        d.misspelled("Eats shoots and leafs, mostyl")  # [(26, 'mostyl')]
+    """
+
+    def __init__(self, path: Union[str, Path], extra: Iterable[str] = ()) -> None:
+        self.path = Path(path)
+        self.extra = set(extra)  # more words to accept, e.g. game terms
+        with open(self.path, "rb") as f:
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, version, self.n_words, n_slots, meta_len = _COMPILED_HEADER.unpack_from(self._data)
+        except struct.error:
+            magic, version = b"", 0
+        if magic != _COMPILED_MAGIC or version != _COMPILED_VERSION:
+            self._data.close()
+            raise ValueError(f"{self.path} is not a compiled dictionary (or from another version of mseutils)")
+        start = _COMPILED_HEADER.size
+        metadata = json.loads(self._data[start:start + meta_len])
+        self.source = metadata["source"]
+        self._iconv = [tuple(pair) for pair in metadata["iconv"]]
+        # Prefix rules by what they add: (flag, what they strip, condition)
+        self._prefixes = {}  # type: Dict[str, List[Tuple[str, str, Optional[Pattern[str]]]]]
+        for flag, strip, add, condition in metadata["prefixes"]:
+            self._prefixes.setdefault(add, []).append(
+                (flag, strip, re.compile(condition) if condition is not None else None)
+            )
+        self._prefix_lengths = sorted({len(add) for add in self._prefixes})
+        self._mask = n_slots - 1
+        self._slots_start = start + meta_len
+        self._words_start = self._slots_start + 4 * n_slots
+        if sys.byteorder == "little":
+            self._slots = memoryview(self._data)[self._slots_start:self._words_start].cast("I")
+        else:
+            self._slots = struct.unpack_from(f"<{n_slots}I", self._data, self._slots_start)
+
+    @classmethod
+    def load(
+        cls,
+        name: str,
+        directory: Union[str, Path] = DICTIONARY_DIR,
+        cache: Union[None, str, Path] = None,
+        extra: Iterable[str] = (),
+    ) -> "Dictionary":
+        """The dictionary name (e.g. "en_us") from directory's name.aff and name.dic,
+        compiled into cache (by default dictionary_cache()) first unless it already is."""
+        aff, dic = Path(directory) / f"{name}.aff", Path(directory) / f"{name}.dic"
+        if not dic.exists():
+            raise ValueError(f"No dictionary {name} in {directory}")
+        cache = Path(cache) if cache is not None else dictionary_cache()
+        compiled = cache / f"{name}-{_source_hash(aff, dic)}.msedict"
+        if not compiled.exists():
+            compile_dictionary(aff, dic, compiled)
+        return cls(compiled, extra)
+
+    def _entry(self, form: str) -> Optional[str]:
+        """What follows form's tab in its entry, if it has one."""
+        key = form.encode("utf-8", "surrogatepass") + b"\t"
+        data = self._data
+        i = zlib.crc32(key) & self._mask
+        n = len(key)
+        while True:
+            offset = self._slots[i]
+            if offset == _EMPTY:
+                return None
+            start = self._words_start + offset
+            if data[start:start + n] == key:
+                return data[start + n:data.find(b"\n", start + n)].decode("utf-8")
+            i = (i + 1) & self._mask
+
+    def __contains__(self, word: str) -> bool:
+        """Whether word is in the dictionary exactly as it is, prefixes and all."""
+        entry = self._entry(word)
+        if entry is not None and entry[0] == "1":
+            return True
+        for length in self._prefix_lengths:
+            if length >= len(word):
+                break
+            for flag, strip, condition in self._prefixes.get(word[:length], ()):
+                stem = strip + word[length:]
+                if condition is not None and condition.match(stem) is None:
+                    continue
+                entry = self._entry(stem)
+                if entry is not None and flag in entry[1:].split(_FLAG_SEP):
+                    return True
+        return False
+
+    def check(self, word: str) -> bool:
+        """Whether word is spelled right, allowing for capitalisation as hunspell
+        does: "Wren" and "WREN" are fine if "wren" is, "CAROLINA" if "Carolina" is."""
+        for a, b in self._iconv:
+            word = word.replace(a, b)
+        if word in self.extra or word in self:
+            return True
+        lower = word.lower()
+        if word[:1].isupper() and (word[1:].islower() or word.isupper()):
+            if lower in self or lower in self.extra:
+                return True
+            if word.isupper() and lower.capitalize() in self:
+                return True
+        return False
+
+    def misspelled(self, text: str) -> List[Tuple[int, str]]:
+        """(offset, word) of every misspelled word of text."""
+        text = _re_tag.sub(lambda m: " " * len(m.group()), text)
+        return [(m.start(), m.group()) for m in _re_word.finditer(text) if not self.check(m.group())]
+
+    def close(self) -> None:
+        if isinstance(self._slots, memoryview):
+            self._slots.release()
+        self._data.close()
+
+
+class Misspelling:
+    """A misspelled word: in which card (or record) and field, and at what offset of
+    the field's text (for a list field like 'rule text', of which line)."""
+
+    def __init__(self, card: str, field: str, word: str, offset: int, line: Optional[int] = None) -> None:
+        self.card = card
+        self.field = field
+        self.word = word
+        self.offset = offset
+        self.line = line
+
+    def __repr__(self) -> str:
+        return f"Misspelling({self.card!r}, {self.field!r}, {self.word!r}, {self.offset})"
+
+    def __str__(self) -> str:
+        where = self.field if self.line is None else f"{self.field}[{self.line}]"
+        return f"{self.card}: {where}: {self.word!r} at {self.offset}"
+
+
+# (card, field, line or None, text)
+_Text = Tuple[str, str, Optional[int], str]
+
+
+def _card_texts(card: Card, fields: Optional[Iterable[str]]) -> Iterator[_Text]:
+    values = [("name", card.name), ("notes", card.notes)] + list(card.remaining_keys.items())
+    wanted = None if fields is None else set(fields)
+    for field, value in values:
+        if wanted is not None and field not in wanted:
+            continue
+        if wanted is None and field.lower() in SKIP_FIELDS:
+            continue
+        if isinstance(value, str):
+            yield (card.name, field, None, value)
+        elif isinstance(value, list):
+            for line, item in enumerate(value):
+                if isinstance(item, str):
+                    yield (card.name, field, line, item)
+
+
+def _record_texts(records: Iterable[Dict[str, Any]], fields: Optional[Iterable[str]]) -> Iterator[_Text]:
+    wanted = None if fields is None else set(fields)
+    for i, record in enumerate(records):
+        name = str(record.get("name") or record.get("Name") or f"record {i}")
+        for field, value in record.items():
+            if wanted is not None and field not in wanted:
+                continue
+            if wanted is None and field.lower() in SKIP_FIELDS:
+                continue
+            if isinstance(value, str):
+                yield (name, field, None, value)
+
+
+_worker_dictionary = None  # type: Optional[Dictionary]
+
+
+def _open_in_worker(path: str, extra: List[str]) -> None:
+    global _worker_dictionary
+    _worker_dictionary = Dictionary(path, extra)
+
+
+def _check_chunk(texts: List[_Text], dictionary: Optional[Dictionary] = None) -> List[Misspelling]:
+    d = dictionary if dictionary is not None else _worker_dictionary
+    found = []  # type: List[Misspelling]
+    for card, field, line, text in texts:
+        for offset, word in d.misspelled(text):
+            found.append(Misspelling(card, field, word, offset, line))
+    return found
+
+
+def check_texts(texts: Iterable[_Text], dictionary: Dictionary, workers: Optional[int] = None) -> List[Misspelling]:
+    """Checks (card, field, line, text) items in chunks across worker processes (by
+    default one per CPU), each with the dictionary mapped in; misspellings come back
+    in the order of texts."""
+    texts = list(texts)
+    chunks = [texts[i:i + _CHUNK_ITEMS] for i in range(0, len(texts), _CHUNK_ITEMS)]
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, len(chunks)))
+    if workers == 1:
+        return [m for chunk in chunks for m in _check_chunk(chunk, dictionary)]
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_open_in_worker, initargs=(str(dictionary.path), sorted(dictionary.extra))
+    ) as executor:
+        return [m for found in executor.map(_check_chunk, chunks) for m in found]
+
+
+def check_set(
+    s: Set, dictionary: Dictionary, fields: Optional[Iterable[str]] = None, workers: Optional[int] = None
+) -> List[Misspelling]:
+    """Spellchecks the text fields of every card of s (all fields but SKIP_FIELDS,
+    or just fields), in parallel as check_texts does."""
+    fields = None if fields is None else list(fields)
+    return check_texts(
+        (t for card in s.cards.values() for t in _card_texts(card, fields)), dictionary, workers
+    )
+
+
+def check_records(
+    records: Iterable[Dict[str, Any]],
+    dictionary: Dictionary,
+    fields: Optional[Iterable[str]] = None,
+    workers: Optional[int] = None,
+) -> List[Misspelling]:
+    """Same as check_set, for card data as dicts (e.g. the records of habitats.json),
+    named by their 'name' or 'Name'."""
+    fields = None if fields is None else list(fields)
+    return check_texts(_record_texts(records, fields), dictionary, workers)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="mseutils spellcheck", description="Spellcheck card text.")
+    parser.add_argument("paths", type=Path, nargs="+", help=".mse-set files or JSON card data")
+    parser.add_argument("-l", "--lang", default="en_us", help="dictionary to use (default: en_us)")
+    parser.add_argument("--dictionaries", type=Path, default=DICTIONARY_DIR, help="folder of .aff/.dic files")
+    parser.add_argument("--words", type=Path, help="file of extra words to accept, one per line")
+    parser.add_argument("--field", action="append", help="check only this field (may be repeated)")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="worker processes (default: one per CPU)")
+    args = parser.parse_args(argv)
+
+    extra = []  # type: List[str]
+    if args.words is not None:
+        extra = [w.strip() for w in args.words.read_text(encoding="utf-8").splitlines() if w.strip()]
+    try:
+        dictionary = Dictionary.load(args.lang, args.dictionaries, extra=extra)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+    total = 0
+    for path in args.paths:
+        if path.suffix == ".json":
+            with open(path, "r", encoding="utf-8") as f:
+                found = check_records(json.load(f), dictionary, args.field, args.workers)
+        else:
+            found = check_set(Set.from_packagefile(path), dictionary, args.field, args.workers)
+        for misspelling in found:
+            print(f"{path}: {misspelling}")
+        total += len(found)
+    print(f"{total} misspelled words", file=sys.stderr)
+    return 1 if total else 0
@@ -0,0 +1,171 @@
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+import threading
+import time
+
+
+class ParseStats:
+    """Counters and per-phase timings of one load or save (operation says which), or
+    the sum over several, as collected by instrument().
+
+    lines_scanned, blocks (group tags such as 'card:' or 'rule text:') and max_depth
+    (deepest nesting of those) describe the setfile text; adaptation_calls is how
+    often the adaptation function ran, time_decodes how many timestamps had to be
+    parsed rather than coming out of the decode cache. When saving, blocks_rendered
+    counts the blocks that had changed and couldn't just be copied. timings maps
+    phase (read, parse, adapt, build, render, write, ...) to seconds; adapt is part
+    of parse."""
+
+    def __init__(self, operation: str = "") -> None:
+        self.operation = operation
+        self.path = None  # type: Optional[str]
+        self.operations = 0
+        self.lines_scanned = 0
+        self.blocks = 0
+        self.max_depth = 0
+        self.adaptation_calls = 0
+        self.time_decodes = 0
+        self.cards = 0
+        self.blocks_rendered = 0
+        self.cache_hits = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.timings = {}  # type: Dict[str, float]
+
+    def add_time(self, phase: str, seconds: float) -> None:
+        self.timings[phase] = self.timings.get(phase, 0.0) + seconds
+
+    def merge(self, other: "ParseStats") -> None:
+        """Adds other's counts and timings to these."""
+        for k in (
+            "operations", "lines_scanned", "blocks", "adaptation_calls", "time_decodes",
+            "cards", "blocks_rendered", "cache_hits", "bytes_read", "bytes_written",
+        ):
+            setattr(self, k, getattr(self, k) + getattr(other, k))
+        self.max_depth = max(self.max_depth, other.max_depth)
+        for phase, seconds in other.timings.items():
+            self.add_time(phase, seconds)
+
+    def as_dict(self) -> Dict[str, Any]:
+        d = dict(vars(self))
+        d["timings"] = dict(self.timings)
+        return d
+
+    def __repr__(self) -> str:
+        timings = ", ".join(f"{k}={v * 1000:.1f}ms" for k, v in self.timings.items())
+        return (
+            f"ParseStats({self.operation or 'total'}: {self.operations} op(s), {self.lines_scanned} lines,"
+            f" {self.blocks} blocks (depth {self.max_depth}), {self.cards} cards,"
+            f" {self.adaptation_calls} adaptations, {self.time_decodes} time decodes,"
+            f" {self.blocks_rendered} blocks rendered, {self.cache_hits} cache hits,"
+            f" {self.bytes_read} B read, {self.bytes_written} B written; {timings})"
+        )
+
+
+# Instrumentation is on while there's a hook or an instrument() block; otherwise
+# the load/save paths only ever check these two lists once per operation.
+_hooks = []  # type: List[Callable[[ParseStats], None]]
+_collectors = []  # type: List[ParseStats]
+_local = threading.local()  # .current: the operation being recorded in this thread
+
+
+def add_stats_hook(hook: Callable[[ParseStats], None]) -> None:
+    """Calls hook with the ParseStats of every load or save that completes from now
+    on, e.g. to feed them to a metrics collector."""
+    _hooks.append(hook)
+
+
+def remove_stats_hook(hook: Callable[[ParseStats], None]) -> None:
+    _hooks.remove(hook)
+
+
+@contextmanager
+def instrument() -> Iterator[ParseStats]:
+    """Collects the stats of every load and save in the with block, summed up:
+
+        with instrument() as stats:
+            s = Set.from_packagefile(path)
+        print(stats.timings)
+
+    Loads and saves running in other threads meanwhile are counted too."""
+    stats = ParseStats()
+    _collectors.append(stats)
+    try:
+        yield stats
+    finally:
+        _collectors.remove(stats)
+
+
+@contextmanager
+def _operation(name: str, path: Any = None) -> Iterator[Optional[ParseStats]]:
+    """Records one load or save, yielding its stats, or None when instrumentation is
+    off. Operations started inside another one (from_packagefile parsing its 'set'
+    member, say) count towards the outer one."""
+    current = getattr(_local, "current", None)
+    if current is not None:
+        yield current
+        return
+    if not _hooks and not _collectors:
+        yield None
+        return
+    stats = ParseStats(name)
+    stats.path = None if path is None else str(path)
+    stats.operations = 1
+    _local.current = stats
+    start = time.perf_counter()
+    try:
+        yield stats
+    finally:
+        stats.add_time("total", time.perf_counter() - start)
+        _local.current = None
+    for collector in _collectors:
+        collector.merge(stats)
+    for hook in list(_hooks):
+        hook(stats)
+
+
+class _Phase:
+    __slots__ = ("stats", "name", "start")
+
+    def __init__(self, stats: ParseStats, name: str) -> None:
+        self.stats = stats
+        self.name = name
+
+    def __enter__(self) -> None:
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc: Any) -> None:
+        self.stats.add_time(self.name, time.perf_counter() - self.start)
+
+
+class _NoPhase:
+    __slots__ = ()
+
+    def __enter__(self) -> None:
+        pass
+
+    def __exit__(self, *exc: Any) -> None:
+        pass
+
+
+_NO_PHASE = _NoPhase()
+
+
+def _phase(stats: Optional[ParseStats], name: str) -> Any:
+    """Context manager timing one phase into stats; does nothing if stats is None."""
+    return _NO_PHASE if stats is None else _Phase(stats, name)
+
+
+def _counting(stats: ParseStats, adaptation_func: Callable[[Any, Any], Any]) -> Callable[[Any, Any], Any]:
+    """adaptation_func, counting and timing its calls into stats."""
+    perf_counter = time.perf_counter
+
+    def counted(k: Any, v: Any) -> Any:
+        stats.adaptation_calls += 1
+        start = perf_counter()
+        try:
+            return adaptation_func(k, v)
+        finally:
+            stats.add_time("adapt", perf_counter() - start)
+
+    return counted
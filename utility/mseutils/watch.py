@@ -0,0 +1,436 @@
+"""Keeping sets and cards_to_import current while designers edit them.
+
+Usage: python -m mseutils watch [--sets DIR] [--game DIR] [--history] [--interval S]
+    [--debounce S] [--compact] [--no-cache]
+
+Watches the .mse-set files in --sets and the *.json card data in --game (a
+.mse-game folder with translate_json_to_mse.py in it). A set that is saved is
+re-read, re-parsing only the blocks that changed; JSON that is saved is
+re-ingested, that file alone, and cards_to_import re-exported. With --history,
+every save is also recorded in the set's history (see mseutils.history).
+"""
+from fnmatch import fnmatch
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Union
+from zipfile import ZipFile
+import argparse
+import functools
+import importlib.util
+import io
+import os
+import sys
+import threading
+import time
+from .cache import ParseCache
+from .card import _SetfileScanner, _cardify_incoming_types, _scan_indented_block
+from .compact import CardSchema, CompactCard
+from .history import SetHistory
+from .index import SortedIndex, _IndexSet
+from .offsets import _split_text_blocks
+from .package import _open_setfile_member, _package_members
+from .set import Set
+
+
+# Polling a folder of a few dozen files is a handful of stat calls, so this is
+# cheap, and with the default debounce a save shows up within half a second.
+_DEFAULT_INTERVAL = 0.2
+_DEFAULT_DEBOUNCE = 0.25
+
+_Stat = Tuple[int, int]  # (st_mtime_ns, st_size)
+
+
+class Watcher:
+    """Polls the files in directory matching any of patterns for changes, by mtime and
+    size. A file counts as changed once it has kept the same mtime and size for
+    debounce seconds, so a burst of writes (or one slow save) is reported once, when
+    it is over. Deleted files are reported as changed too."""
+
+    def __init__(
+        self,
+        directory: Union[str, Path],
+        patterns: Iterable[str],
+        interval: float = _DEFAULT_INTERVAL,
+        debounce: float = _DEFAULT_DEBOUNCE,
+    ) -> None:
+        self.directory = Path(directory)
+        self.patterns = list(patterns)
+        self.interval = interval
+        self.debounce = debounce
+        self._seen = self._scan()
+        self._pending = {}  # type: Dict[Path, Tuple[Optional[_Stat], float]]
+
+    def files(self) -> List[Path]:
+        """The matching files as of the last poll, sorted."""
+        return sorted(self._seen)
+
+    def _scan(self) -> Dict[Path, _Stat]:
+        found = {}  # type: Dict[Path, _Stat]
+        try:
+            entries = list(os.scandir(self.directory))
+        except FileNotFoundError:
+            return found
+        for entry in entries:
+            if not any(fnmatch(entry.name, p) for p in self.patterns):
+                continue
+            try:
+                st = entry.stat()
+            except FileNotFoundError:
+                continue
+            if entry.is_file():
+                found[Path(entry.path)] = (st.st_mtime_ns, st.st_size)
+        return found
+
+    def poll(self, now: Optional[float] = None) -> List[Path]:
+        """Checks the files once; returns those whose changes have settled since the
+        last poll, sorted."""
+        if now is None:
+            now = time.monotonic()
+        current = self._scan()
+        settled = []  # type: List[Path]
+        for path in set(current) | set(self._seen) | set(self._pending):
+            stat = current.get(path)
+            if stat == self._seen.get(path):
+                self._pending.pop(path, None)  # changed back, or never changed
+                continue
+            pending = self._pending.get(path)
+            if pending is None or pending[0] != stat:
+                self._pending[path] = (stat, now)  # still being written
+            elif now - pending[1] >= self.debounce:
+                del self._pending[path]
+                if stat is None:
+                    del self._seen[path]
+                else:
+                    self._seen[path] = stat
+                settled.append(path)
+        return sorted(settled)
+
+    def run(self, callback: Callable[[List[Path]], Any], stop: Optional[threading.Event] = None) -> None:
+        """Polls every interval seconds, calling callback with the changed files, until
+        stop is set (or forever)."""
+        if stop is None:
+            stop = threading.Event()
+        while not stop.is_set():
+            changed = self.poll()
+            if changed:
+                callback(changed)
+            stop.wait(self.interval)
+
+
+class _Unsplittable(Exception):
+    """A block didn't parse on its own; the file has to be parsed as a whole."""
+
+
+def _parse_alone(text: str, adapt: Callable[..., Any] = _cardify_incoming_types) -> Tuple[str, Any]:
+    scanner = _SetfileScanner.from_text(text)
+    key, val = _scan_indented_block(scanner, adaptation_func=adapt)
+    if scanner.peek_line() != "":
+        raise _Unsplittable()
+    return (key, val)
+
+
+def _reparse(old: Optional[Set], source: str, compact: bool = False) -> Tuple[Set, List[str]]:
+    """Parses source into a Set, reusing old's values for blocks whose text hasn't
+    changed (and that haven't been edited in memory) instead of parsing them again.
+    Also returns the keys of the blocks that did have to be parsed. With compact,
+    new cards are CompactCards sharing the CardSchema of old's."""
+    adapt = _cardify_incoming_types
+    if compact:
+        schema = None  # type: Optional[CardSchema]
+        if old is not None:
+            schema = next((c.schema for c in old.cards.values() if isinstance(c, CompactCard)), None)
+        schema = schema if schema is not None else CardSchema()
+        adapt = functools.partial(_cardify_incoming_types, card_factory=schema.new_card)
+    reusable = {}  # type: Dict[str, Tuple[str, Any]]
+    if old is not None and old._source is not None:
+        for k, spans in old._spans.items():
+            # With a repeated key only the last block's value was kept
+            if len(spans) == 1 and k in old.all_data and not old._is_dirty(k):
+                start, end = spans[0]
+                reusable[old._source[start:end]] = (k, old.all_data[k])
+    set_fields = {}  # type: Dict[str, Any]
+    spans = {}  # type: Dict[str, List[Tuple[int, int]]]
+    parsed = []  # type: List[str]
+    try:
+        for start, end in _split_text_blocks(source):
+            text = source[start:end]
+            block = reusable.get(text)
+            if block is None:
+                block = _parse_alone(text, adapt)
+                parsed.append(block[0])
+            set_fields[block[0]] = block[1]
+            spans.setdefault(block[0], []).append((start, end))
+    except _Unsplittable:
+        s = Set._parse_setfile(io.StringIO(source), compact=compact)
+        return (s, list(s.all_data))
+    s = Set(all_data=set_fields)
+    s._source = source
+    s._spans = spans
+    return (s, parsed)
+
+
+def _refresh(target: Set, fresh: Set) -> None:
+    """Makes target hold what fresh does, keeping its indexes and tables (rebuilt over
+    the new cards), so whoever holds on to target sees the new contents."""
+    specs = [(field, isinstance(index, SortedIndex)) for field, index in target._indexes.indexes.items()]
+    tables = target._indexes.tables
+    for card in target.cards.values():
+        card._set_listener(None)
+    target._indexes = _IndexSet()
+    target.all_data = fresh.all_data
+    target.cards = fresh.cards
+    target.members = fresh.members
+    target._source = fresh._source
+    target._spans = fresh._spans
+    for field, sorted in specs:
+        target.create_index(field, sorted=sorted)
+    for table in tables:
+        table._rebuild(target.cards.values())
+        target._listen()
+        target._indexes.tables.append(table)
+
+
+class SetChange:
+    """What changed in one set file. added, removed and changed are all_data keys
+    (names, for cards). set is None once the file is deleted; if it couldn't be read
+    (say it was caught half-written), error says why and the set is left as it was."""
+
+    def __init__(
+        self,
+        path: Path,
+        set: Optional[Set],
+        added: Optional[List[str]] = None,
+        removed: Optional[List[str]] = None,
+        changed: Optional[List[str]] = None,
+        error: Optional[BaseException] = None,
+        seconds: float = 0.0,
+    ) -> None:
+        self.path = path
+        self.set = set
+        self.added = added if added is not None else []
+        self.removed = removed if removed is not None else []
+        self.changed = changed if changed is not None else []
+        self.error = error
+        self.seconds = seconds
+
+    def __repr__(self) -> str:
+        if self.error is not None:
+            return f"SetChange({str(self.path)!r}, error={self.error!r})"
+        return (
+            f"SetChange({str(self.path)!r}, {len(self.added)} added, {len(self.removed)} removed,"
+            f" {len(self.changed)} changed)"
+        )
+
+
+class SetWatcher:
+    """Keeps a Set loaded for every .mse-set file in directory, current with what is on
+    disk. When a file is saved the Set in sets is updated in place (indexes and all),
+    re-parsing only the blocks whose text changed; cards that didn't change stay the
+    same objects. Edits made in memory to a set are lost when its file changes.
+    compact and cache are as for Set.from_packagefile; the cache is only used to load
+    a set whole, when the watch begins or a new file appears.
+
+        watcher = SetWatcher("sets")
+        threading.Thread(target=watcher.run, daemon=True).start()
+        ...
+        watcher.sets[Path("sets/thistledown-core.mse-set")].cards["Carolina Wren"]
+    """
+
+    def __init__(
+        self,
+        directory: Union[str, Path],
+        interval: float = _DEFAULT_INTERVAL,
+        debounce: float = _DEFAULT_DEBOUNCE,
+        on_change: Optional[Callable[[SetChange], Any]] = None,
+        compact: bool = False,
+        cache: Union[bool, ParseCache] = True,
+    ) -> None:
+        self.watcher = Watcher(directory, ["*.mse-set"], interval=interval, debounce=debounce)
+        self.on_change = on_change
+        self.compact = compact
+        self.cache = cache
+        self.sets = {}  # type: Dict[Path, Set]
+        self.errors = {}  # type: Dict[Path, BaseException]
+        for path in self.watcher.files():
+            try:
+                self.sets[path] = Set.from_packagefile(path, compact=compact, cache=cache)
+            except Exception as e:
+                self.errors[path] = e
+
+    def refresh(self, path: Path) -> SetChange:
+        """Brings the Set of path up to date with the file."""
+        start = time.perf_counter()
+        old = self.sets.get(path)
+        if not path.exists():
+            self.sets.pop(path, None)
+            self.errors.pop(path, None)
+            return SetChange(path, None, removed=list(old.all_data) if old is not None else [])
+        try:
+            if old is None:
+                fresh = Set.from_packagefile(path, compact=self.compact, cache=self.cache)
+                parsed = list(fresh.all_data)
+            else:
+                with ZipFile(path, "r") as zip_ref:
+                    with _open_setfile_member(zip_ref, path) as ifile:
+                        source = ifile.read()
+                    fresh, parsed = _reparse(old, source, self.compact)
+                    fresh.members = _package_members(path, zip_ref)
+        except Exception as e:
+            self.errors[path] = e
+            return SetChange(path, old, error=e, seconds=time.perf_counter() - start)
+        self.errors.pop(path, None)
+        old_keys = old.all_data if old is not None else {}
+        change = SetChange(
+            path,
+            fresh,
+            added=[k for k in parsed if k not in old_keys],
+            removed=[k for k in old_keys if k not in fresh.all_data],
+            changed=[k for k in parsed if k in old_keys],
+        )
+        if old is None:
+            self.sets[path] = fresh
+        else:
+            _refresh(old, fresh)
+            change.set = old
+        change.seconds = time.perf_counter() - start
+        return change
+
+    def poll(self) -> List[SetChange]:
+        """Checks for saved files once, refreshing their sets."""
+        changes = [self.refresh(path) for path in self.watcher.poll()]
+        if self.on_change is not None:
+            for change in changes:
+                self.on_change(change)
+        return changes
+
+    def run(self, stop: Optional[threading.Event] = None) -> None:
+        """Polls until stop is set (or forever); changes go to on_change."""
+        self.watcher.run(lambda _: self.poll(), stop)
+
+
+def _load_translator(game_dir: Path) -> Any:
+    """The game folder's translate_json_to_mse.py, as a module."""
+    path = game_dir / "translate_json_to_mse.py"
+    if not path.is_file():
+        raise ValueError(f"No translate_json_to_mse.py in {game_dir}")
+    spec = importlib.util.spec_from_file_location("translate_json_to_mse", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class ImportListWatcher:
+    """Keeps game_dir/cards_to_import current with the *.json card data next to it, as
+    translate_json_to_mse.py would write it. Each file's cards are kept once read, so
+    a save re-reads only the file that was saved. cards_to_import always holds every
+    card changed since the watch began (against the manifest as it was then), so
+    nothing is lost if it isn't imported between two saves; the manifest is kept up
+    to date as each export is written."""
+
+    def __init__(
+        self,
+        game_dir: Union[str, Path],
+        interval: float = _DEFAULT_INTERVAL,
+        debounce: float = _DEFAULT_DEBOUNCE,
+        deletions: bool = False,
+        on_export: Optional[Callable[[List[Dict[str, Any]], List[str]], Any]] = None,
+    ) -> None:
+        self.game_dir = Path(game_dir)
+        self.translator = _load_translator(self.game_dir)
+        self.watcher = Watcher(self.game_dir, ["*.json"], interval=interval, debounce=debounce)
+        self.deletions = deletions
+        self.on_export = on_export
+        self._baseline = self.translator.load_manifest(self.game_dir / self.translator._MANIFEST_NAME)
+        self._ingested = {}  # type: Dict[Path, List[Tuple[Optional[str], Dict[str, Any]]]]
+        for path in self.watcher.files():
+            self._ingested[path] = self.translator.ingest_file(path)
+
+    def export(self) -> Tuple[List[Dict[str, Any]], List[str]]:
+        """Writes cards_to_import from the cards as last read; returns (changed, removed)."""
+        cards = self.translator.merge_ingested(self._ingested[p] for p in sorted(self._ingested))
+        changed, removed = self.translator.export(
+            cards, self.game_dir, deletions=self.deletions, manifest=self._baseline
+        )
+        if self.on_export is not None:
+            self.on_export(changed, removed)
+        return (changed, removed)
+
+    def poll(self) -> bool:
+        """Checks for saved JSON once; re-exports if any was. A file that doesn't parse
+        (yet) is skipped with its old cards kept, and raises after the export."""
+        changed = self.watcher.poll()
+        if not changed:
+            return False
+        error = None  # type: Optional[BaseException]
+        for path in changed:
+            if not path.exists():
+                self._ingested.pop(path, None)
+                continue
+            try:
+                self._ingested[path] = self.translator.ingest_file(path)
+            except ValueError as e:
+                error = e
+        self.export()
+        if error is not None:
+            raise error
+        return True
+
+    def run(self, stop: Optional[threading.Event] = None) -> None:
+        self.watcher.run(lambda _: self.poll(), stop)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="mseutils watch", description="Keep sets and cards_to_import current.")
+    parser.add_argument("--sets", type=Path, help="folder of .mse-set files to keep loaded")
+    parser.add_argument("--game", type=Path, help=".mse-game folder whose *.json to export on save")
+    parser.add_argument("--deletions", action="store_true", help="also list removed cards in cards_to_import")
+    parser.add_argument("--history", action="store_true", help="record each saved set in its history")
+    parser.add_argument("--compact", action="store_true", help="load cards as CompactCards")
+    parser.add_argument("--no-cache", action="store_true", help="bypass the parse cache")
+    parser.add_argument("--interval", type=float, default=_DEFAULT_INTERVAL, help="seconds between polls")
+    parser.add_argument("--debounce", type=float, default=_DEFAULT_DEBOUNCE, help="seconds a file must be still")
+    args = parser.parse_args(argv)
+    if args.sets is None and args.game is None:
+        parser.error("give --sets, --game or both")
+
+    def report(change: SetChange) -> None:
+        if change.error is not None:
+            print(f"FAILED {change.path}: {change.error}", file=sys.stderr, flush=True)
+        elif change.set is None:
+            print(f"{change.path}: deleted", flush=True)
+        else:
+            print(
+                f"{change.path}: {len(change.added)} added, {len(change.removed)} removed,"
+                f" {len(change.changed)} changed ({change.seconds:.2f} s)",
+                flush=True,
+            )
+            if args.history:
+                revision = SetHistory.for_set(change.path).record(change.path)
+                if revision is not None:
+                    print(f"{change.path}: recorded revision {revision.number}", flush=True)
+
+    def exported(changed: List[Dict[str, Any]], removed: List[str]) -> None:
+        print(f"cards_to_import: {len(changed)} new or changed cards, {len(removed)} removed", flush=True)
+
+    set_watcher = None  # type: Optional[SetWatcher]
+    import_watcher = None  # type: Optional[ImportListWatcher]
+    if args.sets is not None:
+        set_watcher = SetWatcher(
+            args.sets, args.interval, args.debounce, on_change=report, compact=args.compact, cache=not args.no_cache
+        )
+        n_cards = sum(len(s.cards) for s in set_watcher.sets.values())
+        print(f"watching {len(set_watcher.sets)} sets ({n_cards} cards) in {args.sets}", flush=True)
+    if args.game is not None:
+        import_watcher = ImportListWatcher(args.game, args.interval, args.debounce, args.deletions, exported)
+        print(f"watching {len(import_watcher.watcher.files())} json files in {args.game}", flush=True)
+    try:
+        while True:
+            if set_watcher is not None:
+                set_watcher.poll()
+            if import_watcher is not None:
+                try:
+                    import_watcher.poll()
+                except ValueError as e:
+                    print(f"FAILED {e}", file=sys.stderr, flush=True)
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        return 0
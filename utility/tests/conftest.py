@@ -0,0 +1,17 @@
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def _private_cache(tmp_path_factory):
+    """Every test gets its own cache directory, so none reads or writes the user's
+    ~/.cache/mseutils: the default parse cache (and the font and dictionary caches
+    under it) is set up afresh in a temporary folder. This uses its own MonkeyPatch
+    so a test calling monkeypatch.undo() doesn't undo it."""
+    from mseutils import cache
+
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setenv("MSEUTILS_CACHE_DIR", str(tmp_path_factory.mktemp("cache")))
+        mp.delenv("MSEUTILS_NO_CACHE", raising=False)
+        mp.setattr(cache, "_default_cache", None)
+        mp.setattr(cache, "_default_configured", False)
+        yield
@@ -1,4 +1,5 @@
 from datetime import datetime
+import io
 from pathlib import Path
 from mseutils import Card, Set
 
@@ -81,6 +82,26 @@ class TestCard:
         assert c.time_modified == datetime(1941, 12, 7, 7, 48, 0)
         assert c.time_created == datetime(1776, 7, 4, 13, 2, 3)
 
+    def test_time_fields_decoded_lazily(self):
+        from mseutils.card import _decode_time
+
+        _decode_time.cache_clear()
+        c = Card(time_created="2025-03-19 17:00:13", time_modified="2025-03-19 17:00:13")
+        assert _decode_time.cache_info().currsize == 0
+        assert c.time_created == datetime(2025, 3, 19, 17, 0, 13)
+        assert c.time_modified == c.time_created
+        assert _decode_time.cache_info().misses == 1
+
+    def test_unread_time_written_untouched(self):
+        import pytest
+
+        c = Card(name="Odd", time_created="yesterday", time_modified="2025-03-19 17:00:13")
+        assert c.to_setfile_strs()[3] == "\ttime_created: yesterday"
+        with pytest.raises(ValueError):
+            c.time_created
+        c.time_modified = datetime(2025, 3, 20)
+        assert c.to_setfile_strs()[4] == "\ttime_modified: 2025-03-20 00:00:00"
+
     def test_eq(self):
         c1 = Card(name="Hep Cat")
         c2 = Card(name="Hep Cat", notes="Cat has hepatitus.")
@@ -196,6 +217,31 @@ class TestCard:
             assert l[-1] == "At the beginning of your end step, if you control less than three Spirits, create a 1/1 white and black Spirit creature token with <kw-a><nospellcheck>flying</nospellcheck></kw-a>.\n"
 
 
+    def test_scanner_chunk_boundaries(self):
+        from mseutils.card import _SetfileScanner, _collect_all_indented_blocks
+
+        with open(_testdir / "complicatedsetfile", "rt", encoding="utf-8-sig") as ifile:
+            whole = [d for d in _collect_all_indented_blocks(ifile)]
+        with open(_testdir / "complicatedsetfile", "rt", encoding="utf-8-sig") as ifile:
+            scanner = _SetfileScanner.from_file(ifile, chunk_size=7)
+            chunked = [d for d in _collect_all_indented_blocks(scanner)]
+        assert len(whole) == 94
+        assert chunked == whole
+
+    def test_collect_all_blocks_never_seeks(self):
+        import io
+        from mseutils.card import _collect_all_indented_blocks
+
+        class NoSeek(io.StringIO):
+            def seek(self, *args):
+                raise AssertionError("scanner should not seek")
+
+        with open(_testdir / "indented_blocks", "rt", encoding="utf-8-sig") as ifile:
+            ifile = NoSeek(ifile.read())
+        data = [d for d in _collect_all_indented_blocks(ifile)]
+        assert len(data) == 2
+        assert data[0] == _indented_card_1
+
     def test_adapt_indented_block(self):
         from mseutils.card import _collect_indented_block, _cardify_incoming_types
 
@@ -251,4 +297,1482 @@ class TestSet:
             s = Set.from_setfile(ifile)
         with open(_testdir / "complicatedsetfile_out", "wt", encoding="utf-8-sig", newline='\n') as ofile:
             s.to_setfile(ofile)
-        assert filecmp.cmp(_testdir / "complicatedsetfile", _testdir / "complicatedsetfile_out", shallow=False)
\ No newline at end of file
+        assert filecmp.cmp(_testdir / "complicatedsetfile", _testdir / "complicatedsetfile_out", shallow=False)
+
+    def test_edited_rule_text_round_trip(self):
+        with open(_testdir / "complicatedsetfile", "rt", encoding="utf-8-sig") as ifile:
+            text = ifile.read()
+        s = Set.from_setfile(io.StringIO(text), cache=False)
+        card = s.cards["Scrooge's Curse"]
+        rule_text = list(card.remaining_keys["rule text"])
+        assert len(rule_text) == 3
+        card.notes = "Edited"
+        out = io.StringIO()
+        s.to_setfile(out)
+        saved = out.getvalue()
+        block = saved[saved.index("\tnotes: Edited"):]
+        expected = "\trule text:\n" + "".join(f"\t\t{line}" for line in rule_text) + "\tflavor text:"
+        assert expected in block
+        assert "['" not in saved
+        again = Set.from_setfile(io.StringIO(saved), cache=False)
+        assert again.cards["Scrooge's Curse"].remaining_keys["rule text"] == rule_text
+        strs = card.to_setfile_strs()
+        i = strs.index("\trule text:")
+        assert strs[i + 1:i + 4] == ["\t\t" + line.rstrip("\n") for line in rule_text]
+
+    def test_time_fields_stay_raw(self):
+        with open(_testdir / "complicatedsetfile", "rt", encoding="utf-8-sig") as ifile:
+            text = ifile.read()
+        s = Set.from_setfile(io.StringIO(text.replace("2019-12-29 13:02:59", "2019-12-29 00:00:59")), cache=False)
+        card = s.cards["Scrooge's Curse"]
+        assert card.remaining_keys["time created"] == "2019-12-29 00:00:59"
+        assert card.time_field("time created") == datetime(2019, 12, 29, 0, 0, 59)
+        assert card.time_field("no such field") is None
+        card.notes = "Edited"
+        out = io.StringIO()
+        s.to_setfile(out)
+        assert "\ttime created: 2019-12-29 00:00:59\n\ttime modified: 2019-12-30 08:52:43\n" in out.getvalue()
+
+    def test_midnight_datetime_round_trip(self):
+        s = Set(all_data={"game_version": datetime(2024, 2, 7)})
+        card = Card(name="Hep Cat")
+        card.remaining_keys["time created"] = datetime(2019, 12, 29, 0, 0, 59)
+        card.remaining_keys["time checked"] = datetime(2019, 12, 29)
+        s.add_card(card)
+        out = io.StringIO()
+        s.to_setfile(out)
+        saved = out.getvalue()
+        assert "game_version: 2024-02-07\n" in saved
+        assert "\ttime created: 2019-12-29 00:00:59\n\ttime checked: 2019-12-29 00:00:00\n" in saved
+        again = Set.from_setfile(io.StringIO(saved), cache=False).cards["Hep Cat"]
+        assert again.time_field("time created") == datetime(2019, 12, 29, 0, 0, 59)
+        assert again.time_field("time checked") == datetime(2019, 12, 29)
+        assert "\ttime created: 2019-12-29 00:00:59" in card.to_setfile_strs()
+
+    def test_edited_styling_data_round_trip(self):
+        s = Set(all_data={"styling": {"animal": {"overlay": ""}}})
+        card = Card(name="Hep Cat", mass_g=4100)
+        card.remaining_keys["styling_data"] = {"animal": {"frame": "<b>green</b>", "border": "0"}}
+        s.add_card(card)
+        out = io.StringIO()
+        s.to_setfile(out)
+        saved = out.getvalue()
+        assert "\tstyling_data:\n\t\tanimal:\n\t\t\tframe: <b>green</b>\n\t\t\tborder: 0\n" in saved
+        again = Set.from_setfile(io.StringIO(saved), cache=False)
+        assert again.cards["Hep Cat"].remaining_keys["styling_data"] == card.remaining_keys["styling_data"]
+        strs = card.to_setfile_strs()
+        i = strs.index("\tstyling_data:")
+        assert strs[i + 1:i + 4] == ["\t\tanimal:", "\t\t\tframe: <b>green</b>", "\t\t\tborder: 0"]
+
+    def test_card_dirty_tracking(self):
+        c = Card(**_parrot_args)
+        assert not c.dirty
+        c.remaining_keys["animal_type"] = "Ex-bird"
+        assert c.dirty
+        c.mark_clean()
+        assert not c.dirty
+        c.notes = "Pining for the fjords."
+        assert c.dirty
+
+    def test_change_tracking(self):
+        with open(_testdir / "setfile_valid", "rt", encoding="utf-8-sig") as ifile:
+            s = Set.from_setfile(ifile)
+        assert s.added_keys() == s.removed_keys() == s.changed_keys() == []
+        s.cards["Carolina Wren"].remaining_keys["mass_g"] = "21"
+        s.all_data["game"] = "Thistledown 2"
+        s.remove_card("Feral Cat")
+        s.add_card(Card(name="Hep Cat"))
+        assert s.changed_keys() == ["game", "Carolina Wren"]
+        assert s.removed_keys() == ["Feral Cat"]
+        assert s.added_keys() == ["Hep Cat"]
+        s.to_setfile(io.StringIO())
+        assert s.added_keys() == s.removed_keys() == s.changed_keys() == []
+
+    def test_in_place_edits_are_saved(self):
+        with open(_testdir / "setfile_valid", "rt", encoding="utf-8-sig") as ifile:
+            s = Set.from_setfile(ifile, cache=False)
+        s.all_data["version_control"]["type"] = "NEWTYPE"
+        assert s.changed_keys() == ["version_control"]
+        out = io.StringIO()
+        s.to_setfile(out)
+        assert "version_control:\n\ttype: NEWTYPE\n" in out.getvalue()
+        assert s.changed_keys() == []
+
+        with open(_testdir / "complicatedsetfile", "rt", encoding="utf-8-sig") as ifile:
+            s = Set.from_setfile(ifile, cache=False)
+        s.all_data["styling"]["magic-counter-m15"]["overlay"] = "foil"
+        s.all_data["set info"]["symbol"] = "symbol9.mse-symbol"
+        s.cards["Scrooge's Curse"].remaining_keys["rule text"].append("Draw a card.\n")
+        assert s.changed_keys() == ["set info", "styling", "Scrooge's Curse"]
+        out = io.StringIO()
+        s.to_setfile(out)
+        again = Set.from_setfile(io.StringIO(out.getvalue()), cache=False)
+        assert again.all_data["styling"]["magic-counter-m15"]["overlay"] == "foil"
+        assert again.all_data["set info"]["symbol"] == "symbol9.mse-symbol"
+        assert again.cards["Scrooge's Curse"].remaining_keys["rule text"][-1] == "Draw a card.\n"
+        assert s.changed_keys() == []
+
+    def test_mark_dirty(self):
+        import pytest
+
+        with open(_testdir / "setfile_valid", "rt", encoding="utf-8-sig") as ifile:
+            s = Set.from_setfile(ifile, cache=False)
+        s.cards["Green Anole"].remaining_keys["notes_list"] = notes = []
+        s.to_setfile(io.StringIO())
+        notes.append("a plain list, not read from a setfile")
+        assert s.changed_keys() == []
+        s.mark_dirty("Green Anole")
+        assert s.changed_keys() == ["Green Anole"]
+        out = io.StringIO()
+        s.to_setfile(out)
+        assert "\tnotes_list:\n\t\ta plain list, not read from a setfile\n" in out.getvalue()
+        with pytest.raises(KeyError):
+            s.mark_dirty("No Such Card")
+
+    def test_setfile_writer_streams(self):
+        from mseutils import SetfileWriter
+
+        writes = []
+
+        class Recorder(io.StringIO):
+            def write(self, s):
+                writes.append(len(s))
+                return super().write(s)
+
+        with open(_testdir / "setfile_valid", encoding="utf-8-sig") as ifile:
+            s = Set.from_setfile(ifile, cache=False)
+        rendered = io.StringIO()
+        Set(all_data=dict(s.all_data)).to_setfile(rendered)
+        streamed = Recorder()
+        with open(_testdir / "setfile_valid", encoding="utf-8-sig") as ifile:
+            with SetfileWriter(streamed, batch=4) as writer:
+                writer.write_blocks(Set.iter_blocks(ifile))
+        assert streamed.getvalue() == rendered.getvalue()
+        assert 1 < len(writes) < len(rendered.getvalue().splitlines()) / 4
+        cards = Recorder()
+        with SetfileWriter(cards) as writer:
+            writer.write_cards(c for c in s.cards.values())
+        assert cards.getvalue() == "".join("".join(f"{l}\n" for l in c.to_setfile_strs()) for c in s.cards.values())
+
+    def test_incremental_save_only_touches_edits(self):
+        with open(_testdir / "complicatedsetfile", "rt", encoding="utf-8-sig") as ifile:
+            original = ifile.read()
+            ifile.seek(0)
+            s = Set.from_setfile(ifile)
+        card = s.cards["Scrooge's Curse"]
+        card.notes = "Bah, humbug."
+        out = io.StringIO()
+        s.to_setfile(out)
+        before, _, after = original.partition("\tname: Scrooge's Curse\n")
+        before = before[:before.rindex("card:\n")]
+        after = after[after.index("card:\n"):]
+        edited = out.getvalue()
+        assert edited.startswith(before)
+        assert edited.endswith(after)
+        assert "\tnotes: Bah, humbug.\n" in edited[len(before):]
+
+    def test_iter_cards(self):
+        with open(_testdir / "setfile_valid", "rt", encoding="utf-8-sig") as ifile:
+            names = [c.name for c in Set.iter_cards(ifile)]
+        assert len(names) == 7
+        assert names[0] == "Green Anole"
+
+    def test_iter_blocks_matches_from_setfile(self):
+        with open(_testdir / "setfile_valid", "rt", encoding="utf-8-sig") as ifile:
+            s = Set.from_setfile(ifile)
+        with open(_testdir / "setfile_valid", "rt", encoding="utf-8-sig") as ifile:
+            keys = [k for k, _ in Set.iter_blocks(ifile)]
+        assert keys == list(s.all_data.keys())
+
+    def test_find_card_stops_early(self):
+        from mseutils.card import _SetfileScanner
+
+        with open(_testdir / "setfile_valid", "rt", encoding="utf-8-sig") as ifile:
+            lines = ifile.readlines()
+        consumed = []
+
+        def counting_lines():
+            for l in lines:
+                consumed.append(l)
+                yield l
+
+        card = Set.find_card(_SetfileScanner(counting_lines()), "Red-shouldered Hawk")
+        assert card is not None
+        assert card.remaining_keys["mass_g"] == "770"
+        assert len(consumed) < len(lines) / 2
+
+
+def _make_packagefile(path: Path, setfile: Path, **members: bytes) -> Path:
+    from zipfile import ZipFile, ZIP_DEFLATED
+
+    with ZipFile(path, "w", compression=ZIP_DEFLATED) as zip_ref:
+        zip_ref.write(setfile, "set")
+        for name, data in members.items():
+            zip_ref.writestr(name, data)
+    return path
+
+
+class TestPackage:
+    def test_from_packagefile(self, tmp_path):
+        pkg = _make_packagefile(
+            tmp_path / "test.mse-set", _testdir / "setfile_valid", art1=b"\x89PNG" * 1000
+        )
+        s = Set.from_packagefile(pkg)
+        assert len(s.cards) == 7
+        assert s.all_data["game"] == "Thistledown"
+        assert list(s.members) == ["art1"]
+        assert s.members["art1"].size == 4000
+        # Nothing extracted next to the package
+        assert [p.name for p in tmp_path.iterdir()] == ["test.mse-set"]
+
+    def test_members_are_lazy(self, tmp_path):
+        pkg = _make_packagefile(
+            tmp_path / "test.mse-set", _testdir / "setfile_valid", art1=b"art"
+        )
+        s = Set.from_packagefile(pkg)
+        member = s.members["art1"]
+        assert member.read() == b"art"
+        with member.open() as f:
+            assert f.read(2) == b"ar"
+
+    def test_missing_setfile(self, tmp_path):
+        import pytest
+        from zipfile import ZipFile
+
+        pkg = tmp_path / "bad.mse-set"
+        with ZipFile(pkg, "w") as zip_ref:
+            zip_ref.writestr("art1", b"art")
+        with pytest.raises(ValueError):
+            Set.from_packagefile(pkg)
+
+    def test_to_packagefile_round_trip(self, tmp_path):
+        import filecmp
+        from zipfile import ZipFile
+
+        art = bytes(range(256)) * 400
+        pkg = _make_packagefile(tmp_path / "test.mse-set", _testdir / "setfile_valid", art1=art)
+        s = Set.from_packagefile(pkg)
+        out = tmp_path / "out.mse-set"
+        s.to_packagefile(out)
+        with ZipFile(out) as zip_ref:
+            assert zip_ref.testzip() is None
+            assert zip_ref.namelist() == ["art1", "set"]
+            assert zip_ref.read("art1") == art
+            (tmp_path / "set").write_bytes(zip_ref.read("set"))
+        assert filecmp.cmp(_testdir / "setfile_valid", tmp_path / "set", shallow=False)
+        assert s.members["art1"].filepath == out
+
+    def test_to_packagefile_copies_members_raw(self, tmp_path, monkeypatch):
+        import os
+        import zlib
+        from zipfile import ZipFile
+        from mseutils import package
+
+        art = os.urandom(20000)  # doesn't compress, so the member is bigger than a chunk
+        pkg = _make_packagefile(tmp_path / "test.mse-set", _testdir / "setfile_valid", art1=art)
+        s = Set.from_packagefile(pkg)
+        s.cards["Green Anole"].notes = "Edited"
+        compress_size = s.members["art1"].info.compress_size
+        reads = []
+
+        class Recording:
+            def __init__(self, f):
+                self.f = f
+                self.name = f.name
+
+            def read(self, n=-1):
+                data = self.f.read(n)
+                reads.append(len(data))
+                return data
+
+            def seek(self, *args):
+                return self.f.seek(*args)
+
+            def close(self):
+                self.f.close()
+
+        def no_recompress(*args, **kwargs):
+            raise AssertionError("unchanged members should not be recompressed")
+
+        monkeypatch.setattr(zlib, "decompressobj", no_recompress)
+        monkeypatch.setattr(package, "_COPY_CHUNK_SIZE", 4096)
+        monkeypatch.setattr(package, "open", lambda *args: Recording(open(*args)), raising=False)
+        s.to_packagefile(pkg)  # saving over the source package
+        monkeypatch.undo()
+        # Copied a chunk at a time, never read whole
+        assert sum(reads) >= compress_size and max(reads) <= 4096
+        with ZipFile(pkg) as zip_ref:
+            assert zip_ref.read("art1") == art
+        assert Set.from_packagefile(pkg).cards["Green Anole"].notes == "Edited"
+        assert [p.name for p in tmp_path.iterdir()] == ["test.mse-set"]
+
+    def test_to_packagefile_replaced_member(self, tmp_path):
+        pkg = _make_packagefile(tmp_path / "test.mse-set", _testdir / "setfile_valid", art1=b"old")
+        s = Set.from_packagefile(pkg)
+        s.members["art1"] = b"new"
+        s.to_packagefile(pkg)
+        assert Set.from_packagefile(pkg).members["art1"].read() == b"new"
+
+
+class TestCompactCard:
+    def test_matches_card(self):
+        from mseutils import CompactCard
+
+        c = Card(**_parrot_args)
+        cc = CompactCard(**_parrot_args)
+        assert cc.to_setfile_strs() == _parrot_setfile_strs
+        assert cc.is_identical_to(c)
+        assert c.is_identical_to(cc)
+        assert not cc.dirty
+
+    def test_remaining_keys_view(self):
+        from mseutils import CompactCard
+
+        cc = CompactCard(**_hepcat_args)
+        assert dict(cc.remaining_keys) == {"animal_type": "Mammal", "mass_g": 4000}
+        cc.remaining_keys["mass_g"] = 4500
+        cc.remaining_keys["sciencename"] = "Felis catus"
+        del cc.remaining_keys["animal_type"]
+        assert list(cc.remaining_keys.items()) == [("mass_g", 4500), ("sciencename", "Felis catus")]
+        assert cc.dirty
+        import pytest
+        with pytest.raises(KeyError):
+            cc.remaining_keys["animal_type"]
+
+    def test_set_shares_schema(self):
+        with open(_testdir / "setfile_valid", "rt", encoding="utf-8-sig") as ifile:
+            s = Set.from_setfile(ifile, compact=True)
+        with open(_testdir / "setfile_valid", "rt", encoding="utf-8-sig") as ifile:
+            plain = Set.from_setfile(ifile)
+        assert all(c.is_identical_to(plain.cards[n]) for n, c in s.cards.items())
+        crow, cat = s.cards["American Crow"], s.cards["Feral Cat"]
+        assert crow.schema is cat.schema
+        assert crow.remaining_keys["animal_type"] is s.cards["Carolina Wren"].remaining_keys["animal_type"]
+
+    def test_compact_round_trip(self):
+        with open(_testdir / "setfile_valid", "rt", encoding="utf-8-sig") as ifile:
+            s = Set.from_setfile(ifile, compact=True)
+            plain = Set.from_setfile(io.StringIO(s._source))
+        for card in (s.cards["Green Anole"], plain.cards["Green Anole"]):
+            card.remaining_keys["points"] = "4"
+        out, plain_out = io.StringIO(), io.StringIO()
+        s.to_setfile(out)
+        plain.to_setfile(plain_out)
+        assert out.getvalue() == plain_out.getvalue()
+
+
+class TestIndex:
+    def _load(self):
+        with open(_testdir / "setfile_valid", "rt", encoding="utf-8-sig") as ifile:
+            return Set.from_setfile(ifile)
+
+    def test_query_without_index(self):
+        s = self._load()
+        birds = s.query(animal_type="Bird")
+        assert {c.name for c in birds} == {"Red-shouldered Hawk", "Carolina Wren", "Tufted Titmouse", "American Crow"}
+
+    def test_indexed_matches_scan(self):
+        from mseutils import And, Eq, Range
+
+        s = self._load()
+        scan = [c.name for c in s.query(Range("mass_g", lo=20), animal_type="Bird")]
+        s.create_index("animal_type")
+        s.create_index("mass_g", sorted=True)
+        indexed = [c.name for c in s.query(And(Range("mass_g", lo=20), Eq("animal_type", "Bird")))]
+        assert sorted(indexed) == sorted(scan)
+        assert [c.name for c in s.query(Range("mass_g", hi=450))] == [
+            c.name for c in sorted(s.query(Range("mass_g", hi=450)), key=lambda c: float(c.remaining_keys["mass_g"]))
+        ]
+
+    def test_index_follows_edits(self):
+        from mseutils import Range
+
+        s = self._load()
+        s.create_index("animal_type")
+        s.create_index("mass_g", sorted=True)
+        crow = s.cards["American Crow"]
+        crow.remaining_keys["animal_type"] = "Corvid"
+        crow.remaining_keys["mass_g"] = "100000"
+        assert crow not in s.query(animal_type="Bird")
+        assert s.query(animal_type="Corvid") == [crow]
+        assert s.query(Range("mass_g", lo=50000)) == [crow]
+        s.remove_card("American Crow")
+        assert s.query(animal_type="Corvid") == []
+        s.add_card(Card(name="Hep Cat", animal_type="Mammal", mass_g=4100))
+        assert [c.name for c in s.query(Range("mass_g", lo=4050, hi=4100), animal_type="Mammal")] == ["Hep Cat"]
+        assert s.query(mass_g=4100)[0].name == "Hep Cat"
+
+    def test_numbers_match_scan(self):
+        from mseutils import Eq, Range
+
+        s = self._load()
+        s.add_card(Card(name="Three", trophic_tier="3.0"))
+        s.add_card(Card(name="Unknown", mass_g="nan"))
+        s.add_card(Card(name="Huge", mass_g="inf"))
+        scan = ([c.name for c in s.query(Eq("trophic_tier", 3))], [c.name for c in s.query(Range("mass_g", lo=0))])
+        s.create_index("trophic_tier")
+        s.create_index("mass_g", sorted=True)
+        assert "Three" in scan[0]
+        assert "Unknown" not in scan[1] and "Huge" not in scan[1]
+        assert sorted(c.name for c in s.query(Eq("trophic_tier", 3))) == sorted(scan[0])
+        assert sorted(c.name for c in s.query(Range("mass_g", lo=0))) == sorted(scan[1])
+
+
+class TestDiff:
+    def _load(self):
+        with open(_testdir / "setfile_valid", "rt", encoding="utf-8-sig") as ifile:
+            return Set.from_setfile(ifile)
+
+    def test_cards_are_hashable(self):
+        c1 = Card(name="Hep Cat")
+        c2 = Card(name="Hep Cat", notes="Cat has hepatitus.")
+        assert len({c1, c2}) == 1
+
+    def test_diff_identical(self):
+        from mseutils import diff_sets
+
+        assert not diff_sets(self._load(), self._load())
+
+    def test_diff(self):
+        from mseutils import diff_sets
+
+        old, new = self._load(), self._load()
+        new.cards["Carolina Wren"].remaining_keys["mass_g"] = "21"
+        new.cards["Carolina Wren"].remaining_keys["clutch"] = "5"
+        new.remove_card("Feral Cat")
+        new.add_card(Card(name="Hep Cat"))
+        new.all_data["game"] = "Thistledown 2"
+        d = diff_sets(old, new)
+        assert [c.name for c in d.added] == ["Hep Cat"]
+        assert [c.name for c in d.removed] == ["Feral Cat"]
+        assert d.changed == {"Carolina Wren": {"mass_g": ("20", "21"), "clutch": (None, "5")}}
+        assert d.blocks_changed == ["game"]
+
+    def test_merge(self):
+        from mseutils import merge_sets
+
+        base, ours, theirs = self._load(), self._load(), self._load()
+        ours.cards["Carolina Wren"].remaining_keys["mass_g"] = "21"
+        theirs.cards["Carolina Wren"].notes = "Loud"
+        theirs.cards["American Crow"].remaining_keys["mass_g"] = "460"
+        ours.cards["American Crow"].remaining_keys["mass_g"] = "470"
+        theirs.remove_card("Feral Cat")
+        theirs.add_card(Card(name="Hep Cat"))
+        result = merge_sets(base, ours, theirs)
+        merged = result.set
+        assert merged.cards["Carolina Wren"].remaining_keys["mass_g"] == "21"
+        assert merged.cards["Carolina Wren"].notes == "Loud"
+        assert "Feral Cat" not in merged.cards
+        assert list(merged.cards)[-1] == "Hep Cat"
+        assert merged.cards["American Crow"].remaining_keys["mass_g"] == "470"
+        assert [(c.key, c.field, c.theirs) for c in result.conflicts] == [("American Crow", "mass_g", "460")]
+
+
+class TestCache:
+    def test_package_hit(self, tmp_path, monkeypatch):
+        from mseutils import ParseCache
+
+        cache = ParseCache(tmp_path / "cache")
+        pkg = _make_packagefile(tmp_path / "test.mse-set", _testdir / "setfile_valid", art1=b"art")
+        s1 = Set.from_packagefile(pkg, cache=cache)
+        assert cache.size() > 0
+
+        def no_parse(*args, **kwargs):
+            raise AssertionError("should have come from the cache")
+
+        monkeypatch.setattr(Set, "_parse_setfile", no_parse)
+        s2 = Set.from_packagefile(pkg, cache=cache)
+        assert list(s2.cards) == list(s1.cards)
+        assert all(s2.cards[k].is_identical_to(s1.cards[k]) for k in s1.cards)
+        assert s2.members["art1"].read() == b"art"
+        # Cached sets still track edits and save incrementally
+        s2.cards["Green Anole"].notes = "Edited"
+        assert s2.changed_keys() == ["Green Anole"]
+        out1, out2 = io.StringIO(), io.StringIO()
+        s1.cards["Green Anole"].notes = "Edited"
+        s1.to_setfile(out1)
+        s2.to_setfile(out2)
+        assert out1.getvalue() == out2.getvalue()
+
+    def test_compact_hit_shares_schema(self, tmp_path):
+        from mseutils import CompactCard, ParseCache
+
+        cache = ParseCache(tmp_path / "cache")
+        pkg = _make_packagefile(tmp_path / "test.mse-set", _testdir / "setfile_valid")
+        Set.from_packagefile(pkg, compact=True, cache=cache)
+        s = Set.from_packagefile(pkg, compact=True, cache=cache)
+        assert all(isinstance(c, CompactCard) for c in s.cards.values())
+        assert len({id(c.schema) for c in s.cards.values()}) == 1
+        # Not compact is cached separately
+        assert not isinstance(next(iter(Set.from_packagefile(pkg, cache=cache).cards.values())), CompactCard)
+
+    def test_invalidation(self, tmp_path):
+        from mseutils import ParseCache
+
+        cache = ParseCache(tmp_path / "cache")
+        pkg = _make_packagefile(tmp_path / "test.mse-set", _testdir / "setfile_valid")
+        s = Set.from_packagefile(pkg, cache=cache)
+        s.cards["Green Anole"].notes = "Edited"
+        s.to_packagefile(pkg)
+        assert Set.from_packagefile(pkg, cache=cache).cards["Green Anole"].notes == "Edited"
+        cache.invalidate(pkg)
+        assert cache.size() == 0
+        Set.from_packagefile(pkg, cache=False)
+        assert cache.size() == 0
+
+    def test_setfile(self, tmp_path):
+        import os
+        from mseutils import ParseCache
+
+        cache = ParseCache(tmp_path / "cache")
+        path = tmp_path / "set"
+        path.write_bytes((_testdir / "setfile_valid").read_bytes())
+        with open(path, encoding="utf-8") as f:
+            Set.from_setfile(f, cache=cache)
+        assert cache.size() > 0
+        with open(path, encoding="utf-8") as f:
+            assert len(Set.from_setfile(f, cache=cache).cards) == 7
+            assert f.read() == ""
+        text = path.read_text(encoding="utf-8").replace("Green Anole", "Brown Anole")
+        path.write_text(text, encoding="utf-8")
+        st = path.stat()
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+        with open(path, encoding="utf-8") as f:
+            assert "Brown Anole" in Set.from_setfile(f, cache=cache).cards
+        # Streams that aren't files on disk are never cached
+        cache.clear()
+        Set.from_setfile(io.StringIO(text), cache=cache)
+        assert cache.size() == 0
+
+    def test_compact_and_plain_entries(self, tmp_path):
+        from zipfile import ZipFile
+        from mseutils import CompactCard, ParseCache
+        from mseutils.cache import package_fingerprint
+
+        cache = ParseCache(tmp_path / "cache")
+        pkg = _make_packagefile(tmp_path / "test.mse-set", _testdir / "setfile_valid", art1=b"art")
+        Set.from_packagefile(pkg, cache=cache)
+        Set.from_packagefile(pkg, compact=True, cache=cache)
+        assert len(list((tmp_path / "cache").iterdir())) == 2
+        with ZipFile(pkg) as zip_ref:
+            hits = [cache.get(pkg, package_fingerprint(zip_ref, compact), compact) for compact in (False, True)]
+        assert not isinstance(hits[0].cards["Green Anole"], CompactCard)
+        assert isinstance(hits[1].cards["Green Anole"], CompactCard)
+        cache.invalidate(pkg)
+        assert cache.size() == 0
+
+    def test_source_not_stored(self, tmp_path):
+        import pickle
+        from mseutils import ParseCache
+
+        cache = ParseCache(tmp_path / "cache")
+        path = tmp_path / "set"
+        text = (_testdir / "complicatedsetfile").read_text(encoding="utf-8-sig")
+        path.write_text(text, encoding="utf-8")
+        with open(path, encoding="utf-8") as f:
+            loaded = Set.from_setfile(f, cache=cache)
+        assert pickle.loads(pickle.dumps(loaded))._source_text is None
+        with open(path, encoding="utf-8") as f:
+            s = Set.from_setfile(f, cache=cache)
+        assert s._source_text is None
+        plain = Set.from_setfile(io.StringIO(text), cache=False)
+        for edited in (s, plain):
+            edited.cards["Scrooge's Curse"].notes = "Edited"
+        out, plain_out = io.StringIO(), io.StringIO()
+        s.to_setfile(out)  # unchanged blocks are copied from the file, read again
+        plain.to_setfile(plain_out)
+        assert out.getvalue() == plain_out.getvalue()
+        # If the file has changed since, every block is rendered instead
+        with open(path, encoding="utf-8") as f:
+            s = Set.from_setfile(f, cache=cache)
+        path.write_text(text.replace("Scrooge", "Marley"), encoding="utf-8")
+        out = io.StringIO()
+        s.to_setfile(out)
+        again = Set.from_setfile(io.StringIO(out.getvalue()), cache=False)
+        assert list(again.all_data) == list(s.all_data)
+        assert "Scrooge's Curse" in again.cards
+
+    def test_lru_eviction(self, tmp_path):
+        import os
+        from mseutils import ParseCache
+
+        cache = ParseCache(tmp_path / "cache", max_bytes=1 << 20)
+        blob = b"x" * 300_000
+        for i, name in enumerate("abc"):
+            cache.put(name, b"f" * 16, blob)
+            os.utime(cache._entry(name), ns=(i * 10**9, i * 10**9))
+        assert cache.get("a", b"f" * 16) == blob  # now the most recently used
+        cache.put("d", b"f" * 16, blob)
+        assert cache.get("b", b"f" * 16) is None
+        assert cache.get("a", b"f" * 16) == blob
+        assert cache.get("a", b"g" * 16) is None  # wrong fingerprint
+        assert cache.size() <= 1 << 20
+
+    def test_corrupt_entry(self, tmp_path):
+        from mseutils import ParseCache
+
+        cache = ParseCache(tmp_path / "cache")
+        cache.put("a", b"f" * 16, [1, 2, 3])
+        entry = cache._entry("a")
+        entry.write_bytes(entry.read_bytes()[:-3])
+        assert cache.get("a", b"f" * 16) is None
+        assert not entry.exists()
+
+
+class TestStats:
+    def test_instrument_load(self, tmp_path):
+        from zipfile import ZipFile
+        from mseutils import instrument
+
+        pkg = _make_packagefile(tmp_path / "test.mse-set", _testdir / "complicatedsetfile")
+        with instrument() as stats:
+            s = Set.from_packagefile(pkg, cache=False)
+        text = (_testdir / "complicatedsetfile").read_text(encoding="utf-8-sig")
+        assert stats.operations == 1
+        assert stats.lines_scanned == len(text.splitlines())
+        assert stats.cards == len(s.cards)
+        assert stats.blocks > stats.cards  # cards, plus styling, rule texts, ...
+        # styling: / magic-m15: / overlay: (an empty value opens a block, too)
+        assert stats.max_depth == 3
+        assert stats.adaptation_calls > stats.lines_scanned / 2
+        with ZipFile(pkg) as zip_ref:
+            assert stats.bytes_read == zip_ref.getinfo("set").compress_size
+        assert {"read", "parse", "adapt", "build", "members", "total"} <= set(stats.timings)
+        assert stats.timings["adapt"] <= stats.timings["parse"] <= stats.timings["total"]
+
+    def test_hooks(self, tmp_path):
+        from mseutils import ParseCache, add_stats_hook, remove_stats_hook
+
+        seen = []
+        add_stats_hook(seen.append)
+        try:
+            cache = ParseCache(tmp_path / "cache")
+            with open(_testdir / "setfile_valid", encoding="utf-8") as f:
+                s = Set.from_setfile(f, cache=cache)
+            with open(_testdir / "setfile_valid", encoding="utf-8") as f:
+                Set.from_setfile(f, cache=cache)
+            s.cards["Green Anole"].notes = "Edited"
+            out = io.StringIO()
+            s.to_setfile(out)
+        finally:
+            remove_stats_hook(seen.append)
+        assert [st.operation for st in seen] == ["from_setfile", "from_setfile", "to_setfile"]
+        assert seen[0].cache_hits == 0 and seen[0].cards == 7 and seen[0].path.endswith("setfile_valid")
+        assert seen[1].cache_hits == 1 and seen[1].lines_scanned == 0
+        assert seen[2].blocks_rendered == 1
+        assert seen[2].bytes_written == len(out.getvalue().encode("utf-8"))
+        # Nothing is recorded once the hook is gone
+        Set.from_setfile(io.StringIO(out.getvalue()))
+        assert len(seen) == 3
+
+    def test_off_by_default(self, monkeypatch):
+        from mseutils import card
+
+        def no_counting(*args, **kwargs):
+            raise AssertionError("the counting scanner should only be used when instrumented")
+
+        monkeypatch.setattr(card._CountingScanner, "__init__", no_counting)
+        with open(_testdir / "complicatedsetfile", encoding="utf-8-sig") as f:
+            Set.from_setfile(f, cache=False)
+
+
+class TestBlockIndex:
+    def test_random_access(self, tmp_path):
+        import shutil
+        from mseutils import BlockIndex, IndexedSetfile
+
+        path = tmp_path / "set"
+        shutil.copy(_testdir / "complicatedsetfile", path)
+        with open(path, encoding="utf-8-sig") as f:
+            s = Set.from_setfile(f, cache=False)
+        with IndexedSetfile.open(path) as setfile:
+            assert setfile.index.keys() == list(s.all_data)
+            assert setfile.index.card_names() == list(s.cards)
+            assert setfile.block("styling") == s.all_data["styling"]
+            card = setfile.card("Scrooge's Curse")
+            assert card.remaining_keys == s.cards["Scrooge's Curse"].remaining_keys
+            assert setfile.card("No Such Card") is None
+            assert list(setfile.cards(["Scrooge's Curse", "No Such Card"])) == ["Scrooge's Curse"]
+        # Saved next to the set, and only used while the set is unchanged
+        assert (tmp_path / "set.mseidx").exists()
+        assert BlockIndex.load(path) is not None
+        with open(path, "a", encoding="utf-8") as f:
+            f.write("apprentice code: \n")
+        assert BlockIndex.load(path) is None
+        assert BlockIndex.for_file(path).keys()[-1] == "apprentice code"
+
+    def test_package(self, tmp_path):
+        from mseutils import IndexedSetfile
+
+        pkg = _make_packagefile(tmp_path / "test.mse-set", _testdir / "setfile_valid")
+        with IndexedSetfile.open(pkg) as setfile:
+            assert setfile.card("Green Anole").remaining_keys["sciencename"] == "Anolis carolinensis"
+            import pytest
+
+            with pytest.raises(ValueError):
+                setfile.replace_block("Green Anole", setfile.card("Green Anole"))
+
+    def test_replace_block(self, tmp_path):
+        import shutil
+        from mseutils import BlockIndex, IndexedSetfile
+
+        path = tmp_path / "set"
+        shutil.copy(_testdir / "setfile_valid", path)
+        original = path.read_bytes()
+        with IndexedSetfile.open(path) as setfile:
+            (offset, length), = setfile.index.spans("Green Anole")
+            anole = setfile.card("Green Anole")
+            anole.notes = "A rather longer note than it had before"
+            setfile.replace_block("Green Anole", anole)
+            assert setfile.card("Green Anole").notes == anole.notes
+            last = setfile.index.card_names()[-1]
+            assert setfile.card(last).name == last  # later offsets moved along
+        with open(path, encoding="utf-8-sig") as f:
+            s = Set.from_setfile(f, cache=False)
+        assert s.cards["Green Anole"].is_identical_to(anole)
+        # Everything else is untouched
+        patched = path.read_bytes()
+        assert patched.startswith(original[:offset])
+        assert patched.endswith(original[offset + length:])
+        assert BlockIndex.load(path) is not None
+
+    def test_replace_block_rule_text(self, tmp_path):
+        import shutil
+        from mseutils import IndexedSetfile
+
+        path = tmp_path / "set"
+        shutil.copy(_testdir / "complicatedsetfile", path)
+        with IndexedSetfile.open(path) as setfile:
+            curse = setfile.card("Scrooge's Curse")
+            curse.remaining_keys["rule text"].append("Sacrifice it at Christmas.\n")
+            setfile.replace_block("Scrooge's Curse", curse)
+            assert setfile.card("Scrooge's Curse").remaining_keys["rule text"] == curse.remaining_keys["rule text"]
+        with open(path, encoding="utf-8-sig") as f:
+            s = Set.from_setfile(f, cache=False)
+        assert s.cards["Scrooge's Curse"].remaining_keys["rule text"][-1] == "Sacrifice it at Christmas.\n"
+        assert s.cards["Scrooge's Curse"].remaining_keys == curse.remaining_keys
+
+    def test_replace_block_failure(self, tmp_path, monkeypatch):
+        import os
+        import shutil
+        import pytest
+        from mseutils import IndexedSetfile
+
+        path = tmp_path / "set"
+        shutil.copy(_testdir / "setfile_valid", path)
+        original = path.read_bytes()
+
+        def fail(src, dst):
+            raise OSError("disk on fire")
+
+        with IndexedSetfile.open(path) as setfile:
+            anole = setfile.card("Green Anole")
+            anole.notes = "Never saved"
+            monkeypatch.setattr(os, "replace", fail)
+            with pytest.raises(OSError):
+                setfile.replace_block("Green Anole", anole)
+            monkeypatch.undo()
+            # Still readable, and neither the file nor its index changed
+            assert setfile.card("Green Anole").notes != "Never saved"
+        assert path.read_bytes() == original
+        assert [p.name for p in tmp_path.iterdir() if p.name.endswith(".tmp")] == []
+
+
+class TestBatch:
+    def _packages(self, tmp_path):
+        from zipfile import ZipFile
+
+        paths = [
+            _make_packagefile(tmp_path / f"set{i}.mse-set", _testdir / "setfile_valid", art1=bytes([i]) * 10)
+            for i in range(3)
+        ]
+        broken = tmp_path / "broken.mse-set"
+        with ZipFile(broken, "w") as zip_ref:
+            zip_ref.writestr("art1", b"no setfile in here")
+        return paths[:2] + [broken] + paths[2:]
+
+    def test_load_many(self, tmp_path):
+        from mseutils import load_many
+
+        paths = self._packages(tmp_path)
+        seen = []
+        collection = load_many(paths, workers=2, cache=False, on_result=seen.append)
+        assert sorted(r.path for r in seen) == sorted(paths)
+        assert list(collection.sets) == [p for p in paths if p.name != "broken.mse-set"]
+        assert list(collection.errors) == [tmp_path / "broken.mse-set"]
+        assert isinstance(collection.errors[tmp_path / "broken.mse-set"], ValueError)
+        assert collection.sets[paths[1]].members["art1"].read() == b"\x01" * 10
+        assert [p for p, _ in collection.find("Green Anole")] == list(collection.sets)
+        assert len(collection.query(animal_type="Reptile")) == 3 * len(
+            collection.sets[paths[0]].query(animal_type="Reptile")
+        )
+
+    def test_in_process(self, tmp_path):
+        from mseutils import iter_load
+
+        results = list(iter_load(self._packages(tmp_path), workers=1, cache=False))
+        assert [r.ok for r in results] == [True, True, False, True]
+
+    def test_cli(self, tmp_path, capsys):
+        from mseutils import batch
+
+        self._packages(tmp_path)
+        assert batch.main([str(tmp_path), "-j", "2", "--no-cache", "--find", "Green Anole"]) == 1
+        out, err = capsys.readouterr()
+        assert "3 sets, 21 cards loaded" in out
+        assert out.count("Green Anole: ") == 3
+        assert "FAILED" in err and "broken.mse-set" in err
+
+    def test_expand_skips_history(self, tmp_path):
+        from mseutils import SetHistory, batch
+
+        paths = self._packages(tmp_path)
+        SetHistory.for_set(paths[0]).record(paths[0])
+        (tmp_path / "unzipped.mse-set").mkdir()
+        (tmp_path / ".history" / "old.mse-set").mkdir()
+        (tmp_path / ".history" / "old.mse-set" / "copy.mse-set").write_bytes(paths[0].read_bytes())
+        assert batch._expand([str(tmp_path)]) == sorted(paths)
+
+
+class TestAio:
+    def test_aload_asave(self, tmp_path):
+        import asyncio
+
+        pkg = _make_packagefile(tmp_path / "test.mse-set", _testdir / "setfile_valid", art1=b"art")
+
+        async def edit():
+            s = await Set.aload(pkg, cache=False)
+            s.cards["Green Anole"].notes = "Edited"
+            await s.asave(tmp_path / "out.mse-set")
+            out = io.StringIO()
+            await s.ato_setfile(out)
+            return out.getvalue()
+
+        text = asyncio.run(edit())
+        assert "notes: Edited" in text
+        s = Set.from_packagefile(tmp_path / "out.mse-set", cache=False)
+        assert s.cards["Green Anole"].notes == "Edited"
+        assert s.members["art1"].read() == b"art"
+
+    def test_shared_in_flight(self, tmp_path, monkeypatch):
+        import asyncio
+
+        pkg = _make_packagefile(tmp_path / "test.mse-set", _testdir / "setfile_valid")
+        parses = []
+        parse = Set._parse_setfile.__func__
+
+        def counting_parse(cls, *args, **kwargs):
+            parses.append(1)
+            return parse(cls, *args, **kwargs)
+
+        monkeypatch.setattr(Set, "_parse_setfile", classmethod(counting_parse))
+
+        async def many():
+            return await asyncio.gather(*(Set.aload(pkg, cache=False) for _ in range(5)))
+
+        sets = asyncio.run(many())
+        assert len(parses) == 1
+        assert all(s is sets[0] for s in sets)
+        # Once done, the next aload loads afresh
+        asyncio.run(many())
+        assert len(parses) == 2
+
+    def test_cancellation(self, tmp_path):
+        import asyncio
+        import threading
+        from concurrent.futures import ThreadPoolExecutor
+        from mseutils import aio
+
+        pkg = _make_packagefile(tmp_path / "test.mse-set", _testdir / "setfile_valid")
+        gate = threading.Event()
+        executor = ThreadPoolExecutor(max_workers=1)
+        executor.submit(gate.wait)  # keeps the only worker busy
+        aio.set_executor(executor)
+        try:
+
+            async def scenario():
+                first = asyncio.ensure_future(Set.aload(pkg, cache=False))
+                second = asyncio.ensure_future(Set.aload(pkg, cache=False))
+                await asyncio.sleep(0.01)
+                first.cancel()
+                await asyncio.sleep(0.01)
+                assert len(aio._in_flight) == 1  # still wanted by second
+                second.cancel()
+                await asyncio.sleep(0.01)
+                assert len(aio._in_flight) == 0
+                gate.set()
+                return await Set.aload(pkg, cache=False)
+
+            assert len(asyncio.run(scenario()).cards) == 7
+        finally:
+            gate.set()
+            aio.set_executor(None)
+            executor.shutdown()
+
+
+class TestWatch:
+    def test_debounce(self, tmp_path):
+        from mseutils import Watcher
+
+        watcher = Watcher(tmp_path, ["*.json"], debounce=0.25)
+        path = tmp_path / "animals.json"
+        path.write_text("[")
+        (tmp_path / "notes.txt").write_text("ignored")
+        assert watcher.poll(now=0.0) == []
+        assert watcher.poll(now=0.1) == []
+        path.write_text("[{}]")  # still being written: starts over
+        assert watcher.poll(now=0.2) == []
+        assert watcher.poll(now=0.3) == []
+        assert watcher.poll(now=0.5) == [path]
+        assert watcher.poll(now=1.0) == []
+        path.unlink()
+        assert watcher.poll(now=2.0) == []
+        assert watcher.poll(now=3.0) == [path]
+        assert watcher.files() == []
+
+    def test_set_watcher(self, tmp_path):
+        from zipfile import ZipFile
+        from mseutils import SetWatcher
+
+        pkg = _make_packagefile(tmp_path / "test.mse-set", _testdir / "setfile_valid", art1=b"art")
+        watcher = SetWatcher(tmp_path, debounce=0)
+        s = watcher.sets[pkg]
+        s.create_index("animal_type")
+        before = dict(s.cards)
+
+        edited = Set.from_packagefile(pkg, cache=False)
+        edited.cards["Green Anole"].remaining_keys["animal_type"] = "Lizard"
+        edited.remove_card("American Crow")
+        edited.to_packagefile(pkg)
+        assert watcher.poll() == []  # seen, but not yet settled
+        (change,) = watcher.poll()
+
+        assert change.set is s
+        assert change.changed == ["Green Anole"]
+        assert change.removed == ["American Crow"]
+        assert change.added == []
+        assert [c.name for c in s.query(animal_type="Lizard")] == ["Green Anole"]
+        assert s.cards["Carolina Wren"] is before["Carolina Wren"]  # not re-parsed
+        assert s.cards["Green Anole"] is not before["Green Anole"]
+        assert s.members["art1"].read() == b"art"
+        out = io.StringIO()
+        s.to_setfile(out)
+        with ZipFile(pkg) as zip_ref:
+            assert out.getvalue() == zip_ref.read("set").decode("utf-8-sig")
+
+    def test_set_watcher_compact(self, tmp_path):
+        import os
+        from pathlib import Path
+        from mseutils import CompactCard, SetWatcher
+
+        sets = tmp_path / "sets"
+        sets.mkdir()
+        pkg = _make_packagefile(sets / "test.mse-set", _testdir / "setfile_valid", art1=b"art")
+        watcher = SetWatcher(sets, debounce=0, compact=True, cache=False)
+        s = watcher.sets[pkg]
+        schema = s.cards["Carolina Wren"].schema
+
+        edited = Set.from_packagefile(pkg, cache=False)
+        edited.cards["Green Anole"].notes = "Edited"
+        edited.to_packagefile(pkg)
+        new = _make_packagefile(sets / "new.mse-set", _testdir / "setfile_valid", art1=b"art")
+        watcher.poll()
+        assert sorted(c.path.name for c in watcher.poll()) == ["new.mse-set", "test.mse-set"]
+        anole = s.cards["Green Anole"]
+        assert isinstance(anole, CompactCard) and anole.schema is schema
+        assert anole.notes == "Edited"
+        assert all(isinstance(c, CompactCard) for c in watcher.sets[new].cards.values())
+        assert os.listdir(Path(os.environ["MSEUTILS_CACHE_DIR"])) == []
+
+    def test_import_list_watcher(self, tmp_path):
+        import json
+        import shutil
+        from mseutils import ImportListWatcher
+
+        shutil.copy(_testdir.parent.parent / "data/thistledown.mse-game/translate_json_to_mse.py", tmp_path)
+        (tmp_path / "animals.json").write_text(json.dumps([{"name": "Wren", "mass_g": 20}]))
+        (tmp_path / "habitats.json").write_text(json.dumps([{"name": "Oak", "animal_type": "Tree"}]))
+        watcher = ImportListWatcher(tmp_path, debounce=0)
+        ingested = []
+        ingest_file = watcher.translator.ingest_file
+        watcher.translator.ingest_file = lambda p: ingested.append(p.name) or ingest_file(p)
+        watcher.export()
+        assert "Wren" in (tmp_path / "cards_to_import").read_text()
+
+        (tmp_path / "animals.json").write_text(json.dumps([{"name": "Wren", "mass_g": 21}]))
+        assert watcher.poll() is False
+        assert watcher.poll() is True
+        assert ingested == ["animals.json"]
+        script = (tmp_path / "cards_to_import").read_text()
+        assert "21" in script and "Oak" in script  # everything since the watch began
+        manifest = json.loads((tmp_path / "cards_to_import.manifest").read_text())
+        assert sorted(manifest) == ["Oak", "Wren"]
+
+
+class TestImportList:
+    def _translator(self):
+        from mseutils.watch import _load_translator
+
+        return _load_translator(_testdir.parent.parent / "data/thistledown.mse-game")
+
+    def test_removed_kept_until_exported(self, tmp_path):
+        import json
+
+        t = self._translator()
+        t.export([{"name": "Wren", "mass_g": 20}, {"name": "Oak"}], tmp_path)
+        assert t.export([{"name": "Wren", "mass_g": 20}], tmp_path) == ([], ["Oak"])
+        assert "Oak" in json.loads((tmp_path / "cards_to_import.manifest").read_text())
+        assert t.export([{"name": "Wren", "mass_g": 20}], tmp_path, deletions=True) == ([], ["Oak"])
+        assert 'removed_cards := ["Oak"]' in (tmp_path / "cards_to_import").read_text()
+        assert sorted(json.loads((tmp_path / "cards_to_import.manifest").read_text())) == ["Wren"]
+
+    def test_streaming_chunks(self):
+        import io
+        import json
+
+        t = self._translator()
+        records = [{"name": f"Card {i}", "mass_g": i * 1234, "notes": "x" * (i % 7)} for i in range(40)]
+        text = " [ " + ",\n".join(json.dumps(r) for r in records) + " ] \n"
+        for chunk_size in (1, 2, 3, 7, 64, 1 << 16):
+            assert list(t._iter_json_records(io.StringIO(text), chunk_size)) == records, chunk_size
+        assert list(t._iter_json_records(io.StringIO("[1234, 5678]"), 2)) == [1234, 5678]
+
+    def test_malformed_json(self):
+        import io
+        import json
+        import pytest
+
+        t = self._translator()
+        bad = ("[1 2 3]", "[1,,2]", "[1,2,]", "[,1]", '[{"name":1} {"name":2}]', "[1, 2", "[1] x", "[1]]")
+        for text in bad:
+            for chunk_size in (1, 4, 1 << 16):
+                with pytest.raises(json.JSONDecodeError):
+                    list(t._iter_json_records(io.StringIO(text), chunk_size))
+        with pytest.raises(ValueError):
+            list(t._iter_json_records(io.StringIO('{"name": 1}')))
+
+    def test_parallel_ingest(self, tmp_path, monkeypatch):
+        import importlib
+        import json
+        import pytest
+
+        # Imported by name, as worker processes have to find ingest_file
+        monkeypatch.syspath_prepend(str(_testdir.parent.parent / "data/thistledown.mse-game"))
+        t = importlib.import_module("translate_json_to_mse")
+        (tmp_path / "a.json").write_text(json.dumps([{"name": "Wren", "mass_g": 20}, {"name": "Oak", "x": 1}]))
+        (tmp_path / "b.json").write_text(json.dumps([{"name": "Wren", "mass_g": 21}, {"name": "Crow"}]))
+        paths = [tmp_path / "b.json", tmp_path / "a.json"]
+        expected = [{"name": "Wren", "mass_g": 21}, {"name": "Oak"}, {"name": "Crow"}]
+        assert t.ingest(paths, workers=1) == expected
+        assert t.ingest(paths, workers=2, batch_size=1) == expected
+        (tmp_path / "b.json").write_text('[{"name": "Wren"} {"name": "Crow"}]')
+        with pytest.raises(ValueError):
+            t.ingest(paths, workers=2)
+
+    def test_full_keeps_removals(self, tmp_path):
+        t = self._translator()
+        t.export([{"name": "Wren", "mass_g": 20}, {"name": "Oak"}], tmp_path)
+        changed, removed = t.export([{"name": "Wren", "mass_g": 20}], tmp_path, full=True)
+        assert [c["name"] for c in changed] == ["Wren"] and removed == ["Oak"]
+        assert t.export([{"name": "Wren", "mass_g": 20}], tmp_path, deletions=True) == ([], ["Oak"])
+        assert 'removed_cards := ["Oak"]' in (tmp_path / "cards_to_import").read_text()
+
+    def test_unconsumed_export_kept(self, tmp_path):
+        t = self._translator()
+        t.export([{"name": "Wren", "mass_g": 20}], tmp_path)
+        assert t.export([{"name": "Wren", "mass_g": 20}], tmp_path) == ([], [])
+        assert "Wren" in (tmp_path / "cards_to_import").read_text()
+        # Compared against a baseline, as the watcher does, the file always says what changed
+        t.export([{"name": "Wren", "mass_g": 20}], tmp_path, manifest=t.load_manifest(tmp_path / t._MANIFEST_NAME))
+        assert (tmp_path / "cards_to_import").read_text() == "import_list := [ ]"
+
+    def test_no_update(self, tmp_path):
+        t = self._translator()
+        t.export([{"name": "Wren", "mass_g": 20}], tmp_path, update=False)
+        assert not (tmp_path / t._MANIFEST_NAME).exists()
+        changed, _ = t.export([{"name": "Wren", "mass_g": 20}], tmp_path)
+        assert [c["name"] for c in changed] == ["Wren"]
+        assert t.export([{"name": "Wren", "mass_g": 20}], tmp_path) == ([], [])
+
+
+class TestColumns:
+    def test_stats(self):
+        import pytest
+
+        with open(_testdir / "setfile_valid", "r") as f:
+            s = Set.from_setfile(f, cache=False)
+        table = s.create_table("mass_g", "animal_type")
+        assert table.columns["mass_g"].kind == "numeric"
+        assert table.columns["animal_type"].kind == "categorical"
+        assert len(table) == 7
+        assert table.count("mass_g") == 6  # Green Anole has none
+        assert table.mean("mass_g") == 9260 / 6
+        assert table.percentile("mass_g", [0, 50, 100]) == [20, 610, 4000]
+        assert table.histogram("mass_g", bins=2) == ([4, 2], [20, 2010, 4000])
+        assert table.value_counts("animal_type") == {"Bird": 4, "Mammal": 2, "Reptile": 1}
+        assert table.group_by("animal_type", "mass_g", "mean") == {"Bird": 315, "Mammal": 4000}
+        assert table.group_by("animal_type", "mass_g", "count") == {"Bird": 4, "Mammal": 2}
+        with pytest.raises(ValueError):
+            table.mean("animal_type")
+
+    def test_kept_in_sync(self):
+        with open(_testdir / "setfile_valid", "r") as f:
+            s = Set.from_setfile(f, cache=False)
+        table = s.create_table("mass_g", "animal_type")
+        s.cards["Green Anole"].remaining_keys["mass_g"] = "5"
+        s.remove_card("Outdoor Cat")
+        s.add_card(Card(**_parrot_args, mass_g="400"))
+        assert table.count("mass_g") == 7
+        assert table.min("mass_g") == 5
+        assert sorted(table.names) == sorted(s.cards)
+        assert dict(zip(table.names, table.column("mass_g")))["Dead Parrot"] == 400
+        s.drop_table(table)
+        s.cards["Green Anole"].remaining_keys["mass_g"] = "1"
+        assert table.min("mass_g") == 5
+
+    def test_save_load(self, tmp_path):
+        import pytest
+        from mseutils import CardTable
+
+        with open(_testdir / "setfile_valid", "r") as f:
+            s = Set.from_setfile(f, cache=False)
+        table = s.create_table("mass_g", "animal_type")
+        table.save(tmp_path / "cards.mset")
+        loaded = CardTable.load(tmp_path / "cards.mset")
+        assert loaded.names == table.names
+        assert loaded.column("animal_type") == table.column("animal_type")
+        assert loaded.group_by("animal_type", "mass_g", "max") == table.group_by("animal_type", "mass_g", "max")
+        (tmp_path / "junk").write_bytes(b"junk")
+        with pytest.raises(ValueError):
+            CardTable.load(tmp_path / "junk")
+
+
+class TestHistory:
+    def test_record_and_restore(self, tmp_path):
+        from zipfile import ZipFile
+        from mseutils import SetHistory
+
+        pkg = _make_packagefile(tmp_path / "test.mse-set", _testdir / "setfile_valid", art1=b"\x89PNG" * 1000)
+        history = SetHistory.for_set(pkg)
+        assert history.directory == tmp_path / ".history" / "test"
+        assert history.record(pkg, "first").number == 1
+        assert history.record(pkg) is None  # unchanged
+        for notes in ("Edited once", "Edited twice"):
+            s = Set.from_packagefile(pkg, cache=False)
+            s.cards["Carolina Wren"].notes = notes
+            s.to_packagefile(pkg)
+            history.record(pkg)
+
+        assert [r.number for r in history.revisions()] == [1, 2, 3]
+        latest = history.latest()
+        assert len(latest.runs) == 3  # unchanged blocks, the wren, unchanged blocks
+        assert len(list((history.directory / "packs").iterdir())) == 3  # everything, then the wren twice
+        assert len(list((history.directory / "objects").rglob("*"))) == 2  # art1 stored once, in its dir
+        assert history.load(2).cards["Carolina Wren"].notes == "Edited once"
+        assert history.load(1).cards["Carolina Wren"].notes == ""
+
+        history.restore(pkg, revision=1)
+        with ZipFile(pkg) as zip_ref:
+            assert zip_ref.read("art1") == b"\x89PNG" * 1000
+            assert zip_ref.read("set").decode("utf-8-sig") == history.text(1)
+        with open(_testdir / "setfile_valid", "r", encoding="utf-8-sig") as f:
+            assert history.text(1) == f.read()
+
+    def test_cli(self, tmp_path, capsys):
+        from mseutils import history
+
+        pkg = _make_packagefile(tmp_path / "test.mse-set", _testdir / "setfile_valid")
+        assert history.main(["record", str(pkg), "-m", "before the edit"]) == 0
+        assert history.main(["log", str(pkg)]) == 0
+        assert "before the edit" in capsys.readouterr().out
+        assert history.main(["restore", str(pkg), "-r", "7"]) == 1
+
+
+class TestAssets:
+    def test_dehydrate_and_export(self, tmp_path):
+        from zipfile import ZipFile
+        from mseutils import AssetStore
+
+        art = b"\x89PNG" + bytes(range(256)) * 40
+        one = _make_packagefile(tmp_path / "one.mse-set", _testdir / "setfile_valid", art1=art, **{"art1.png": art})
+        two = _make_packagefile(tmp_path / "two.mse-set", _testdir / "setfile_valid", art7=art, art8=b"other")
+        store = AssetStore(tmp_path / "assets")
+        manifest = store.dehydrate(one, tmp_path / "one.slim.mse-set")
+        store.dehydrate(two, tmp_path / "two.slim.mse-set")
+        assert manifest["art1"] == manifest["art1.png"] == store.manifest(tmp_path / "two.slim.mse-set")["art7"]
+        assert len(list(store)) == 2  # art, and "other"
+        assert store.manifest(one) == manifest  # same digests from the real package
+        assert (tmp_path / "one.slim.mse-set").stat().st_size < one.stat().st_size
+
+        s = store.load(tmp_path / "one.slim.mse-set", cache=False)
+        assert list(s.members) == ["art1", "art1.png"]
+        assert s.members["art1.png"].read() == art
+        s.cards["Green Anole"].notes = "Edited"
+        s.to_packagefile(tmp_path / "export.mse-set")
+        with ZipFile(tmp_path / "export.mse-set") as zip_ref:
+            assert zip_ref.namelist() == ["art1", "art1.png", "set"]
+            assert zip_ref.read("art1.png") == art
+
+        store.hydrate(tmp_path / "two.slim.mse-set", tmp_path / "two.again.mse-set")
+        assert Set.from_packagefile(tmp_path / "two.again.mse-set", cache=False).members["art8"].read() == b"other"
+
+    def test_shared_by_histories_and_styles(self, tmp_path):
+        from mseutils import AssetStore, SetHistory
+
+        store = AssetStore(tmp_path / "assets")
+        for name in ("one", "two"):
+            pkg = _make_packagefile(tmp_path / f"{name}.mse-set", _testdir / "setfile_valid", art1=b"shared art")
+            SetHistory.for_set(pkg, assets=store).record(pkg)
+        for style in ("animal", "habitat"):
+            (tmp_path / style).mkdir()
+            (tmp_path / style / "powermask.png").write_bytes(b"mask")
+            assert store.add_tree(tmp_path / style) == {"powermask.png": store.add_bytes(b"mask")}
+        assert len(list(store)) == 2
+        assert SetHistory.for_set(tmp_path / "two.mse-set", assets=store).load().members["art1"].read() == b"shared art"
+
+
+_TEST_AFF = """SET UTF-8
+FLAG long
+NEEDAFFIX ()
+FORBIDDENWORD {}
+ICONV 1
+ICONV ’ '
+
+SFX Sa Y 2
+SFX Sa 0 s [^s]
+SFX Sa 0 es s
+
+SFX Ed N 1
+SFX Ed 0 ed/Sa .
+
+PFX Un Y 1
+PFX Un 0 un .
+
+PFX L' Y 1
+PFX L' 0 l' [aeiou]
+"""
+
+_TEST_DIC = """6
+hawk/Sa
+nest/SaEdUn
+owl/Sa()
+it's
+owls/{}
+egg/SaL'
+"""
+
+
+class TestSpellcheck:
+    def _dictionary(self, tmp_path, extra=()):
+        from mseutils.spelling import Dictionary
+
+        (tmp_path / "xx_XX.aff").write_text(_TEST_AFF, encoding="utf-8")
+        (tmp_path / "xx_XX.dic").write_text(_TEST_DIC, encoding="utf-8")
+        return Dictionary.load("xx_XX", tmp_path, tmp_path / "cache", extra=extra)
+
+    def test_affixes_and_case(self, tmp_path):
+        import pytest
+        from mseutils.spelling import Dictionary
+
+        d = self._dictionary(tmp_path)
+        good = ("hawk", "hawks", "nests", "unnest", "unnests", "nested", "nesteds", "it's", "it’s", "l'egg", "l'eggs")
+        for word in good:
+            assert d.check(word), word
+        for word in ("hawkes", "owl", "owls", "unhawk", "l'hawk", "nestes", "eggz"):
+            assert not d.check(word), word
+        assert d.check("Hawk") and d.check("HAWKS") and not d.check("hAwk")
+        assert d.misspelled("The <b>hawk</b> nests, eggz!") == [(0, "The"), (23, "eggz")]
+
+        compiled = list((tmp_path / "cache").iterdir())
+        assert len(compiled) == 1
+        again = self._dictionary(tmp_path)  # from the cache
+        assert list((tmp_path / "cache").iterdir()) == compiled and again.check("unnests")
+        (tmp_path / "xx_XX.dic").write_text(_TEST_DIC + "the\n", encoding="utf-8")
+        assert Dictionary.load("xx_XX", tmp_path, tmp_path / "cache").check("The")  # recompiled
+        with pytest.raises(ValueError):
+            Dictionary(tmp_path / "xx_XX.dic")
+        with pytest.raises(ValueError):
+            Dictionary.load("yy_YY", tmp_path, tmp_path / "cache")
+
+    def test_default_cache(self, tmp_path, monkeypatch):
+        from mseutils.spelling import Dictionary
+
+        (tmp_path / "xx_XX.aff").write_text(_TEST_AFF, encoding="utf-8")
+        (tmp_path / "xx_XX.dic").write_text(_TEST_DIC, encoding="utf-8")
+        monkeypatch.setenv("MSEUTILS_CACHE_DIR", str(tmp_path / "later"))
+        assert Dictionary.load("xx_XX", tmp_path).check("hawks")
+        assert len(list((tmp_path / "later" / "dictionaries").iterdir())) == 1
+
+    def test_check_set(self, tmp_path, monkeypatch):
+        from mseutils import Set, spelling
+        from mseutils.spelling import check_records, check_set
+
+        d = self._dictionary(tmp_path, extra=["the", "a"])
+        with open(_testdir / "setfile_valid", encoding="utf-8-sig") as ifile:
+            s = Set.from_setfile(ifile, cache=False)
+        for card in s.cards.values():
+            card.notes = ""
+        s.cards["Outdoor Cat"].notes = "the hawk nestz"
+        found = check_set(s, d, fields=["notes"], workers=1)
+        assert [(m.card, m.field, m.word, m.offset) for m in found] == [("Outdoor Cat", "notes", "nestz", 9)]
+        records = [{"name": f"Card {i}", "notes": "the hawk nestz" if i % 3 == 0 else "the hawk"} for i in range(9)]
+        one = check_records(records, d, fields=["notes"], workers=1)
+        assert [m.card for m in one] == ["Card 0", "Card 3", "Card 6"]
+        # Small chunks, so that two worker processes really share the work
+        monkeypatch.setattr(spelling, "_CHUNK_ITEMS", 2)
+        assert [(m.card, m.field, m.word, m.offset) for m in check_records(records, d, fields=["notes"], workers=2)] == [
+            (m.card, m.field, m.word, m.offset) for m in one
+        ]
+        records = [{"Name": "Hawk", "Latin name": "Buteo", "Fun fact": "a hawk eggz"}]
+        assert [str(m) for m in check_records(records, d, workers=1)] == ["Hawk: Fun fact: 'eggz' at 7"]
+
+
+def _make_font(path, family, style, mac_style=0):
+    """A TrueType file with just a name table (Windows names) and a head table."""
+    import struct
+
+    records, strings = [], b""
+    names = ((1, family), (2, style), (4, f"{family} {style}"), (6, family.replace(" ", "") + "-" + style))
+    for name_id, name in names:
+        raw = name.encode("utf-16-be")
+        records.append(struct.pack(">6H", 3, 1, 0x409, name_id, len(raw), len(strings)))
+        strings += raw
+    name_table = struct.pack(">HHH", 0, len(records), 6 + 12 * len(records)) + b"".join(records) + strings
+    head_table = bytes(44) + struct.pack(">H", mac_style) + bytes(8)
+    directory = struct.pack(">4sHHHH", b"\x00\x01\x00\x00", 2, 32, 1, 0)
+    offset = 12 + 16 * 2
+    directory += struct.pack(">4sIII", b"head", 0, offset, len(head_table))
+    directory += struct.pack(">4sIII", b"name", 0, offset + len(head_table), len(name_table))
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(directory + head_table + name_table)
+
+
+class TestFonts:
+    def test_index(self, tmp_path):
+        from mseutils import FontIndex
+
+        root = tmp_path / "Other - Fonts"
+        _make_font(root / "Game A" / "TSR_0.TTF", "Test Sans", "Regular")
+        _make_font(root / "Game A" / "tsb.ttf", "Test Sans", "Bold", mac_style=1)
+        _make_font(root / "Game B" / "odd name.ttf", "Other Serif", "Italic", mac_style=2)
+        (root / "Game B" / "empty.otf").write_bytes(b"")
+        cleartext = b"%!PS-AdobeFont-1.0\n/FamilyName (Sho) readonly def\n/Weight (Bold) readonly def\n"
+        (root / "Game B" / "SHO___.PFB").write_bytes(b"\x80\x01" + len(cleartext).to_bytes(4, "little") + cleartext)
+
+        index = FontIndex.open(root, tmp_path / "fonts.json")
+        assert len(index) == 4
+        assert index.find("test sans").path == "Game A/TSR_0.TTF"
+        assert index.find("Test Sans", bold=True).path == "Game A/tsb.ttf"
+        assert index.find("TestSans-Bold").path == "Game A/tsb.ttf"
+        assert index.find("Other Serif").italic and index.find("Sho").bold
+        assert index.find("Missing Font") is None
+
+        _make_font(root / "Game B" / "odd name.ttf", "Renamed Serif", "Regular")
+        (root / "Game A" / "tsb.ttf").unlink()
+        reopened = FontIndex.open(root, tmp_path / "fonts.json")
+        assert reopened.find("Other Serif") is None and reopened.find("Renamed Serif") is not None
+        assert [f.path for f in reopened.faces("Test Sans")] == ["Game A/TSR_0.TTF"]
+        assert not reopened.refresh()
+
+    def test_style_fonts(self, tmp_path):
+        from mseutils import FontIndex
+        from mseutils.fonts import game_styles, resolve
+
+        _make_font(tmp_path / "fonts" / "a.ttf", "Test Sans", "Regular")
+        (tmp_path / "game.mse-game").mkdir()
+        for name, game in (("one", "game"), ("two", "Game"), ("other", "another")):
+            (tmp_path / f"{name}.mse-style").mkdir()
+            (tmp_path / f"{name}.mse-style" / "style").write_text(
+                f"mse version: 2.0.0\ngame: {game}\ncard style:\n\tname:\n\t\tfont:\n\t\t\tname: Test Sans\n"
+                f"\t\t\tsize: 12\n\t\tsymbol font:\n\t\t\tname: test-symbols\n\tnotes:\n\t\tfont:\n"
+                f"\t\t\tname: {name} Serif\n\t\t\tweight: bold\n\t\t\titalic name: {{ italic_font() }}\n",
+                encoding="utf-8",
+            )
+        styles = game_styles(tmp_path / "game.mse-game")
+        assert [s.name for s in styles] == ["one.mse-style", "two.mse-style"]
+        index = FontIndex.open(tmp_path / "fonts", tmp_path / "fonts.json")
+        found = [(use.name, use.bold, use.styles, face and face.path) for use, face in resolve(index, styles)]
+        assert found == [
+            ("Test Sans", False, ["one.mse-style", "two.mse-style"], "a.ttf"),
+            ("one Serif", True, ["one.mse-style"], None),
+            ("two Serif", True, ["two.mse-style"], None),
+        ]
+
+    def test_copy_keeps_folders(self, tmp_path, capsys):
+        from mseutils import fonts
+
+        _make_font(tmp_path / "fonts" / "A" / "font.ttf", "Test Sans", "Regular")
+        _make_font(tmp_path / "fonts" / "B" / "font.ttf", "Test Serif", "Regular")
+        (tmp_path / "one.mse-style").mkdir()
+        (tmp_path / "one.mse-style" / "style").write_text(
+            "game: game\ncard style:\n\tname:\n\t\tfont:\n\t\t\tname: Test Sans\n"
+            "\tnotes:\n\t\tfont:\n\t\t\tname: Test Serif\n",
+            encoding="utf-8",
+        )
+        fonts_dir, out = tmp_path / "fonts", tmp_path / "out"
+        argv = [str(tmp_path / "one.mse-style"), "--fonts", str(fonts_dir), "--index", str(tmp_path / "i.json")]
+        assert fonts.main(argv + ["--copy", str(out)]) == 0
+        assert sorted(p.relative_to(out).as_posix() for p in out.rglob("*.ttf")) == ["A/font.ttf", "B/font.ttf"]
+        assert (out / "B" / "font.ttf").read_bytes() == (fonts_dir / "B" / "font.ttf").read_bytes()
+
+
+class TestPackages:
+    def _write(self, directory, files):
+        directory.mkdir(parents=True, exist_ok=True)
+        for name, text in files.items():
+            (directory / name).write_text(text, encoding="utf-8")
+
+    def test_includes_read_once(self, tmp_path):
+        import pytest
+        from mseutils import PackageFileCache, load_package, load_packages
+
+        self._write(
+            tmp_path / "common.mse-include",
+            {"include": "full name: Common\n", "script": "shared := 1\n# comment\nhelper := { 2 }\n"},
+        )
+        for game in ("one", "two"):
+            self._write(
+                tmp_path / f"{game}.mse-game",
+                {
+                    "game": f"full name: {game.title()}\ninit script:\n\tx := 1\n"
+                    "\tinclude file: /common.mse-include/script\n"
+                    "include file: fields\nset field:\n\ttype: text\n\tname: title\n",
+                    "fields": "card field:\n\ttype: choice\n\tname: kind\n\tchoice: a\n\tchoice:\n\t\tname: b\n"
+                    "\t\tchoice: x\n\t\tchoice: y\n\tidentifying: true\n"
+                    "card field:\n\ttype: color\n\tname: tint\n\tscript:\n\t\tif x then\n\t\t\trgb(1,2,3)\n",
+                },
+            )
+        cache = PackageFileCache()
+        packages = load_packages(tmp_path, cache)
+        assert list(packages) == ["common.mse-include", "one.mse-game", "two.mse-game"]
+        one = packages["one.mse-game"]
+        assert one.full_name == "One"
+        assert one.block["init script"] == "x := 1\nshared := 1\n# comment\nhelper := { 2 }"
+        assert [(f.type, f.name) for f in one.card_fields] == [("choice", "kind"), ("color", "tint")]
+        assert one.card_field("kind").choices == ["a", "b x", "b y"] and one.card_field("kind").identifying
+        assert one.card_field("tint").script == "if x then\n\trgb(1,2,3)"
+        assert one.set_field("title").type == "text"
+        assert cache.reads == 6  # each file once, though 'script' was included twice
+        load_package(tmp_path / "two.mse-game", cache)
+        assert cache.reads == 6
+
+        self._write(tmp_path / "loop.mse-game", {"game": "include file: game\n"})
+        with pytest.raises(ValueError):
+            load_package(tmp_path / "loop.mse-game", cache)
+        self._write(tmp_path / "bad.mse-game", {"game": "card field:\n\t\ttype: text\n\tname: x\n"})
+        with pytest.raises(ValueError):
+            load_package(tmp_path / "bad.mse-game", cache)
+        with pytest.raises(ValueError):
+            load_package(tmp_path)
+
+    def test_repository_data(self):
+        from mseutils import load_packages
+
+        packages = load_packages(_testdir.parent.parent / "data")
+        game = packages["thistledown.mse-game"]
+        assert game.card_field("cover").choices[:2] == ["Leaf litter", "Ground cover"]
+        # add_cards_scripts is included as entries, and cards_to_import into its script
+        assert "import_list := [" in game.block["add cards script"]["script"]
+        style = packages["thistledown-animal.mse-style"]
+        assert style.game == "Thistledown" and style.card_style["name"]["font"]["name"] == "Cardenio Modern"
+        assert packages["en.mse-locale"].block["menu"]["new set"] == "&New...\tCtrl+N"